@@ -8,6 +8,17 @@ done
 ADMIN_PASSWD=admin123!
 ADMIN_DN="cn=admin,dc=valkey,dc=io"
 
+# Let the users read the directory, so that their groups can be searched while
+# bound as them when no search bind DN is configured
+for container in ldap ldap-2; do
+    docker exec -i ${container} ldapmodify -Y EXTERNAL -H ldapi:/// <<EOF
+dn: olcDatabase={1}mdb,cn=config
+changetype: modify
+add: olcAccess
+olcAccess: {2}to * by dn.exact="${ADMIN_DN}" write by users read by * break
+EOF
+done
+
 ldapadd -x -w ${ADMIN_PASSWD} -D ${ADMIN_DN} < test/ldap_users.txt
 ldapadd -H ldap://localhost:390 -x -w ${ADMIN_PASSWD} -D ${ADMIN_DN} < test/ldap_users.txt
 
@@ -0,0 +1,103 @@
+use std::collections::HashMap;
+use std::sync::Mutex;
+
+use lazy_static::lazy_static;
+use sha2::{Digest, Sha256};
+
+const FINGERPRINT_SALT_LEN: usize = 16;
+
+type Fingerprint = [u8; 32];
+
+lazy_static! {
+    // The fingerprints of the ACL rules last applied to each LDAP user
+    static ref APPLIED_RULES: Mutex<HashMap<String, Fingerprint>> = Mutex::new(HashMap::new());
+    // Salts the fingerprints, which may include a password
+    static ref FINGERPRINT_SALT: [u8; FINGERPRINT_SALT_LEN] = rand::random();
+}
+
+/// The ACL rules applied to an LDAP user with `ACL SETUSER`, and the password
+/// saved with them when the ACL fallback is enabled.
+pub struct AclRules<'a> {
+    pub tokens: &'a [String],
+    pub password: Option<&'a str>,
+}
+
+impl AclRules<'_> {
+    fn fingerprint(&self) -> Fingerprint {
+        let mut hasher = Sha256::new();
+        hasher.update(&*FINGERPRINT_SALT);
+        for token in self.tokens {
+            hasher.update((token.len() as u64).to_le_bytes());
+            hasher.update(token.as_bytes());
+        }
+        if let Some(password) = self.password {
+            hasher.update([0xff]);
+            hasher.update(password.as_bytes());
+        }
+        hasher.finalize().into()
+    }
+}
+
+fn lock_applied_rules() -> std::sync::MutexGuard<'static, HashMap<String, Fingerprint>> {
+    APPLIED_RULES
+        .lock()
+        .unwrap_or_else(|poisoned| poisoned.into_inner())
+}
+
+/// Returns true if `rules` are the rules last applied to `username`.
+pub fn is_applied(username: &str, rules: &AclRules) -> bool {
+    let fingerprint = rules.fingerprint();
+    lock_applied_rules().get(username) == Some(&fingerprint)
+}
+
+/// Remembers that `rules` were applied to `username`.
+pub fn set_applied(username: &str, rules: &AclRules) {
+    let fingerprint = rules.fingerprint();
+    lock_applied_rules().insert(username.to_string(), fingerprint);
+}
+
+/// Forgets the rules applied to `username`, so that they are applied again on
+/// the next login. Must be called when the ACL user is deleted.
+pub fn forget(username: &str) {
+    lock_applied_rules().remove(username);
+}
+
+/// Forgets the rules applied to all users.
+pub fn forget_all() {
+    lock_applied_rules().clear();
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_applied_rules() {
+        let tokens = vec!["on".to_string(), "+@read".to_string()];
+        let rules = AclRules {
+            tokens: &tokens,
+            password: Some("secret"),
+        };
+
+        assert!(!is_applied("acl_test_user", &rules));
+        set_applied("acl_test_user", &rules);
+        assert!(is_applied("acl_test_user", &rules));
+
+        // A new password, or new tokens, must be applied
+        let new_password = AclRules {
+            tokens: &tokens,
+            password: Some("other"),
+        };
+        assert!(!is_applied("acl_test_user", &new_password));
+
+        let new_tokens = vec!["on".to_string(), "+@read+@write".to_string()];
+        let new_rules = AclRules {
+            tokens: &new_tokens,
+            password: Some("secret"),
+        };
+        assert!(!is_applied("acl_test_user", &new_rules));
+
+        forget("acl_test_user");
+        assert!(!is_applied("acl_test_user", &rules));
+    }
+}
@@ -4,9 +4,12 @@ use log::{debug, error};
 use valkey_module::BlockedClient;
 use valkey_module::{AUTH_HANDLED, AUTH_NOT_HANDLED, Context, Status, ValkeyError, ValkeyString};
 
+use crate::acl::{self, AclRules};
 use crate::configs;
 use crate::vkldap;
+use crate::vkldap::VkCachedRejection;
 use crate::vkldap::errors::VkLdapError;
+use crate::vkldap::metrics::{self, VkAuthOutcome, VkAuthPhase, VkPhaseTimer};
 
 /// Apply ACL rules to a successfully authenticated LDAP user
 fn apply_ldap_user_acl(
@@ -15,6 +18,8 @@ fn apply_ldap_user_acl(
     password: &ValkeyString,
     ldap_tokens: &[String],
 ) -> Result<c_int, ValkeyError> {
+    let _timer = VkPhaseTimer::start_in_auth(VkAuthPhase::AclApply);
+
     // Build ACL rules: reset commands/keys/channels + defaults + LDAP-provided tokens
     let mut rule_tokens: Vec<String> = Vec::new();
 
@@ -27,24 +32,45 @@ fn apply_ldap_user_acl(
     rule_tokens.extend(configs::get_default_acl_rules(ctx));
     rule_tokens.extend(ldap_tokens.iter().cloned());
 
-    // If ACL fallback is enabled, cache the password
-    if configs::is_acl_fallback_enabled(ctx) {
-        rule_tokens.push("resetpass".to_string());
-        rule_tokens.push(format!(">{}", password.to_string()));
+    // If ACL fallback is enabled, the password is saved with the rules
+    let password = configs::is_acl_fallback_enabled(ctx).then(|| password.to_string());
+    let rules = AclRules {
+        tokens: &rule_tokens,
+        password: password.as_deref(),
+    };
+
+    // Skip ACL SETUSER when the user already has these rules
+    let uname = username.to_string();
+    if acl::is_applied(&uname, &rules) {
+        match ctx.authenticate_client_with_acl_user(username) {
+            Status::Ok => {
+                debug!("successfully authenticated LDAP user {username} with unchanged ACL rules");
+                return Ok(AUTH_HANDLED);
+            }
+            Status::Err => {
+                // The ACL user was deleted, or disabled, outside of the module
+                debug!("ACL user {uname} changed, applying its ACL rules again");
+                acl::forget(&uname);
+            }
+        }
     }
 
     // Apply ACL SETUSER <username> <rules...>
-    let uname = username.to_string();
-    let mut args: Vec<String> = Vec::with_capacity(2 + rule_tokens.len());
+    let mut args: Vec<String> = Vec::with_capacity(4 + rule_tokens.len());
     args.push("SETUSER".to_string());
     args.push(uname.clone());
-    args.extend(rule_tokens);
+    args.extend(rule_tokens.iter().cloned());
+    if let Some(password) = rules.password {
+        args.push("resetpass".to_string());
+        args.push(format!(">{password}"));
+    }
 
     let arg_refs: Vec<&str> = args.iter().map(|s| s.as_str()).collect();
     if let Err(e) = ctx.call("ACL", &arg_refs[..]) {
         error!("failed to set ACL for user {uname}: {e}");
         return Err(ValkeyError::Str("Failed to apply ACL rules"));
     }
+    acl::set_applied(&uname, &rules);
 
     match ctx.authenticate_client_with_acl_user(username) {
         Status::Ok => {
@@ -62,6 +88,7 @@ fn handle_user_not_found(ctx: &Context, username: &str) -> Result<c_int, ValkeyE
     }
 
     debug!("user {username} not found in LDAP, deleting from ACL");
+    acl::forget(username);
     match ctx.call("ACL", &["DELUSER", username]) {
         Ok(_) => debug!("successfully deleted user {username} from ACL"),
         Err(e) => debug!("could not delete user {username} from ACL: {e}"),
@@ -74,8 +101,10 @@ fn handle_user_not_found(ctx: &Context, username: &str) -> Result<c_int, ValkeyE
 fn handle_server_unavailable(ctx: &Context, username: &str) -> Result<c_int, ValkeyError> {
     if configs::is_acl_fallback_enabled(ctx) {
         debug!("LDAP server unavailable, falling back to ACL authentication for user {username}");
+        metrics::record_outcome(VkAuthOutcome::Fallback);
         Ok(AUTH_NOT_HANDLED)
     } else {
+        metrics::record_outcome(VkAuthOutcome::Unavailable);
         debug!(
             "LDAP server unavailable and fallback disabled, rejecting authentication for user {username}"
         );
@@ -94,6 +123,7 @@ fn handle_credential_rejection(ctx: &Context, username: &str) -> Result<c_int, V
     // Strategy: Delete the user from ACL to ensure consistency and prevent stale users.
     // Users can always re-authenticate if they exist in LDAP with correct credentials.
     error!("LDAP rejected credentials for user {username}, attempting to delete from ACL");
+    acl::forget(username);
     match ctx.call("ACL", &["DELUSER", username]) {
         Ok(result) => {
             debug!("ACL DELUSER returned: {result:?}");
@@ -116,6 +146,7 @@ fn auth_reply_callback(
     let result = match priv_data {
         Some(Ok(ldap_tokens)) => {
             // LDAP authentication succeeded
+            metrics::record_outcome(VkAuthOutcome::Success);
             apply_ldap_user_acl(ctx, &username, &password, ldap_tokens)
         }
         Some(Err(err)) => {
@@ -125,10 +156,12 @@ fn auth_reply_callback(
             error!("LDAP authentication failure: {err}");
 
             if err.is_user_not_found() {
+                metrics::record_outcome(VkAuthOutcome::NotFound);
                 handle_user_not_found(ctx, &uname)
             } else if err.is_server_unavailable() {
                 handle_server_unavailable(ctx, &uname)
             } else {
+                metrics::record_outcome(VkAuthOutcome::Rejected);
                 handle_credential_rejection(ctx, &uname)
             }
         }
@@ -159,12 +192,34 @@ pub fn ldap_auth_blocking_callback(
         return Ok(AUTH_NOT_HANDLED);
     }
 
+    let pass_str = password.to_string();
+
+    if let Some(ldap_tokens) = vkldap::vk_ldap_cached_credentials(&user_str, &pass_str) {
+        debug!("user {user_str} authenticated using the credential cache");
+        metrics::record_outcome(VkAuthOutcome::Success);
+        return apply_ldap_user_acl(ctx, &username, &password, &ldap_tokens);
+    }
+
+    // The ACL user was already deleted when LDAP first rejected these
+    // credentials, so there is nothing left to clean up here.
+    match vkldap::vk_ldap_cached_rejection(&user_str, &pass_str) {
+        Some(VkCachedRejection::UserNotFound) => {
+            debug!("user {user_str} rejected using the negative cache: user not found");
+            metrics::record_outcome(VkAuthOutcome::NotFound);
+            return Err(ValkeyError::Str("User not found in LDAP"));
+        }
+        Some(VkCachedRejection::InvalidCredentials) => {
+            debug!("user {user_str} rejected using the negative cache: invalid credentials");
+            metrics::record_outcome(VkAuthOutcome::Rejected);
+            return Err(ValkeyError::Str("LDAP authentication failed"));
+        }
+        None => (),
+    }
+
     debug!("starting authentication for user={username}");
 
     let use_bind_mode = configs::is_bind_mode(ctx);
 
-    let pass_str = password.to_string();
-
     let blocked_client = ctx.block_client_on_auth(auth_reply_callback, Some(free_callback));
 
     let callback =
@@ -1,8 +1,165 @@
+use std::time::Duration;
+
 use log::error;
-use valkey_module::{InfoContext, ValkeyError, ValkeyResult};
+use valkey_module::{Context, InfoContext, ValkeyError, ValkeyResult, ValkeyString, ValkeyValue};
 use valkey_module_macros::info_command_handler;
 
-use crate::vkldap::{get_servers_health_status, server::VkLdapServerStatus};
+use crate::acl;
+use crate::vkldap::{
+    flush_caches, flush_group_rules_cache, get_cache_stats, get_coalescing_stats,
+    get_connection_pool_stats, get_group_batch_stats, get_group_index_stats, get_hedging_stats,
+    get_servers_health_status, get_sync_listener_stats, invalidate_cached_group_rules,
+    invalidate_cached_user, metrics,
+    server::VkLdapServerStatus,
+    slowlog::{self, VkSlowlogEntry},
+};
+
+/// LDAP.FLUSHCACHE [username]
+///
+/// Removes the cached entries of `username`, or of all users when no username
+/// is given. Returns the number of removed entries.
+pub fn ldap_flush_cache_command(_ctx: &Context, args: Vec<ValkeyString>) -> ValkeyResult {
+    if args.len() > 2 {
+        return Err(ValkeyError::WrongArity);
+    }
+
+    // The ACL rules of the flushed users are applied again on their next login
+    let removed = match args.get(1) {
+        Some(username) => {
+            let username = username.to_string_lossy();
+            acl::forget(&username);
+            invalidate_cached_user(&username)
+        }
+        None => {
+            acl::forget_all();
+            flush_caches()
+        }
+    };
+
+    Ok(ValkeyValue::Integer(removed as i64))
+}
+
+/// LDAP.FLUSHGROUPRULES [user_dn]
+///
+/// Removes the cached group ACL rules of `user_dn`, or of all users when no DN
+/// is given. Returns the number of removed entries.
+pub fn ldap_flush_group_rules_command(_ctx: &Context, args: Vec<ValkeyString>) -> ValkeyResult {
+    if args.len() > 2 {
+        return Err(ValkeyError::WrongArity);
+    }
+
+    let removed = match args.get(1) {
+        Some(user_dn) => invalidate_cached_group_rules(&user_dn.to_string_lossy()),
+        None => flush_group_rules_cache(),
+    };
+
+    Ok(ValkeyValue::Integer(removed as i64))
+}
+
+/// LDAP.RESETSTATS
+///
+/// Resets the authentication latency histograms and outcome counters.
+pub fn ldap_reset_stats_command(_ctx: &Context, args: Vec<ValkeyString>) -> ValkeyResult {
+    if args.len() > 1 {
+        return Err(ValkeyError::WrongArity);
+    }
+
+    metrics::reset();
+    Ok(ValkeyValue::SimpleStringStatic("OK"))
+}
+
+/// LDAP.SLOWLOG GET [count] | LEN | RESET
+///
+/// Returns the `count` most recent slowlog entries, newest first, 10 by
+/// default or all of them with `-1`. Also returns the number of entries, or
+/// removes them.
+pub fn ldap_slowlog_command(_ctx: &Context, args: Vec<ValkeyString>) -> ValkeyResult {
+    let Some(subcommand) = args.get(1) else {
+        return Err(ValkeyError::WrongArity);
+    };
+
+    match subcommand.to_string_lossy().to_uppercase().as_str() {
+        "GET" => {
+            if args.len() > 3 {
+                return Err(ValkeyError::WrongArity);
+            }
+            let count = match args.get(2) {
+                Some(count) => match count.parse_integer()? {
+                    -1 => usize::MAX,
+                    count if count < 0 => {
+                        return Err(ValkeyError::Str(
+                            "count should be greater than or equal to -1",
+                        ));
+                    }
+                    count => count as usize,
+                },
+                None => 10,
+            };
+            let entries = slowlog::entries(count);
+            Ok(ValkeyValue::Array(
+                entries.iter().map(slowlog_entry_reply).collect(),
+            ))
+        }
+        "LEN" if args.len() == 2 => Ok(ValkeyValue::Integer(slowlog::len() as i64)),
+        "RESET" if args.len() == 2 => {
+            slowlog::reset();
+            Ok(ValkeyValue::SimpleStringStatic("OK"))
+        }
+        "LEN" | "RESET" => Err(ValkeyError::WrongArity),
+        _ => Err(ValkeyError::Str(
+            "unknown subcommand, the subcommands are GET, LEN and RESET",
+        )),
+    }
+}
+
+fn optional_reply(value: Option<&str>) -> ValkeyValue {
+    match value {
+        Some(value) => ValkeyValue::BulkString(value.to_string()),
+        None => ValkeyValue::Null,
+    }
+}
+
+fn slowlog_entry_reply(entry: &VkSlowlogEntry) -> ValkeyValue {
+    let phases = entry
+        .phases
+        .iter()
+        .flat_map(|(phase, latency)| {
+            [
+                ValkeyValue::BulkString(phase.name().to_string()),
+                ValkeyValue::Integer(latency.as_micros() as i64),
+            ]
+        })
+        .collect();
+
+    ValkeyValue::Array(vec![
+        ValkeyValue::BulkString("id".to_string()),
+        ValkeyValue::Integer(entry.id as i64),
+        ValkeyValue::BulkString("timestamp".to_string()),
+        ValkeyValue::Integer(entry.timestamp as i64),
+        ValkeyValue::BulkString("duration_us".to_string()),
+        ValkeyValue::Integer(entry.duration.as_micros() as i64),
+        ValkeyValue::BulkString("username".to_string()),
+        ValkeyValue::BulkString(entry.username.clone()),
+        ValkeyValue::BulkString("server".to_string()),
+        optional_reply(entry.server.as_deref()),
+        ValkeyValue::BulkString("user_dn".to_string()),
+        optional_reply(entry.user_dn.as_deref()),
+        ValkeyValue::BulkString("phases_us".to_string()),
+        ValkeyValue::Array(phases),
+        ValkeyValue::BulkString("result_code".to_string()),
+        ValkeyValue::Integer(entry.result_code),
+        ValkeyValue::BulkString("error".to_string()),
+        optional_reply(entry.error.as_deref()),
+        ValkeyValue::BulkString("attempts".to_string()),
+        ValkeyValue::Integer(entry.attempts as i64),
+        ValkeyValue::BulkString("sampled".to_string()),
+        ValkeyValue::Integer(entry.sampled as i64),
+    ])
+}
+
+fn duration_ms(duration: Duration) -> String {
+    (duration.as_micros() as f64 / 1000.0).to_string()
+}
 
 #[info_command_handler]
 fn add_ldap_status_section(ctx: &InfoContext, _for_crash_report: bool) -> ValkeyResult<()> {
@@ -18,6 +175,8 @@ fn add_ldap_status_section(ctx: &InfoContext, _for_crash_report: bool) -> Valkey
         }
     };
 
+    let pools_stats = get_connection_pool_stats();
+
     for (idx, server) in servers_health.iter().enumerate() {
         let mut dict = builder
             .add_dictionary(format!("server_{}", idx).as_str())
@@ -43,10 +202,153 @@ fn add_ldap_status_section(ctx: &InfoContext, _for_crash_report: bool) -> Valkey
             }
         };
 
+        dict = dict
+            .field("circuit_breaker", server.get_circuit_state().to_string())?
+            .field(
+                "circuit_breaker_trips",
+                server.get_circuit_trips().to_string(),
+            )?;
+
+        let load = server.get_load_stats();
+        dict = dict
+            .field("requests", load.requests.to_string())?
+            .field("outstanding", load.outstanding.to_string())?;
+        if let Some(latency) = load.ewma_latency {
+            dict = dict.field(
+                "latency_ewma_ms",
+                (latency.as_micros() as f64 / 1000.0).to_string(),
+            )?;
+        }
+        if let Some(latency) = load.search_latency_p95 {
+            dict = dict.field(
+                "search_latency_p95_ms",
+                (latency.as_micros() as f64 / 1000.0).to_string(),
+            )?;
+        }
+
+        if let Some((bind_pool, search_pool)) = pools_stats.get(idx) {
+            dict = dict
+                .field("bind_pool_size", bind_pool.size.to_string())?
+                .field("bind_pool_in_use", bind_pool.in_use.to_string())?
+                .field("bind_pool_waiters", bind_pool.waiters.to_string())?
+                .field("bind_pool_rejected", bind_pool.rejected.to_string())?
+                .field("search_pool_size", search_pool.size.to_string())?
+                .field("search_pool_in_use", search_pool.in_use.to_string())?
+                .field("search_pool_waiters", search_pool.waiters.to_string())?
+                .field("search_pool_rejected", search_pool.rejected.to_string())?;
+        }
+
         builder = dict.build_dictionary()?;
     }
 
-    builder.build_section()?.build_info()?;
+    let coalescing = get_coalescing_stats();
+    let builder = builder
+        .add_dictionary("auth_coalescing")
+        .field("in_flight", coalescing.in_flight.to_string())?
+        .field("coalesced", coalescing.coalesced.to_string())?
+        .build_dictionary()?;
+
+    let hedging = get_hedging_stats();
+    let hedge_rate = match hedging.searches {
+        0 => 0.0,
+        searches => hedging.hedged as f64 / searches as f64,
+    };
+    let builder = builder
+        .add_dictionary("search_hedging")
+        .field("searches", hedging.searches.to_string())?
+        .field("hedged", hedging.hedged.to_string())?
+        .field("hedge_wins", hedging.hedge_wins.to_string())?
+        .field("hedge_rate", hedge_rate.to_string())?
+        .build_dictionary()?;
+
+    let group_batch = get_group_batch_stats();
+    let builder = builder
+        .add_dictionary("group_search_batching")
+        .field("batches", group_batch.batches.to_string())?
+        .field("lookups", group_batch.lookups.to_string())?
+        .field("fallbacks", group_batch.fallbacks.to_string())?
+        .build_dictionary()?;
+
+    let group_index = get_group_index_stats();
+    let mut dict = builder
+        .add_dictionary("group_index")
+        .field("members", group_index.members.to_string())?
+        .field("groups", group_index.groups.to_string())?
+        .field("refreshes", group_index.refreshes.to_string())?
+        .field("refresh_failures", group_index.refresh_failures.to_string())?;
+    if let Some(age) = group_index.age {
+        dict = dict.field("age_s", age.as_secs().to_string())?;
+    }
+    if let Some(duration) = group_index.last_refresh_duration {
+        dict = dict.field("last_refresh_ms", duration.as_millis().to_string())?;
+    }
+    let builder = dict.build_dictionary()?;
+
+    let sync_listener = get_sync_listener_stats();
+    let builder = builder
+        .add_dictionary("sync_listener")
+        .field("enabled", (sync_listener.enabled as u8).to_string())?
+        .field("connected", (sync_listener.connected as u8).to_string())?
+        .field("entries", sync_listener.entries.to_string())?
+        .field("changes", sync_listener.changes.to_string())?
+        .field("full_syncs", sync_listener.full_syncs.to_string())?
+        .field("reconnects", sync_listener.reconnects.to_string())?
+        .field(
+            "persistent_search",
+            (sync_listener.persistent_search as u8).to_string(),
+        )?
+        .build_dictionary()?;
+
+    let mut builder = builder.build_section()?.add_section("cache");
+
+    for (name, stats) in get_cache_stats() {
+        builder = builder
+            .add_dictionary(name)
+            .field("entries", stats.entries.to_string())?
+            .field("hits", stats.hits.to_string())?
+            .field("misses", stats.misses.to_string())?
+            .field("evictions", stats.evictions.to_string())?
+            .build_dictionary()?;
+    }
+
+    let mut builder = builder.build_section()?.add_section("latency");
+
+    for (name, stats) in metrics::phase_stats() {
+        let mut dict = builder
+            .add_dictionary(name)
+            .field("count", stats.count.to_string())?;
+        for (quantile, value) in [
+            ("p50_ms", stats.p50),
+            ("p90_ms", stats.p90),
+            ("p99_ms", stats.p99),
+            ("p999_ms", stats.p999),
+        ] {
+            if let Some(value) = value {
+                dict = dict.field(quantile, duration_ms(value))?;
+            }
+        }
+        builder = dict
+            .field("max_ms", duration_ms(stats.max))?
+            .build_dictionary()?;
+    }
+
+    let auth = metrics::auth_stats();
+    builder
+        .build_section()?
+        .add_section("auth")
+        .add_dictionary("outcomes")
+        .field("success", auth.success.to_string())?
+        .field("rejected", auth.rejected.to_string())?
+        .field("not_found", auth.not_found.to_string())?
+        .field("unavailable", auth.unavailable.to_string())?
+        .field("fallback", auth.fallback.to_string())?
+        .build_dictionary()?
+        .add_dictionary("in_flight")
+        .field("queued", auth.queued.to_string())?
+        .field("running", auth.running.to_string())?
+        .build_dictionary()?
+        .build_section()?
+        .build_info()?;
 
     Ok(())
 }
@@ -10,8 +10,9 @@ use valkey_module::{
 };
 
 use crate::vkldap::failure_detector;
-use crate::vkldap::settings::VkLdapSettings;
+use crate::vkldap::settings::{VkCacheSettings, VkCircuitBreakerSettings, VkLdapSettings};
 use crate::vkldap::{self, settings::VkConnectionSettings};
+use crate::vkldap::{group_index, sync_listener};
 use log::{debug, error};
 use url::Url;
 
@@ -74,6 +75,25 @@ enum_configuration2! {
     }
 }
 
+enum_configuration2! {
+    #[derive(PartialEq)]
+    pub enum LdapGroupNesting {
+        Direct = ("direct", 1),
+        Graph = ("graph", 2),
+        InChain = ("in_chain", 3),
+    }
+}
+
+enum_configuration2! {
+    #[derive(PartialEq)]
+    pub enum LdapLoadBalancingPolicy {
+        Failover = ("failover", 1),
+        RoundRobin = ("round_robin", 2),
+        LeastOutstanding = ("least_outstanding", 3),
+        PowerOfTwoChoices = ("power_of_two_choices", 4),
+    }
+}
+
 lazy_static! {
     pub static ref LDAP_SERVER_LIST: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
@@ -88,6 +108,8 @@ lazy_static! {
     pub static ref LDAP_TLS_KEY_PATH: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
     pub static ref LDAP_USE_STARTTLS: ValkeyGILGuard<bool> = ValkeyGILGuard::default();
+    pub static ref LDAP_SEARCH_CONNECTION_MULTIPLEXING: ValkeyGILGuard<bool> =
+        ValkeyGILGuard::default();
     pub static ref LDAP_AUTH_MODE: ValkeyGILGuard<LdapAuthMode> =
         ValkeyGILGuard::new(LdapAuthMode::Bind);
     pub static ref LDAP_SEARCH_BASE: ValkeyGILGuard<ValkeyString> =
@@ -105,9 +127,38 @@ lazy_static! {
     pub static ref LDAP_SEARCH_DN_ATTRIBUTE: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
     pub static ref LDAP_CONNECTION_POOL_SIZE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(2);
+    pub static ref LDAP_SEARCH_CONNECTION_POOL_SIZE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(2);
+    pub static ref LDAP_CONNECTION_POOL_MAX_SIZE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_SEARCH_CONNECTION_POOL_MAX_SIZE: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(0);
+    pub static ref LDAP_CONNECTION_POOL_GROWTH_THRESHOLD_MS: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(10);
+    pub static ref LDAP_CONNECTION_POOL_IDLE_TIMEOUT: ValkeyGILGuard<i64> = ValkeyGILGuard::new(60);
+    pub static ref LDAP_CONNECTION_POOL_MAX_WAIT_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_CONNECTION_POOL_MAX_WAITERS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_LOAD_BALANCING_POLICY: ValkeyGILGuard<LdapLoadBalancingPolicy> =
+        ValkeyGILGuard::new(LdapLoadBalancingPolicy::RoundRobin);
+    pub static ref LDAP_HEDGED_SEARCHES: ValkeyGILGuard<bool> = ValkeyGILGuard::default();
+    pub static ref LDAP_CIRCUIT_BREAKER_WINDOW: ValkeyGILGuard<i64> = ValkeyGILGuard::new(10);
+    pub static ref LDAP_CIRCUIT_BREAKER_MIN_REQUESTS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(20);
+    pub static ref LDAP_CIRCUIT_BREAKER_FAILURE_RATE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(50);
+    pub static ref LDAP_CIRCUIT_BREAKER_SLOW_CALL_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_CIRCUIT_BREAKER_OPEN_DURATION_MS: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(5000);
+    pub static ref LDAP_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(3);
+    pub static ref LDAP_HEDGE_MIN_DELAY_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(10);
+    pub static ref LDAP_WORKER_THREADS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
     pub static ref LDAP_FAILURE_DETECTOR_INTERVAL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(1);
+    pub static ref LDAP_FAILURE_DETECTOR_INTERVAL_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_FAILURE_DETECTOR_PROBE_TIMEOUT_MS: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(1000);
+    pub static ref LDAP_FAILURE_DETECTOR_MAX_BACKOFF: ValkeyGILGuard<i64> = ValkeyGILGuard::new(30);
     pub static ref LDAP_TIMEOUT_CONNECTION: ValkeyGILGuard<i64> = ValkeyGILGuard::new(2);
     pub static ref LDAP_TIMEOUT_LDAP_OPERATION: ValkeyGILGuard<i64> = ValkeyGILGuard::new(2);
+}
+
+lazy_static! {
     // Group/authorization configs
     pub static ref LDAP_GROUPS_SEARCH_BASE: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
@@ -119,6 +170,14 @@ lazy_static! {
         ValkeyGILGuard::new(ValkeyString::create(None, "cn"));
     pub static ref LDAP_GROUPS_RULES_ATTRIBUTE: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, "valkeyACL"));
+    pub static ref LDAP_GROUPS_SEARCH_PAGE_SIZE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(500);
+    pub static ref LDAP_GROUPS_SEARCH_SIZE_LIMIT: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_GROUPS_NESTING: ValkeyGILGuard<LdapGroupNesting> =
+        ValkeyGILGuard::new(LdapGroupNesting::Direct);
+    pub static ref LDAP_GROUPS_MEMBER_OF_ATTRIBUTE: ValkeyGILGuard<ValkeyString> =
+        ValkeyGILGuard::new(ValkeyString::create(None, ""));
+    pub static ref LDAP_GROUPS_SEARCH_BATCH_WINDOW_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_GROUPS_SEARCH_BATCH_SIZE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(32);
     pub static ref LDAP_GROUP_TO_ACL_USER_MAP: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
     // Dynamic ACL sync: map LDAP groups to ACL rule fragments, and default rules
@@ -129,6 +188,32 @@ lazy_static! {
     pub static ref LDAP_EXEMPTED_USERS_REGEX: ValkeyGILGuard<ValkeyString> =
         ValkeyGILGuard::new(ValkeyString::create(None, ""));
     pub static ref LDAP_ACL_FALLBACK_ENABLED: ValkeyGILGuard<bool> = ValkeyGILGuard::default();
+    // Caching configs
+    pub static ref LDAP_CREDENTIAL_CACHE_TTL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_CREDENTIAL_CACHE_MAX_ENTRIES: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(1024);
+    pub static ref LDAP_NEGATIVE_CACHE_TTL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_NEGATIVE_CACHE_MAX_ENTRIES: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(1024);
+    pub static ref LDAP_NEGATIVE_CACHE_FILTER_CAPACITY: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(0);
+    pub static ref LDAP_DN_CACHE_TTL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_DN_CACHE_MAX_ENTRIES: ValkeyGILGuard<i64> = ValkeyGILGuard::new(1024);
+    pub static ref LDAP_GROUP_RULES_CACHE_TTL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
+    pub static ref LDAP_GROUP_RULES_CACHE_MAX_STALE: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(300);
+    pub static ref LDAP_GROUP_RULES_CACHE_MAX_ENTRIES: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(1024);
+    pub static ref LDAP_GROUP_GRAPH_CACHE_TTL: ValkeyGILGuard<i64> = ValkeyGILGuard::new(300);
+    pub static ref LDAP_GROUP_GRAPH_CACHE_MAX_ENTRIES: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(4096);
+    pub static ref LDAP_GROUP_INDEX_REFRESH_INTERVAL: ValkeyGILGuard<i64> =
+        ValkeyGILGuard::new(0);
+    pub static ref LDAP_SYNC_LISTENER_ENABLED: ValkeyGILGuard<bool> = ValkeyGILGuard::default();
+    // Slowlog configs
+    pub static ref LDAP_SLOWLOG_THRESHOLD_MS: ValkeyGILGuard<i64> = ValkeyGILGuard::new(100);
+    pub static ref LDAP_SLOWLOG_MAX_LEN: ValkeyGILGuard<i64> = ValkeyGILGuard::new(128);
+    pub static ref LDAP_SLOWLOG_SAMPLE_RATE: ValkeyGILGuard<i64> = ValkeyGILGuard::new(0);
 }
 
 lazy_static! {
@@ -152,6 +237,10 @@ pub fn refresh_ldap_settings_cache<T: ValkeyLockIndicator>(ctx: &T) {
         get_groups_member_attribute(ctx),
         get_groups_name_attribute(ctx),
         get_groups_rules_attribute(ctx),
+        get_groups_search_page_size(ctx),
+        get_groups_search_size_limit(ctx),
+        get_groups_nesting(ctx),
+        get_groups_member_of_attribute(ctx),
     );
     vkldap::refresh_ldap_settings(settings);
 }
@@ -173,6 +262,10 @@ pub fn refresh_ldap_settings_cache_blocking<T: ValkeyLockIndicator>(ctx: &T) {
         get_groups_member_attribute(ctx),
         get_groups_name_attribute(ctx),
         get_groups_rules_attribute(ctx),
+        get_groups_search_page_size(ctx),
+        get_groups_search_size_limit(ctx),
+        get_groups_nesting(ctx),
+        get_groups_member_of_attribute(ctx),
     );
     vkldap::refresh_ldap_settings_blocking(settings);
 }
@@ -184,6 +277,14 @@ pub fn refresh_connection_settings_cache<T: ValkeyLockIndicator>(ctx: &T) {
         get_tls_cert_path(ctx),
         get_tls_key_path(ctx),
         get_connection_pool_size(ctx),
+        get_connection_pool_max_size(ctx),
+        get_search_connection_pool_size(ctx),
+        get_search_connection_pool_max_size(ctx),
+        is_search_connection_multiplexing_enabled(ctx),
+        get_connection_pool_growth_threshold(ctx),
+        get_connection_pool_idle_timeout(ctx),
+        get_connection_pool_max_wait(ctx),
+        get_connection_pool_max_waiters(ctx),
         get_timeout_connection(ctx),
     );
     vkldap::refresh_connection_settings(settings);
@@ -196,11 +297,49 @@ pub fn refresh_connection_settings_cache_blocking<T: ValkeyLockIndicator>(ctx: &
         get_tls_cert_path(ctx),
         get_tls_key_path(ctx),
         get_connection_pool_size(ctx),
+        get_connection_pool_max_size(ctx),
+        get_search_connection_pool_size(ctx),
+        get_search_connection_pool_max_size(ctx),
+        is_search_connection_multiplexing_enabled(ctx),
+        get_connection_pool_growth_threshold(ctx),
+        get_connection_pool_idle_timeout(ctx),
+        get_connection_pool_max_wait(ctx),
+        get_connection_pool_max_waiters(ctx),
         get_timeout_connection(ctx),
     );
     vkldap::refresh_connection_settings_blocking(settings);
 }
 
+pub fn refresh_cache_settings<T: ValkeyLockIndicator>(ctx: &T) {
+    let settings = VkCacheSettings::new(
+        get_credential_cache_ttl(ctx),
+        get_credential_cache_max_entries(ctx),
+        get_negative_cache_ttl(ctx),
+        get_negative_cache_max_entries(ctx),
+        get_negative_cache_filter_capacity(ctx),
+        get_dn_cache_ttl(ctx),
+        get_dn_cache_max_entries(ctx),
+        get_group_rules_cache_ttl(ctx),
+        get_group_rules_cache_max_stale(ctx),
+        get_group_rules_cache_max_entries(ctx),
+        get_group_graph_cache_ttl(ctx),
+        get_group_graph_cache_max_entries(ctx),
+    );
+    vkldap::refresh_cache_settings(settings);
+}
+
+pub fn refresh_circuit_breaker_settings<T: ValkeyLockIndicator>(ctx: &T) {
+    let settings = VkCircuitBreakerSettings::new(
+        get_circuit_breaker_window(ctx),
+        get_circuit_breaker_min_requests(ctx),
+        get_circuit_breaker_failure_rate(ctx),
+        get_circuit_breaker_slow_call(ctx),
+        get_circuit_breaker_open_duration(ctx),
+        get_circuit_breaker_half_open_requests(ctx),
+    );
+    vkldap::refresh_circuit_breaker_settings(settings);
+}
+
 pub fn process_server_list(server_list: String) -> Result<(), ValkeyError> {
     if server_list.is_empty() {
         return match vkldap::clear_server_list() {
@@ -262,12 +401,99 @@ pub fn on_connection_setting_change<G, T: ConfigurationValue<G>>(
     refresh_connection_settings_cache(ctx);
 }
 
-pub fn failure_detector_interval_changed<G, T: ConfigurationValue<G>>(
+pub fn on_cache_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    refresh_cache_settings(ctx);
+}
+
+pub fn on_failure_detector_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    refresh_failure_detector_settings(ctx);
+}
+
+pub fn refresh_failure_detector_settings<T: ValkeyLockIndicator>(ctx: &T) {
+    failure_detector::refresh_failure_detector_settings(
+        get_failure_detector_interval(ctx),
+        get_failure_detector_probe_timeout(ctx),
+        get_failure_detector_max_backoff(ctx),
+    );
+}
+
+pub fn on_group_index_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    refresh_group_index_settings(ctx);
+}
+
+pub fn refresh_group_index_settings<T: ValkeyLockIndicator>(ctx: &T) {
+    group_index::refresh_group_index_settings(get_group_index_refresh_interval(ctx));
+}
+
+pub fn on_sync_listener_setting_change<G, T: ConfigurationValue<G>>(
     ctx: &ConfigurationContext,
     _name: &str,
     _val: &'static T,
 ) {
-    failure_detector::set_failure_detector_interval(get_failure_detector_interval_secs(ctx));
+    refresh_sync_listener_settings(ctx);
+}
+
+pub fn refresh_sync_listener_settings<T: ValkeyLockIndicator>(ctx: &T) {
+    sync_listener::refresh_sync_listener_settings(get_sync_listener_enabled(ctx));
+}
+
+pub fn load_balancing_policy_changed<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    vkldap::set_load_balancing_policy(get_load_balancing_policy(ctx));
+}
+
+pub fn on_circuit_breaker_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    refresh_circuit_breaker_settings(ctx);
+}
+
+pub fn on_hedging_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    vkldap::refresh_hedging_settings(get_hedged_searches(ctx), get_hedge_min_delay(ctx));
+}
+
+pub fn on_group_batch_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    vkldap::refresh_group_batch_settings(
+        get_groups_search_batch_window(ctx),
+        get_groups_search_batch_size(ctx),
+    );
+}
+
+pub fn on_slowlog_setting_change<G, T: ConfigurationValue<G>>(
+    ctx: &ConfigurationContext,
+    _name: &str,
+    _val: &'static T,
+) {
+    vkldap::refresh_slowlog_settings(
+        get_slowlog_threshold(ctx),
+        get_slowlog_max_len(ctx),
+        get_slowlog_sample_rate(ctx),
+    );
 }
 
 pub fn ldap_server_list_set_callback(
@@ -321,6 +547,11 @@ pub fn is_starttls_enabled<T: ValkeyLockIndicator>(ctx: &T) -> bool {
     *use_starttls
 }
 
+pub fn is_search_connection_multiplexing_enabled<T: ValkeyLockIndicator>(ctx: &T) -> bool {
+    let multiplexing = LDAP_SEARCH_CONNECTION_MULTIPLEXING.lock(ctx);
+    *multiplexing
+}
+
 pub fn is_auth_enabled<T: ValkeyLockIndicator>(ctx: &T) -> bool {
     let servers = LDAP_SERVER_LIST.lock(ctx);
     !servers.is_empty()
@@ -420,6 +651,40 @@ pub fn get_groups_rules_attribute<T: ValkeyLockIndicator>(ctx: &T) -> String {
     attr.to_string()
 }
 
+pub fn get_groups_search_page_size<T: ValkeyLockIndicator>(ctx: &T) -> i32 {
+    let page_size = LDAP_GROUPS_SEARCH_PAGE_SIZE.lock(ctx);
+    *page_size as i32
+}
+
+pub fn get_groups_search_size_limit<T: ValkeyLockIndicator>(ctx: &T) -> i32 {
+    let size_limit = LDAP_GROUPS_SEARCH_SIZE_LIMIT.lock(ctx);
+    *size_limit as i32
+}
+
+pub fn get_groups_nesting<T: ValkeyLockIndicator>(ctx: &T) -> LdapGroupNesting {
+    let nesting = LDAP_GROUPS_NESTING.lock(ctx);
+    nesting.clone()
+}
+
+pub fn get_groups_search_batch_window<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let window = LDAP_GROUPS_SEARCH_BATCH_WINDOW_MS.lock(ctx);
+    Duration::from_millis(*window as u64)
+}
+
+pub fn get_groups_search_batch_size<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let batch_size = LDAP_GROUPS_SEARCH_BATCH_SIZE.lock(ctx);
+    *batch_size as usize
+}
+
+pub fn get_groups_member_of_attribute<T: ValkeyLockIndicator>(ctx: &T) -> Option<String> {
+    let attr = LDAP_GROUPS_MEMBER_OF_ATTRIBUTE.lock(ctx);
+    let attr_str = attr.to_string();
+    match attr_str.as_str() {
+        "" => None,
+        _ => Some(attr_str),
+    }
+}
+
 pub fn get_default_acl_rules<T: ValkeyLockIndicator>(ctx: &T) -> Vec<String> {
     let rules_guard = LDAP_DEFAULT_ACL_RULES.lock(ctx);
     let rules = rules_guard.to_string();
@@ -435,9 +700,114 @@ pub fn get_connection_pool_size<T: ValkeyLockIndicator>(ctx: &T) -> usize {
     *pool_size as usize
 }
 
-pub fn get_failure_detector_interval_secs<T: ValkeyLockIndicator>(ctx: &T) -> u64 {
+pub fn get_search_connection_pool_size<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let pool_size = LDAP_SEARCH_CONNECTION_POOL_SIZE.lock(ctx);
+    *pool_size as usize
+}
+
+pub fn get_connection_pool_max_size<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_size = LDAP_CONNECTION_POOL_MAX_SIZE.lock(ctx);
+    *max_size as usize
+}
+
+pub fn get_search_connection_pool_max_size<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_size = LDAP_SEARCH_CONNECTION_POOL_MAX_SIZE.lock(ctx);
+    *max_size as usize
+}
+
+pub fn get_connection_pool_growth_threshold<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let threshold = LDAP_CONNECTION_POOL_GROWTH_THRESHOLD_MS.lock(ctx);
+    Duration::from_millis(*threshold as u64)
+}
+
+pub fn get_connection_pool_idle_timeout<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let timeout = LDAP_CONNECTION_POOL_IDLE_TIMEOUT.lock(ctx);
+    Duration::from_secs(*timeout as u64)
+}
+
+pub fn get_connection_pool_max_wait<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let max_wait = LDAP_CONNECTION_POOL_MAX_WAIT_MS.lock(ctx);
+    Duration::from_millis(*max_wait as u64)
+}
+
+pub fn get_connection_pool_max_waiters<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_waiters = LDAP_CONNECTION_POOL_MAX_WAITERS.lock(ctx);
+    *max_waiters as usize
+}
+
+pub fn get_circuit_breaker_window<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let window = LDAP_CIRCUIT_BREAKER_WINDOW.lock(ctx);
+    Duration::from_secs(*window as u64)
+}
+
+pub fn get_circuit_breaker_min_requests<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let min_requests = LDAP_CIRCUIT_BREAKER_MIN_REQUESTS.lock(ctx);
+    *min_requests as usize
+}
+
+/// Returns the failure rate, between 0 and 1, that opens the circuit.
+pub fn get_circuit_breaker_failure_rate<T: ValkeyLockIndicator>(ctx: &T) -> f64 {
+    let failure_rate = LDAP_CIRCUIT_BREAKER_FAILURE_RATE.lock(ctx);
+    *failure_rate as f64 / 100.0
+}
+
+pub fn get_circuit_breaker_slow_call<T: ValkeyLockIndicator>(ctx: &T) -> Option<Duration> {
+    let slow_call = LDAP_CIRCUIT_BREAKER_SLOW_CALL_MS.lock(ctx);
+    match *slow_call {
+        0 => None,
+        slow_call => Some(Duration::from_millis(slow_call as u64)),
+    }
+}
+
+pub fn get_circuit_breaker_open_duration<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let open_duration = LDAP_CIRCUIT_BREAKER_OPEN_DURATION_MS.lock(ctx);
+    Duration::from_millis(*open_duration as u64)
+}
+
+pub fn get_circuit_breaker_half_open_requests<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let half_open_requests = LDAP_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS.lock(ctx);
+    *half_open_requests as usize
+}
+
+pub fn get_hedged_searches<T: ValkeyLockIndicator>(ctx: &T) -> bool {
+    let hedged_searches = LDAP_HEDGED_SEARCHES.lock(ctx);
+    *hedged_searches
+}
+
+pub fn get_hedge_min_delay<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let min_delay = LDAP_HEDGE_MIN_DELAY_MS.lock(ctx);
+    Duration::from_millis(*min_delay as u64)
+}
+
+pub fn get_load_balancing_policy<T: ValkeyLockIndicator>(ctx: &T) -> LdapLoadBalancingPolicy {
+    let policy = LDAP_LOAD_BALANCING_POLICY.lock(ctx);
+    policy.clone()
+}
+
+pub fn get_worker_threads<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let worker_threads = LDAP_WORKER_THREADS.lock(ctx);
+    *worker_threads as usize
+}
+
+/// The `ldap.failure_detector_interval_ms` config takes precedence over
+/// `ldap.failure_detector_interval` when set.
+pub fn get_failure_detector_interval<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let interval_ms = LDAP_FAILURE_DETECTOR_INTERVAL_MS.lock(ctx);
+    if *interval_ms > 0 {
+        return Duration::from_millis(*interval_ms as u64);
+    }
     let interval = LDAP_FAILURE_DETECTOR_INTERVAL.lock(ctx);
-    *interval as u64
+    Duration::from_secs(*interval as u64)
+}
+
+pub fn get_failure_detector_probe_timeout<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let timeout = LDAP_FAILURE_DETECTOR_PROBE_TIMEOUT_MS.lock(ctx);
+    Duration::from_millis(*timeout as u64)
+}
+
+pub fn get_failure_detector_max_backoff<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let max_backoff = LDAP_FAILURE_DETECTOR_MAX_BACKOFF.lock(ctx);
+    Duration::from_secs(*max_backoff as u64)
 }
 
 pub fn get_timeout_connection<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
@@ -450,6 +820,95 @@ pub fn get_timeout_ldap_operation<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
     Duration::from_secs(*timeout as u64)
 }
 
+pub fn get_credential_cache_ttl<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let ttl = LDAP_CREDENTIAL_CACHE_TTL.lock(ctx);
+    Duration::from_secs(*ttl as u64)
+}
+
+pub fn get_credential_cache_max_entries<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_entries = LDAP_CREDENTIAL_CACHE_MAX_ENTRIES.lock(ctx);
+    *max_entries as usize
+}
+
+pub fn get_negative_cache_ttl<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let ttl = LDAP_NEGATIVE_CACHE_TTL.lock(ctx);
+    Duration::from_secs(*ttl as u64)
+}
+
+pub fn get_negative_cache_max_entries<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_entries = LDAP_NEGATIVE_CACHE_MAX_ENTRIES.lock(ctx);
+    *max_entries as usize
+}
+
+pub fn get_negative_cache_filter_capacity<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let capacity = LDAP_NEGATIVE_CACHE_FILTER_CAPACITY.lock(ctx);
+    *capacity as usize
+}
+
+pub fn get_dn_cache_ttl<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let ttl = LDAP_DN_CACHE_TTL.lock(ctx);
+    Duration::from_secs(*ttl as u64)
+}
+
+pub fn get_dn_cache_max_entries<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_entries = LDAP_DN_CACHE_MAX_ENTRIES.lock(ctx);
+    *max_entries as usize
+}
+
+pub fn get_group_rules_cache_ttl<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let ttl = LDAP_GROUP_RULES_CACHE_TTL.lock(ctx);
+    Duration::from_secs(*ttl as u64)
+}
+
+pub fn get_group_rules_cache_max_stale<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let max_stale = LDAP_GROUP_RULES_CACHE_MAX_STALE.lock(ctx);
+    Duration::from_secs(*max_stale as u64)
+}
+
+pub fn get_group_rules_cache_max_entries<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_entries = LDAP_GROUP_RULES_CACHE_MAX_ENTRIES.lock(ctx);
+    *max_entries as usize
+}
+
+pub fn get_group_graph_cache_ttl<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let ttl = LDAP_GROUP_GRAPH_CACHE_TTL.lock(ctx);
+    Duration::from_secs(*ttl as u64)
+}
+
+pub fn get_group_graph_cache_max_entries<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_entries = LDAP_GROUP_GRAPH_CACHE_MAX_ENTRIES.lock(ctx);
+    *max_entries as usize
+}
+
+pub fn get_group_index_refresh_interval<T: ValkeyLockIndicator>(ctx: &T) -> Duration {
+    let interval = LDAP_GROUP_INDEX_REFRESH_INTERVAL.lock(ctx);
+    Duration::from_secs(*interval as u64)
+}
+
+pub fn get_sync_listener_enabled<T: ValkeyLockIndicator>(ctx: &T) -> bool {
+    let enabled = LDAP_SYNC_LISTENER_ENABLED.lock(ctx);
+    *enabled
+}
+
+/// Returns `None` when slow authentications must not be logged.
+pub fn get_slowlog_threshold<T: ValkeyLockIndicator>(ctx: &T) -> Option<Duration> {
+    let threshold = LDAP_SLOWLOG_THRESHOLD_MS.lock(ctx);
+    match *threshold {
+        ms if ms < 0 => None,
+        ms => Some(Duration::from_millis(ms as u64)),
+    }
+}
+
+pub fn get_slowlog_max_len<T: ValkeyLockIndicator>(ctx: &T) -> usize {
+    let max_len = LDAP_SLOWLOG_MAX_LEN.lock(ctx);
+    *max_len as usize
+}
+
+pub fn get_slowlog_sample_rate<T: ValkeyLockIndicator>(ctx: &T) -> u64 {
+    let sample_rate = LDAP_SLOWLOG_SAMPLE_RATE.lock(ctx);
+    *sample_rate as u64
+}
+
 #[allow(dead_code)]
 pub fn get_exempted_users_regex_pattern<T: ValkeyLockIndicator>(ctx: &T) -> String {
     let pattern = LDAP_EXEMPTED_USERS_REGEX.lock(ctx);
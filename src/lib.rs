@@ -1,3 +1,4 @@
+mod acl;
 mod auth;
 mod commands;
 mod configs;
@@ -15,6 +16,7 @@ use logging::standard_log_implementation;
 use version::module_version;
 use vkldap::failure_detector;
 use vkldap::scheduler;
+use vkldap::{group_index, sync_listener};
 
 fn initializer(ctx: &Context, _args: &[ValkeyString]) -> Status {
     ctx.log_debug("initializing LDAP module");
@@ -24,8 +26,13 @@ fn initializer(ctx: &Context, _args: &[ValkeyString]) -> Status {
         ctx.log_warning(format!("failed to setup log: {err}").as_str());
     }
 
-    scheduler::start_job_scheduler();
-    failure_detector::start_failure_detector_thread();
+    scheduler::start_job_scheduler(configs::get_worker_threads(ctx));
+    configs::refresh_failure_detector_settings(ctx);
+    failure_detector::start_failure_detector();
+    configs::refresh_group_index_settings(ctx);
+    group_index::start_group_index_refresher();
+    configs::refresh_sync_listener_settings(ctx);
+    sync_listener::start_sync_listener();
 
     // Wait for scheduler to be ready (with timeout)
     let mut attempts = 0;
@@ -51,6 +58,8 @@ fn initializer(ctx: &Context, _args: &[ValkeyString]) -> Status {
     // Use blocking versions during initialization to avoid async scheduler delays
     configs::refresh_ldap_settings_cache_blocking(ctx);
     configs::refresh_connection_settings_cache_blocking(ctx);
+    configs::refresh_cache_settings(ctx);
+    configs::refresh_circuit_breaker_settings(ctx);
 
     let server_list = configs::LDAP_SERVER_LIST.lock(ctx).to_string_lossy();
     if let Err(err) = configs::process_server_list(server_list) {
@@ -63,11 +72,14 @@ fn initializer(ctx: &Context, _args: &[ValkeyString]) -> Status {
 fn deinitializer(ctx: &Context) -> Status {
     ctx.log_debug("shutting down LDAP module");
 
-    if let Err(err) = failure_detector::shutdown_failure_detector_thread() {
+    if let Err(err) = failure_detector::shutdown_failure_detector() {
         error!("{err}");
         return Status::Err;
     }
 
+    group_index::shutdown_group_index_refresher();
+    sync_listener::shutdown_sync_listener();
+
     if let Err(err) = vkldap::clear_server_list() {
         error!("{err}");
         return Status::Err;
@@ -94,7 +106,12 @@ valkey_module! {
     auth: [
         ldap_auth_blocking_callback
     ],
-    commands: [],
+    commands: [
+        ["ldap.flushcache", commands::ldap_flush_cache_command, "admin", 0, 0, 0],
+        ["ldap.flushgrouprules", commands::ldap_flush_group_rules_command, "admin", 0, 0, 0],
+        ["ldap.resetstats", commands::ldap_reset_stats_command, "admin", 0, 0, 0],
+        ["ldap.slowlog", commands::ldap_slowlog_command, "admin", 0, 0, 0],
+    ],
     configurations: [
         i64: [
             [
@@ -106,6 +123,168 @@ valkey_module! {
                 ConfigurationFlags::DEFAULT,
                 Some(Box::new(configs::on_connection_setting_change))
             ],
+            [
+                "search_connection_pool_size",
+                &*configs::LDAP_SEARCH_CONNECTION_POOL_SIZE,
+                2,
+                1,
+                8192,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "connection_pool_max_size",
+                &*configs::LDAP_CONNECTION_POOL_MAX_SIZE,
+                0,
+                0,
+                8192,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "search_connection_pool_max_size",
+                &*configs::LDAP_SEARCH_CONNECTION_POOL_MAX_SIZE,
+                0,
+                0,
+                8192,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "connection_pool_growth_threshold_ms",
+                &*configs::LDAP_CONNECTION_POOL_GROWTH_THRESHOLD_MS,
+                10,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "connection_pool_idle_timeout",
+                &*configs::LDAP_CONNECTION_POOL_IDLE_TIMEOUT,
+                60,
+                1,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "connection_pool_max_wait_ms",
+                &*configs::LDAP_CONNECTION_POOL_MAX_WAIT_MS,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "connection_pool_max_waiters",
+                &*configs::LDAP_CONNECTION_POOL_MAX_WAITERS,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "worker_threads",
+                &*configs::LDAP_WORKER_THREADS,
+                0,
+                0,
+                1024,
+                ConfigurationFlags::IMMUTABLE,
+                None
+            ],
+            [
+                "circuit_breaker_window",
+                &*configs::LDAP_CIRCUIT_BREAKER_WINDOW,
+                10,
+                1,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "circuit_breaker_min_requests",
+                &*configs::LDAP_CIRCUIT_BREAKER_MIN_REQUESTS,
+                20,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "circuit_breaker_failure_rate",
+                &*configs::LDAP_CIRCUIT_BREAKER_FAILURE_RATE,
+                50,
+                1,
+                100,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "circuit_breaker_slow_call_ms",
+                &*configs::LDAP_CIRCUIT_BREAKER_SLOW_CALL_MS,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "circuit_breaker_open_duration_ms",
+                &*configs::LDAP_CIRCUIT_BREAKER_OPEN_DURATION_MS,
+                5000,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "circuit_breaker_half_open_requests",
+                &*configs::LDAP_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS,
+                3,
+                1,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_circuit_breaker_setting_change))
+            ],
+            [
+                "hedge_min_delay_ms",
+                &*configs::LDAP_HEDGE_MIN_DELAY_MS,
+                10,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_hedging_setting_change))
+            ],
+            [
+                "slowlog_threshold_ms",
+                &*configs::LDAP_SLOWLOG_THRESHOLD_MS,
+                100,
+                -1,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_slowlog_setting_change))
+            ],
+            [
+                "slowlog_max_len",
+                &*configs::LDAP_SLOWLOG_MAX_LEN,
+                128,
+                0,
+                10000,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_slowlog_setting_change))
+            ],
+            [
+                "slowlog_sample_rate",
+                &*configs::LDAP_SLOWLOG_SAMPLE_RATE,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_slowlog_setting_change))
+            ],
             [
                 "failure_detector_interval",
                 &*configs::LDAP_FAILURE_DETECTOR_INTERVAL,
@@ -113,7 +292,34 @@ valkey_module! {
                 0,
                 std::i64::MAX,
                 ConfigurationFlags::DEFAULT,
-                Some(Box::new(configs::failure_detector_interval_changed))
+                Some(Box::new(configs::on_failure_detector_setting_change))
+            ],
+            [
+                "failure_detector_interval_ms",
+                &*configs::LDAP_FAILURE_DETECTOR_INTERVAL_MS,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_failure_detector_setting_change))
+            ],
+            [
+                "failure_detector_probe_timeout_ms",
+                &*configs::LDAP_FAILURE_DETECTOR_PROBE_TIMEOUT_MS,
+                1000,
+                1,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_failure_detector_setting_change))
+            ],
+            [
+                "failure_detector_max_backoff",
+                &*configs::LDAP_FAILURE_DETECTOR_MAX_BACKOFF,
+                30,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_failure_detector_setting_change))
             ],
             [
                 "timeout_connection",
@@ -132,6 +338,159 @@ valkey_module! {
                 std::i64::MAX,
                 ConfigurationFlags::DEFAULT,
                 Some(Box::new(configs::on_ldap_setting_change))
+            ],
+            [
+                "credential_cache_ttl",
+                &*configs::LDAP_CREDENTIAL_CACHE_TTL,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "credential_cache_max_entries",
+                &*configs::LDAP_CREDENTIAL_CACHE_MAX_ENTRIES,
+                1024,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "negative_cache_ttl",
+                &*configs::LDAP_NEGATIVE_CACHE_TTL,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "negative_cache_max_entries",
+                &*configs::LDAP_NEGATIVE_CACHE_MAX_ENTRIES,
+                1024,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "negative_cache_filter_capacity",
+                &*configs::LDAP_NEGATIVE_CACHE_FILTER_CAPACITY,
+                0,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "dn_cache_ttl",
+                &*configs::LDAP_DN_CACHE_TTL,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "dn_cache_max_entries",
+                &*configs::LDAP_DN_CACHE_MAX_ENTRIES,
+                1024,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "group_rules_cache_ttl",
+                &*configs::LDAP_GROUP_RULES_CACHE_TTL,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "group_rules_cache_max_stale",
+                &*configs::LDAP_GROUP_RULES_CACHE_MAX_STALE,
+                300,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "group_rules_cache_max_entries",
+                &*configs::LDAP_GROUP_RULES_CACHE_MAX_ENTRIES,
+                1024,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "group_graph_cache_ttl",
+                &*configs::LDAP_GROUP_GRAPH_CACHE_TTL,
+                300,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "group_graph_cache_max_entries",
+                &*configs::LDAP_GROUP_GRAPH_CACHE_MAX_ENTRIES,
+                4096,
+                0,
+                16777216,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_cache_setting_change))
+            ],
+            [
+                "groups_search_page_size",
+                &*configs::LDAP_GROUPS_SEARCH_PAGE_SIZE,
+                500,
+                0,
+                i32::MAX as i64,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_ldap_setting_change))
+            ],
+            [
+                "groups_search_size_limit",
+                &*configs::LDAP_GROUPS_SEARCH_SIZE_LIMIT,
+                0,
+                0,
+                i32::MAX as i64,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_ldap_setting_change))
+            ],
+            [
+                "groups_search_batch_window_ms",
+                &*configs::LDAP_GROUPS_SEARCH_BATCH_WINDOW_MS,
+                0,
+                0,
+                1000,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_group_batch_setting_change))
+            ],
+            [
+                "groups_search_batch_size",
+                &*configs::LDAP_GROUPS_SEARCH_BATCH_SIZE,
+                32,
+                1,
+                1024,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_group_batch_setting_change))
+            ],
+            [
+                "group_index_refresh_interval",
+                &*configs::LDAP_GROUP_INDEX_REFRESH_INTERVAL,
+                0,
+                0,
+                std::i64::MAX,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_group_index_setting_change))
             ]
         ],
         string: [
@@ -255,6 +614,13 @@ valkey_module! {
                 ConfigurationFlags::DEFAULT,
                 Some(Box::new(configs::on_ldap_setting_change))
             ],
+            [
+                "groups_member_of_attribute",
+                &*configs::LDAP_GROUPS_MEMBER_OF_ATTRIBUTE,
+                "",
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_ldap_setting_change))
+            ],
             [
                 "group_acl_user_map",
                 &*configs::LDAP_GROUP_TO_ACL_USER_MAP,
@@ -293,6 +659,27 @@ valkey_module! {
                 ConfigurationFlags::DEFAULT,
                 Some(Box::new(configs::on_connection_setting_change))
             ],
+            [
+                "search_connection_multiplexing",
+                &*configs::LDAP_SEARCH_CONNECTION_MULTIPLEXING,
+                false,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_connection_setting_change))
+            ],
+            [
+                "hedged_searches",
+                &*configs::LDAP_HEDGED_SEARCHES,
+                false,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_hedging_setting_change))
+            ],
+            [
+                "sync_listener_enabled",
+                &*configs::LDAP_SYNC_LISTENER_ENABLED,
+                false,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_sync_listener_setting_change))
+            ],
             [
                 "acl_fallback_enabled",
                 &*configs::LDAP_ACL_FALLBACK_ENABLED,
@@ -316,6 +703,20 @@ valkey_module! {
                 ConfigurationFlags::DEFAULT,
                 Some(Box::new(configs::on_ldap_setting_change))
             ],
+            [
+                "groups_nesting",
+                &*configs::LDAP_GROUPS_NESTING,
+                configs::LdapGroupNesting::Direct,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::on_ldap_setting_change))
+            ],
+            [
+                "load_balancing_policy",
+                &*configs::LDAP_LOAD_BALANCING_POLICY,
+                configs::LdapLoadBalancingPolicy::RoundRobin,
+                ConfigurationFlags::DEFAULT,
+                Some(Box::new(configs::load_balancing_policy_changed))
+            ],
         ],
         module_args_as_configuration: false,
     ]
@@ -0,0 +1,279 @@
+use std::sync::atomic::{AtomicI32, AtomicU64, AtomicUsize, Ordering};
+use std::time::{Duration, Instant};
+
+use lazy_static::lazy_static;
+
+use crate::configs::LdapLoadBalancingPolicy;
+
+use super::server::VkLdapServer;
+
+/// Weight of a new latency sample in the moving average.
+const EWMA_ALPHA: f64 = 0.3;
+/// Relative step of the search latency percentile estimate on each sample.
+const QUANTILE_STEP: f64 = 0.05;
+/// The search latency percentile tracked for each server.
+const QUANTILE: f64 = 0.95;
+
+static POLICY: AtomicI32 = AtomicI32::new(LdapLoadBalancingPolicy::RoundRobin as i32);
+static NEXT_SERVER: AtomicUsize = AtomicUsize::new(0);
+
+lazy_static! {
+    // Reference for the timestamps of the last server responses
+    static ref START: Instant = Instant::now();
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkServerLoadStats {
+    pub requests: u64,
+    pub outstanding: usize,
+    pub ewma_latency: Option<Duration>,
+    pub search_latency_p95: Option<Duration>,
+}
+
+/// Tracks the operations sent to a server. It is shared by all the copies
+/// of the server.
+#[derive(Default)]
+pub(super) struct VkServerLoad {
+    requests: AtomicU64,
+    outstanding: AtomicUsize,
+    // f64 bits of the latency average in microseconds, 0 if no sample yet
+    ewma_latency_us: AtomicU64,
+    // Milliseconds since START of the last server response, 0 if none yet
+    last_response_ms: AtomicU64,
+    // f64 bits of the p95 estimate of the search latency in microseconds
+    search_p95_us: AtomicU64,
+    search_samples: AtomicU64,
+}
+
+impl VkServerLoad {
+    pub(super) fn observe_latency(&self, latency: Duration) {
+        let sample = latency.as_micros() as f64;
+        // Concurrent updates may overwrite each other, and losing a sample
+        // does not matter for an average.
+        let current = f64::from_bits(self.ewma_latency_us.load(Ordering::Relaxed));
+        let ewma = if current == 0.0 {
+            sample.max(1.0)
+        } else {
+            current + EWMA_ALPHA * (sample - current)
+        };
+        self.ewma_latency_us
+            .store(ewma.to_bits(), Ordering::Relaxed);
+    }
+
+    /// Records that the server answered an operation.
+    pub(super) fn record_response(&self) {
+        let now = START.elapsed().as_millis() as u64;
+        self.last_response_ms.store(now.max(1), Ordering::Relaxed);
+    }
+
+    /// Returns true if the server answered an operation in the last `period`.
+    pub(super) fn responded_within(&self, period: Duration) -> bool {
+        let last = self.last_response_ms.load(Ordering::Relaxed);
+        last > 0 && START.elapsed().as_millis() as u64 <= last + period.as_millis() as u64
+    }
+
+    /// Updates the estimate of the 95th percentile of the search latency.
+    ///
+    /// The estimate moves up by a large step when a sample is above it, and
+    /// down by a small one otherwise, so that it settles where 5% of the
+    /// samples are above it. Steps are relative to the estimate.
+    pub(super) fn observe_search_latency(&self, latency: Duration) {
+        let sample = latency.as_micros() as f64;
+        let current = f64::from_bits(self.search_p95_us.load(Ordering::Relaxed));
+        let p95 = if current == 0.0 {
+            sample.max(1.0)
+        } else if sample > current {
+            current * (1.0 + QUANTILE_STEP * QUANTILE)
+        } else {
+            (current * (1.0 - QUANTILE_STEP * (1.0 - QUANTILE))).max(1.0)
+        };
+        self.search_p95_us.store(p95.to_bits(), Ordering::Relaxed);
+        self.search_samples.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Returns the search latency p95 estimate and the number of samples it
+    /// is based on.
+    pub(super) fn search_latency_p95(&self) -> (Duration, u64) {
+        let p95 = f64::from_bits(self.search_p95_us.load(Ordering::Relaxed));
+        (
+            Duration::from_micros(p95 as u64),
+            self.search_samples.load(Ordering::Relaxed),
+        )
+    }
+
+    fn ewma_latency_us(&self) -> f64 {
+        f64::from_bits(self.ewma_latency_us.load(Ordering::Relaxed))
+    }
+
+    fn outstanding(&self) -> usize {
+        self.outstanding.load(Ordering::Relaxed)
+    }
+
+    /// Expected time to serve one more operation. Servers without latency
+    /// samples are preferred, so that they get some.
+    fn cost(&self) -> f64 {
+        self.ewma_latency_us() * (self.outstanding() + 1) as f64
+    }
+
+    pub(super) fn stats(&self) -> VkServerLoadStats {
+        let ewma = self.ewma_latency_us();
+        VkServerLoadStats {
+            requests: self.requests.load(Ordering::Relaxed),
+            outstanding: self.outstanding(),
+            ewma_latency: (ewma > 0.0).then(|| Duration::from_micros(ewma as u64)),
+            search_latency_p95: match self.search_latency_p95() {
+                (_, 0) => None,
+                (p95, _) => Some(p95),
+            },
+        }
+    }
+}
+
+/// Counts an operation as outstanding in a server until it is dropped.
+pub(super) struct VkServerLoadGuard<'a> {
+    load: &'a VkServerLoad,
+    start: Instant,
+}
+
+impl<'a> VkServerLoadGuard<'a> {
+    pub(super) fn new(load: &'a VkServerLoad) -> VkServerLoadGuard<'a> {
+        load.requests.fetch_add(1, Ordering::Relaxed);
+        load.outstanding.fetch_add(1, Ordering::Relaxed);
+        VkServerLoadGuard {
+            load,
+            start: Instant::now(),
+        }
+    }
+}
+
+impl Drop for VkServerLoadGuard<'_> {
+    fn drop(&mut self) {
+        self.load.outstanding.fetch_sub(1, Ordering::Relaxed);
+        self.load.observe_latency(self.start.elapsed());
+    }
+}
+
+pub(super) fn set_policy(policy: LdapLoadBalancingPolicy) {
+    POLICY.store(policy.into(), Ordering::Relaxed);
+}
+
+fn get_policy() -> LdapLoadBalancingPolicy {
+    LdapLoadBalancingPolicy::try_from(POLICY.load(Ordering::Relaxed))
+        .unwrap_or(LdapLoadBalancingPolicy::RoundRobin)
+}
+
+/// Picks one of the `healthy` servers according to the configured policy.
+/// `healthy` must not be empty.
+pub(super) fn select_server<'a>(healthy: &[&'a VkLdapServer]) -> &'a VkLdapServer {
+    select_server_with_policy(get_policy(), healthy)
+}
+
+fn select_server_with_policy<'a>(
+    policy: LdapLoadBalancingPolicy,
+    healthy: &[&'a VkLdapServer],
+) -> &'a VkLdapServer {
+    if healthy.len() == 1 {
+        return healthy[0];
+    }
+
+    match policy {
+        LdapLoadBalancingPolicy::Failover => healthy[0],
+        LdapLoadBalancingPolicy::RoundRobin => {
+            let next = NEXT_SERVER.fetch_add(1, Ordering::Relaxed);
+            healthy[next % healthy.len()]
+        }
+        LdapLoadBalancingPolicy::LeastOutstanding => {
+            let mut best = healthy[0];
+            for &server in &healthy[1..] {
+                if server.get_load().outstanding() < best.get_load().outstanding() {
+                    best = server;
+                }
+            }
+            best
+        }
+        LdapLoadBalancingPolicy::PowerOfTwoChoices => {
+            let first = rand::random_range(0..healthy.len());
+            let mut second = rand::random_range(0..healthy.len() - 1);
+            if second >= first {
+                second += 1;
+            }
+
+            let (first, second) = (healthy[first], healthy[second]);
+            if second.get_load().cost() < first.get_load().cost() {
+                second
+            } else {
+                first
+            }
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use super::super::server::VkLdapServerStatus;
+    use url::Url;
+
+    fn new_servers(count: usize) -> Vec<VkLdapServer> {
+        (0..count)
+            .map(|id| {
+                let url = Url::parse(&format!("ldap://ldap-{id}")).unwrap();
+                VkLdapServer::new(url, id, VkLdapServerStatus::HEALTHY)
+            })
+            .collect()
+    }
+
+    #[test]
+    fn test_policies_spread_the_load() {
+        let servers = new_servers(3);
+        let healthy: Vec<&VkLdapServer> = servers.iter().collect();
+
+        let mut selected = [0; 3];
+        for _ in 0..30 {
+            let server = select_server_with_policy(LdapLoadBalancingPolicy::RoundRobin, &healthy);
+            selected[server.get_id()] += 1;
+        }
+        assert_eq!(selected, [10, 10, 10]);
+
+        // Keep one operation outstanding in the first two servers
+        let _guard0 = VkServerLoadGuard::new(servers[0].get_load());
+        let _guard1 = VkServerLoadGuard::new(servers[1].get_load());
+        let server = select_server_with_policy(LdapLoadBalancingPolicy::LeastOutstanding, &healthy);
+        assert_eq!(server.get_id(), 2);
+
+        servers[0]
+            .get_load()
+            .observe_latency(Duration::from_millis(1));
+        servers[1]
+            .get_load()
+            .observe_latency(Duration::from_millis(100));
+        servers[2]
+            .get_load()
+            .observe_latency(Duration::from_millis(100));
+        let mut selected = [0; 3];
+        for _ in 0..100 {
+            let server =
+                select_server_with_policy(LdapLoadBalancingPolicy::PowerOfTwoChoices, &healthy);
+            selected[server.get_id()] += 1;
+        }
+        // The fastest server wins whenever it is one of the two choices
+        assert!(selected[0] > selected[1] && selected[0] > selected[2]);
+    }
+
+    #[test]
+    fn test_search_latency_p95() {
+        let load = VkServerLoad::default();
+        assert_eq!(load.search_latency_p95().1, 0);
+
+        // Latencies spread evenly from 1ms to 100ms
+        for i in 0..5000 {
+            let latency = (i * 37) % 100 + 1;
+            load.observe_search_latency(Duration::from_millis(latency));
+        }
+
+        let (p95, samples) = load.search_latency_p95();
+        assert_eq!(samples, 5000);
+        assert!(p95 >= Duration::from_millis(85) && p95 <= Duration::from_millis(100));
+    }
+}
@@ -0,0 +1,185 @@
+use std::collections::hash_map::RandomState;
+use std::hash::BuildHasher;
+use std::time::{Duration, Instant};
+
+/// A Bloom filter of strings.
+///
+/// The hash functions are seeded randomly for each filter, so that the bit
+/// positions of a given string cannot be predicted from outside the module.
+struct VkBloomFilter {
+    bits: Vec<u64>,
+    num_bits: u64,
+    num_hashes: u32,
+    hasher: RandomState,
+    len: usize,
+}
+
+impl VkBloomFilter {
+    fn new(capacity: usize, fp_rate: f64) -> VkBloomFilter {
+        let capacity = capacity.max(1) as f64;
+        let ln2 = std::f64::consts::LN_2;
+        let num_bits = (-capacity * fp_rate.ln() / (ln2 * ln2)).ceil().max(64.0) as u64;
+        let num_hashes = ((num_bits as f64 / capacity) * ln2).round().max(1.0) as u32;
+
+        VkBloomFilter {
+            bits: vec![0; num_bits.div_ceil(64) as usize],
+            num_bits,
+            num_hashes,
+            hasher: RandomState::new(),
+            len: 0,
+        }
+    }
+
+    // Uses double hashing to derive the `num_hashes` bit positions from a
+    // single 64-bit hash value.
+    fn bit_positions(&self, item: &str) -> impl Iterator<Item = u64> {
+        let hash = self.hasher.hash_one(item);
+        let h1 = hash & 0xffff_ffff;
+        let h2 = (hash >> 32) | 1;
+        let num_bits = self.num_bits;
+        (0..self.num_hashes as u64).map(move |i| h1.wrapping_add(i.wrapping_mul(h2)) % num_bits)
+    }
+
+    fn insert(&mut self, item: &str) {
+        let positions: Vec<u64> = self.bit_positions(item).collect();
+        for pos in positions {
+            self.bits[(pos / 64) as usize] |= 1 << (pos % 64);
+        }
+        self.len += 1;
+    }
+
+    fn contains(&self, item: &str) -> bool {
+        self.bit_positions(item)
+            .all(|pos| self.bits[(pos / 64) as usize] & (1 << (pos % 64)) != 0)
+    }
+}
+
+/// A Bloom filter whose items expire.
+///
+/// Two generations of filters are kept. Items are inserted in the current
+/// generation, and every `period` the previous generation is discarded and the
+/// current one takes its place. Therefore, an item is remembered at most two
+/// periods after being inserted.
+///
+/// The generations are also rotated as soon as the current one holds
+/// `capacity` items, so that the false positive rate stays close to the
+/// configured one however many items are inserted. Items are then forgotten
+/// early.
+pub(super) struct VkExpiringBloomFilter {
+    current: VkBloomFilter,
+    previous: VkBloomFilter,
+    capacity: usize,
+    fp_rate: f64,
+    period: Duration,
+    rotated_at: Instant,
+    expired: usize,
+}
+
+impl VkExpiringBloomFilter {
+    pub fn new(capacity: usize, fp_rate: f64, period: Duration) -> VkExpiringBloomFilter {
+        VkExpiringBloomFilter {
+            current: VkBloomFilter::new(capacity, fp_rate),
+            previous: VkBloomFilter::new(capacity, fp_rate),
+            capacity,
+            fp_rate,
+            period,
+            rotated_at: Instant::now(),
+            expired: 0,
+        }
+    }
+
+    fn rotate_if_needed(&mut self) {
+        let elapsed = self.rotated_at.elapsed();
+        if elapsed < self.period && self.current.len < self.capacity {
+            return ();
+        }
+
+        let fresh = VkBloomFilter::new(self.capacity, self.fp_rate);
+
+        if elapsed >= self.period * 2 {
+            // Both generations are too old
+            self.expired += self.current.len + self.previous.len;
+            self.previous = VkBloomFilter::new(self.capacity, self.fp_rate);
+            self.current = fresh;
+        } else {
+            self.expired += self.previous.len;
+            self.previous = std::mem::replace(&mut self.current, fresh);
+        }
+
+        self.rotated_at = Instant::now();
+    }
+
+    pub fn insert(&mut self, item: &str) {
+        self.rotate_if_needed();
+        self.current.insert(item);
+    }
+
+    pub fn contains(&mut self, item: &str) -> bool {
+        self.rotate_if_needed();
+        self.current.contains(item) || self.previous.contains(item)
+    }
+
+    pub fn reset(&mut self) {
+        self.current = VkBloomFilter::new(self.capacity, self.fp_rate);
+        self.previous = VkBloomFilter::new(self.capacity, self.fp_rate);
+        self.rotated_at = Instant::now();
+    }
+
+    pub fn is_configured_as(&self, capacity: usize, period: Duration) -> bool {
+        self.capacity == capacity && self.period == period
+    }
+
+    /// Number of items inserted in the live generations
+    pub fn len(&self) -> usize {
+        self.current.len + self.previous.len
+    }
+
+    /// Number of items dropped by generation rotations
+    pub fn expired(&self) -> usize {
+        self.expired
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_bloom_filter_membership() {
+        let mut filter = VkExpiringBloomFilter::new(1000, 0.001, Duration::from_secs(60));
+        for i in 0..1000 {
+            filter.insert(format!("user{i}").as_str());
+        }
+
+        for i in 0..1000 {
+            assert!(filter.contains(format!("user{i}").as_str()));
+        }
+
+        let false_positives = (0..10000)
+            .filter(|i| filter.contains(format!("other{i}").as_str()))
+            .count();
+        assert!(false_positives < 100);
+    }
+
+    #[test]
+    fn test_bloom_filter_expiration() {
+        let mut filter = VkExpiringBloomFilter::new(10, 0.001, Duration::from_millis(10));
+        filter.insert("user");
+        std::thread::sleep(Duration::from_millis(25));
+        assert!(!filter.contains("user"));
+        assert_eq!(filter.expired(), 1);
+    }
+
+    #[test]
+    fn test_bloom_filter_rotates_when_full() {
+        let mut filter = VkExpiringBloomFilter::new(10, 0.001, Duration::from_secs(60));
+        for i in 0..25 {
+            filter.insert(format!("user{i}").as_str());
+        }
+
+        // Only the last two generations are kept
+        assert!(filter.len() <= 20);
+        assert_eq!(filter.expired(), 25 - filter.len());
+        assert!(filter.contains("user24"));
+    }
+}
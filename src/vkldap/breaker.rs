@@ -0,0 +1,364 @@
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+use arc_swap::ArcSwap;
+use lazy_static::lazy_static;
+use log::error;
+
+use super::settings::VkCircuitBreakerSettings;
+
+/// Number of buckets of the sliding window of operation outcomes.
+const WINDOW_BUCKETS: usize = 10;
+
+lazy_static! {
+    static ref SETTINGS: ArcSwap<VkCircuitBreakerSettings> =
+        ArcSwap::from_pointee(VkCircuitBreakerSettings::default());
+}
+
+pub(super) fn refresh_settings(settings: VkCircuitBreakerSettings) {
+    SETTINGS.store(Arc::new(settings));
+}
+
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum VkCircuitState {
+    /// Operations are sent to the server.
+    Closed,
+    /// The server failed too many operations, and gets none.
+    Open,
+    /// The server gets a few trial operations to test its recovery.
+    HalfOpen,
+}
+
+impl std::fmt::Display for VkCircuitState {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        match self {
+            Self::Closed => write!(f, "closed"),
+            Self::Open => write!(f, "open"),
+            Self::HalfOpen => write!(f, "half_open"),
+        }
+    }
+}
+
+/// The outcomes of the operations that started in a slice of the window.
+#[derive(Clone, Copy, Default)]
+struct WindowBucket {
+    slot: u64,
+    requests: u64,
+    failures: u64,
+}
+
+enum CircuitState {
+    Closed,
+    Open {
+        since: Instant,
+    },
+    HalfOpen {
+        trial_running: bool,
+        successes: usize,
+    },
+}
+
+struct Circuit {
+    state: CircuitState,
+    buckets: [WindowBucket; WINDOW_BUCKETS],
+}
+
+/// Stops sending operations to a server that fails, or is too slow to
+/// answer, a large share of the operations.
+///
+/// The outcomes of the operations are counted over a sliding window. When the
+/// share of failed operations in the window reaches the configured rate, the
+/// circuit opens and the server gets no operations. Once the open duration
+/// elapses, the circuit is half-open: trial operations are sent to the server
+/// one at a time, and the circuit closes after enough of them succeed, or
+/// opens again on the first failure.
+///
+/// It is shared by all the copies of the server.
+pub(super) struct VkCircuitBreaker {
+    circuit: Mutex<Circuit>,
+    // Set while the circuit is not closed, to check closed circuits without
+    // locking
+    tripped: AtomicBool,
+    created: Instant,
+    trips: AtomicU64,
+}
+
+impl Default for VkCircuitBreaker {
+    fn default() -> Self {
+        VkCircuitBreaker {
+            circuit: Mutex::new(Circuit {
+                state: CircuitState::Closed,
+                buckets: [WindowBucket::default(); WINDOW_BUCKETS],
+            }),
+            tripped: AtomicBool::new(false),
+            created: Instant::now(),
+            trips: AtomicU64::new(0),
+        }
+    }
+}
+
+macro_rules! lock_circuit {
+    ($breaker:expr) => {
+        match $breaker.circuit.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("circuit breaker mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+impl VkCircuitBreaker {
+    pub(super) fn state(&self) -> VkCircuitState {
+        self.state_at(&SETTINGS.load(), Instant::now())
+    }
+
+    fn state_at(&self, settings: &VkCircuitBreakerSettings, now: Instant) -> VkCircuitState {
+        if settings.min_requests == 0 || !self.tripped.load(Ordering::Acquire) {
+            return VkCircuitState::Closed;
+        }
+
+        match lock_circuit!(self).state {
+            CircuitState::Closed => VkCircuitState::Closed,
+            CircuitState::Open { since } if now < since + settings.open_duration => {
+                VkCircuitState::Open
+            }
+            _ => VkCircuitState::HalfOpen,
+        }
+    }
+
+    pub(super) fn trips(&self) -> u64 {
+        self.trips.load(Ordering::Relaxed)
+    }
+
+    /// Returns true if the circuit is half-open and a new trial operation
+    /// can be sent to the server. The caller must record the outcome of the
+    /// trial operation.
+    pub(super) fn try_start_trial(&self) -> bool {
+        self.try_start_trial_at(&SETTINGS.load(), Instant::now())
+    }
+
+    fn try_start_trial_at(&self, settings: &VkCircuitBreakerSettings, now: Instant) -> bool {
+        if settings.min_requests == 0 || !self.tripped.load(Ordering::Acquire) {
+            return false;
+        }
+
+        let mut circuit = lock_circuit!(self);
+        match circuit.state {
+            CircuitState::Open { since } if now >= since + settings.open_duration => {
+                circuit.state = CircuitState::HalfOpen {
+                    trial_running: true,
+                    successes: 0,
+                };
+                true
+            }
+            CircuitState::HalfOpen {
+                trial_running: false,
+                successes,
+            } => {
+                circuit.state = CircuitState::HalfOpen {
+                    trial_running: true,
+                    successes,
+                };
+                true
+            }
+            _ => false,
+        }
+    }
+
+    /// Lets another trial operation start, after a trial operation that
+    /// failed before reaching the server, without counting it as an outcome.
+    pub(super) fn cancel_trial(&self) {
+        let mut circuit = lock_circuit!(self);
+        if let CircuitState::HalfOpen {
+            trial_running: true,
+            successes,
+        } = circuit.state
+        {
+            circuit.state = CircuitState::HalfOpen {
+                trial_running: false,
+                successes,
+            };
+        }
+    }
+
+    /// Records the outcome of an operation sent to the server. Operations
+    /// that took longer than the slow call threshold count as failures.
+    pub(super) fn record(&self, trial: bool, failed: bool, latency: Duration) {
+        self.record_at(&SETTINGS.load(), trial, failed, latency, Instant::now())
+    }
+
+    fn record_at(
+        &self,
+        settings: &VkCircuitBreakerSettings,
+        trial: bool,
+        failed: bool,
+        latency: Duration,
+        now: Instant,
+    ) {
+        let mut circuit = lock_circuit!(self);
+
+        // The circuit breaker is disabled
+        if settings.min_requests == 0 {
+            self.close(&mut circuit);
+            return;
+        }
+
+        let failed = failed || settings.slow_call.is_some_and(|slow| latency >= slow);
+
+        match circuit.state {
+            CircuitState::Closed => {
+                let (requests, failures) = self.count_outcome(&mut circuit, settings, failed, now);
+                if requests >= settings.min_requests as u64
+                    && failures as f64 >= requests as f64 * settings.failure_rate
+                {
+                    self.open(&mut circuit, now);
+                }
+            }
+            CircuitState::HalfOpen { successes, .. } if trial => {
+                if failed {
+                    self.open(&mut circuit, now);
+                } else if successes + 1 >= settings.half_open_requests {
+                    self.close(&mut circuit);
+                } else {
+                    circuit.state = CircuitState::HalfOpen {
+                        trial_running: false,
+                        successes: successes + 1,
+                    };
+                }
+            }
+            // Operations started before the circuit opened
+            _ => (),
+        }
+    }
+
+    fn open(&self, circuit: &mut Circuit, now: Instant) {
+        circuit.state = CircuitState::Open { since: now };
+        self.tripped.store(true, Ordering::Release);
+        self.trips.fetch_add(1, Ordering::Relaxed);
+    }
+
+    fn close(&self, circuit: &mut Circuit) {
+        circuit.state = CircuitState::Closed;
+        // The outcomes that opened the circuit are forgotten
+        circuit.buckets = [WindowBucket::default(); WINDOW_BUCKETS];
+        self.tripped.store(false, Ordering::Release);
+    }
+
+    /// Adds the outcome to the window, and returns the number of operations
+    /// and failures in the window.
+    fn count_outcome(
+        &self,
+        circuit: &mut Circuit,
+        settings: &VkCircuitBreakerSettings,
+        failed: bool,
+        now: Instant,
+    ) -> (u64, u64) {
+        let bucket_len = (settings.window / WINDOW_BUCKETS as u32).max(Duration::from_millis(1));
+        let slot = (now.duration_since(self.created).as_nanos() / bucket_len.as_nanos()) as u64;
+
+        let bucket = &mut circuit.buckets[slot as usize % WINDOW_BUCKETS];
+        if bucket.slot != slot {
+            *bucket = WindowBucket {
+                slot,
+                requests: 0,
+                failures: 0,
+            };
+        }
+        bucket.requests += 1;
+        bucket.failures += failed as u64;
+
+        circuit
+            .buckets
+            .iter()
+            .filter(|bucket| slot - bucket.slot < WINDOW_BUCKETS as u64)
+            .fold((0, 0), |(requests, failures), bucket| {
+                (requests + bucket.requests, failures + bucket.failures)
+            })
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn test_settings() -> VkCircuitBreakerSettings {
+        VkCircuitBreakerSettings::new(
+            Duration::from_secs(10),
+            10,
+            0.5,
+            Some(Duration::from_millis(500)),
+            Duration::from_secs(5),
+            2,
+        )
+    }
+
+    #[test]
+    fn test_circuit_opens_and_recovers() {
+        let settings = test_settings();
+        let breaker = VkCircuitBreaker::default();
+        let fast = Duration::from_millis(10);
+        let slow = Duration::from_secs(1);
+        let now = Instant::now();
+
+        // Not enough operations in the window to trip
+        for _ in 0..4 {
+            breaker.record_at(&settings, false, true, fast, now);
+        }
+        assert_eq!(breaker.state_at(&settings, now), VkCircuitState::Closed);
+
+        // Slow operations count as failures
+        for _ in 0..5 {
+            breaker.record_at(&settings, false, false, fast, now);
+        }
+        breaker.record_at(&settings, false, false, slow, now);
+        assert_eq!(breaker.state_at(&settings, now), VkCircuitState::Open);
+        assert_eq!(breaker.trips(), 1);
+        assert!(!breaker.try_start_trial_at(&settings, now));
+
+        // One trial operation at a time once the open duration elapsed
+        let later = now + Duration::from_secs(5);
+        assert_eq!(breaker.state_at(&settings, later), VkCircuitState::HalfOpen);
+        assert!(breaker.try_start_trial_at(&settings, later));
+        assert!(!breaker.try_start_trial_at(&settings, later));
+
+        // A trial that did not reach the server is not an outcome
+        breaker.cancel_trial();
+        assert_eq!(breaker.state_at(&settings, later), VkCircuitState::HalfOpen);
+        assert!(breaker.try_start_trial_at(&settings, later));
+
+        // A failed trial opens the circuit again
+        breaker.record_at(&settings, true, true, fast, later);
+        assert_eq!(breaker.state_at(&settings, later), VkCircuitState::Open);
+        assert_eq!(breaker.trips(), 2);
+
+        let later = later + Duration::from_secs(5);
+        for _ in 0..2 {
+            assert!(breaker.try_start_trial_at(&settings, later));
+            breaker.record_at(&settings, true, false, fast, later);
+        }
+        assert_eq!(breaker.state_at(&settings, later), VkCircuitState::Closed);
+    }
+
+    #[test]
+    fn test_window_forgets_old_outcomes() {
+        let settings = test_settings();
+        let breaker = VkCircuitBreaker::default();
+        let fast = Duration::from_millis(10);
+        let now = Instant::now();
+
+        for _ in 0..9 {
+            breaker.record_at(&settings, false, true, fast, now);
+        }
+
+        // The failures above left the window
+        let later = now + Duration::from_secs(11);
+        for _ in 0..9 {
+            breaker.record_at(&settings, false, false, fast, later);
+        }
+        breaker.record_at(&settings, false, true, fast, later);
+        assert_eq!(breaker.state_at(&settings, later), VkCircuitState::Closed);
+    }
+}
@@ -0,0 +1,315 @@
+use std::collections::{BTreeMap, HashMap};
+use std::time::{Duration, Instant};
+
+use pbkdf2::pbkdf2_hmac;
+use sha2::Sha256;
+
+// Number of PBKDF2 rounds used to hash the cached passwords. This is a
+// trade-off between making an offline brute-force of a leaked cache entry
+// expensive, and the time spent by the Valkey main thread on a cache lookup.
+const PASSWORD_HASH_ROUNDS: u32 = 1024;
+const PASSWORD_SALT_LEN: usize = 16;
+const PASSWORD_HASH_LEN: usize = 32;
+
+/// A salted hash of a password. Cache entries never keep plaintext passwords.
+#[derive(Clone, PartialEq)]
+pub(super) struct VkPasswordHash {
+    salt: [u8; PASSWORD_SALT_LEN],
+    hash: [u8; PASSWORD_HASH_LEN],
+}
+
+impl VkPasswordHash {
+    pub fn new(password: &str) -> VkPasswordHash {
+        let salt: [u8; PASSWORD_SALT_LEN] = rand::random();
+        let hash = Self::hash_password(password, &salt);
+        VkPasswordHash { salt, hash }
+    }
+
+    fn hash_password(password: &str, salt: &[u8]) -> [u8; PASSWORD_HASH_LEN] {
+        let mut hash = [0u8; PASSWORD_HASH_LEN];
+        pbkdf2_hmac::<Sha256>(password.as_bytes(), salt, PASSWORD_HASH_ROUNDS, &mut hash);
+        hash
+    }
+
+    /// Compares in constant time to not leak how much of the hash matched
+    pub fn verify(&self, password: &str) -> bool {
+        let hash = Self::hash_password(password, &self.salt);
+        hash.iter()
+            .zip(self.hash.iter())
+            .fold(0u8, |acc, (x, y)| acc | (x ^ y))
+            == 0
+    }
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkCacheStats {
+    pub entries: usize,
+    pub hits: u64,
+    pub misses: u64,
+    pub evictions: u64,
+}
+
+struct CacheEntry<V> {
+    value: V,
+    inserted_at: Instant,
+    tick: u64,
+}
+
+/// A string keyed cache bounded both in time (TTL) and in size (LRU eviction).
+///
+/// The cache is not thread-safe by itself, callers are expected to wrap it in a
+/// mutex. A TTL or a maximum number of entries of zero disables the cache.
+pub(super) struct VkLruCache<V> {
+    entries: HashMap<String, CacheEntry<V>>,
+    lru: BTreeMap<u64, String>,
+    tick: u64,
+    ttl: Duration,
+    max_entries: usize,
+    hits: u64,
+    misses: u64,
+    evictions: u64,
+}
+
+impl<V> VkLruCache<V> {
+    pub fn new(ttl: Duration, max_entries: usize) -> VkLruCache<V> {
+        VkLruCache {
+            entries: HashMap::new(),
+            lru: BTreeMap::new(),
+            tick: 0,
+            ttl,
+            max_entries,
+            hits: 0,
+            misses: 0,
+            evictions: 0,
+        }
+    }
+
+    pub fn is_enabled(&self) -> bool {
+        !self.ttl.is_zero() && self.max_entries > 0
+    }
+
+    /// Returns true if inserting a new key would evict an entry.
+    pub fn is_full(&self) -> bool {
+        self.entries.len() >= self.max_entries
+    }
+
+    pub fn contains(&self, key: &str) -> bool {
+        self.entries.contains_key(key)
+    }
+
+    pub fn reconfigure(&mut self, ttl: Duration, max_entries: usize) {
+        self.ttl = ttl;
+        self.max_entries = max_entries;
+
+        if !self.is_enabled() {
+            self.clear();
+            return ();
+        }
+
+        while self.entries.len() > self.max_entries {
+            self.evict_lru();
+        }
+    }
+
+    fn next_tick(&mut self) -> u64 {
+        self.tick += 1;
+        self.tick
+    }
+
+    fn evict_lru(&mut self) -> Option<(String, V)> {
+        let (_, key) = self.lru.pop_first()?;
+        let entry = self.entries.remove(&key)?;
+        self.evictions += 1;
+        Some((key, entry.value))
+    }
+
+    fn is_expired(&self, entry: &CacheEntry<V>) -> bool {
+        entry.inserted_at.elapsed() >= self.ttl
+    }
+
+    /// Returns the cached value for `key` if it exists and has not expired,
+    /// without accounting the lookup nor marking the value as recently used.
+    pub fn peek(&self, key: &str) -> Option<&V> {
+        if !self.is_enabled() {
+            return None;
+        }
+
+        self.entries
+            .get(key)
+            .filter(|entry| !self.is_expired(entry))
+            .map(|entry| &entry.value)
+    }
+
+    /// Returns the cached value for `key` if it exists, has not expired, and
+    /// satisfies `pred`. Otherwise the lookup is accounted as a miss.
+    pub fn get_if<F>(&mut self, key: &str, pred: F) -> Option<&V>
+    where
+        F: FnOnce(&V) -> bool,
+    {
+        self.get_if_with_age(key, pred).map(|(value, _)| value)
+    }
+
+    /// Same as `get_if`, but also returns the time elapsed since the value was
+    /// inserted.
+    pub fn get_if_with_age<F>(&mut self, key: &str, pred: F) -> Option<(&V, Duration)>
+    where
+        F: FnOnce(&V) -> bool,
+    {
+        if !self.is_enabled() {
+            return None;
+        }
+
+        let (expired, tick) = match self.entries.get(key) {
+            Some(entry) => (self.is_expired(entry), entry.tick),
+            None => {
+                self.misses += 1;
+                return None;
+            }
+        };
+
+        if expired {
+            self.remove(key);
+            self.misses += 1;
+            return None;
+        }
+
+        let new_tick = self.next_tick();
+        let entry = self.entries.get_mut(key).expect("entry should exist");
+
+        if !pred(&entry.value) {
+            self.misses += 1;
+            return None;
+        }
+
+        entry.tick = new_tick;
+        self.lru.remove(&tick);
+        self.lru.insert(new_tick, key.to_string());
+        self.hits += 1;
+
+        Some((&entry.value, entry.inserted_at.elapsed()))
+    }
+
+    pub fn get(&mut self, key: &str) -> Option<&V> {
+        self.get_if(key, |_| true)
+    }
+
+    pub fn get_with_age(&mut self, key: &str) -> Option<(&V, Duration)> {
+        self.get_if_with_age(key, |_| true)
+    }
+
+    /// Inserts `value` under `key`, and returns the entries that were evicted
+    /// to make room for it.
+    pub fn insert(&mut self, key: String, value: V) -> Vec<(String, V)> {
+        let mut evicted = Vec::new();
+
+        if !self.is_enabled() {
+            return evicted;
+        }
+
+        self.remove(&key);
+
+        while self.entries.len() >= self.max_entries {
+            match self.evict_lru() {
+                Some(entry) => evicted.push(entry),
+                None => break,
+            }
+        }
+
+        let tick = self.next_tick();
+        self.lru.insert(tick, key.clone());
+        self.entries.insert(
+            key,
+            CacheEntry {
+                value,
+                inserted_at: Instant::now(),
+                tick,
+            },
+        );
+
+        evicted
+    }
+
+    pub fn remove(&mut self, key: &str) -> bool {
+        match self.entries.remove(key) {
+            Some(entry) => {
+                self.lru.remove(&entry.tick);
+                true
+            }
+            None => false,
+        }
+    }
+
+    pub fn clear(&mut self) -> usize {
+        let count = self.entries.len();
+        self.entries.clear();
+        self.lru.clear();
+        count
+    }
+
+    pub fn stats(&self) -> VkCacheStats {
+        VkCacheStats {
+            entries: self.entries.len(),
+            hits: self.hits,
+            misses: self.misses,
+            evictions: self.evictions,
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_lru_eviction() {
+        let mut cache = VkLruCache::new(Duration::from_secs(60), 2);
+        cache.insert("a".to_string(), 1);
+        cache.insert("b".to_string(), 2);
+        assert_eq!(cache.get("a"), Some(&1));
+
+        cache.insert("c".to_string(), 3);
+        assert_eq!(cache.get("b"), None);
+        assert_eq!(cache.get("a"), Some(&1));
+        assert_eq!(cache.get("c"), Some(&3));
+
+        let stats = cache.stats();
+        assert_eq!(stats.entries, 2);
+        assert_eq!(stats.hits, 3);
+        assert_eq!(stats.misses, 1);
+        assert_eq!(stats.evictions, 1);
+    }
+
+    #[test]
+    fn test_peek_is_not_accounted() {
+        let mut cache = VkLruCache::new(Duration::from_secs(60), 2);
+        cache.insert("a".to_string(), 1);
+        cache.insert("b".to_string(), 2);
+        assert_eq!(cache.peek("a"), Some(&1));
+        assert_eq!(cache.peek("c"), None);
+
+        // Peeking does not make "a" recently used
+        cache.insert("c".to_string(), 3);
+        assert_eq!(cache.peek("a"), None);
+
+        let stats = cache.stats();
+        assert_eq!(stats.hits, 0);
+        assert_eq!(stats.misses, 0);
+    }
+
+    #[test]
+    fn test_ttl_expiration() {
+        let mut cache = VkLruCache::new(Duration::from_millis(10), 10);
+        cache.insert("a".to_string(), 1);
+        std::thread::sleep(Duration::from_millis(20));
+        assert_eq!(cache.get("a"), None);
+        assert_eq!(cache.stats().entries, 0);
+    }
+
+    #[test]
+    fn test_disabled_cache() {
+        let mut cache = VkLruCache::new(Duration::ZERO, 10);
+        cache.insert("a".to_string(), 1);
+        assert_eq!(cache.get("a"), None);
+        assert_eq!(cache.stats().entries, 0);
+    }
+}
@@ -1,25 +1,98 @@
-use std::collections::VecDeque;
-use std::fs;
-use std::time::Duration;
-
+use std::collections::{HashMap, HashSet, VecDeque};
+use std::sync::Arc;
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
+use std::time::{Duration, Instant};
+
+use futures::future;
+use ldap3::adapters::{Adapter, EntriesOnly, PagedResults};
+use ldap3::controls::{Control, RawControl, RefreshMode, SyncRequest};
 use ldap3::exop::WhoAmI;
-use ldap3::{Ldap, LdapConnAsync, LdapConnSettings, SearchEntry};
-use log::debug;
-use native_tls::{Certificate, Identity, TlsConnector};
+use ldap3::{
+    Ldap, LdapConnAsync, LdapConnSettings, LdapError, Scope, SearchEntry, SearchOptions,
+    SearchStream,
+};
+use log::{debug, info};
 use tokio::sync::{Mutex, MutexGuard, Notify};
 use url::Url;
 
-use crate::{handle_io_error, handle_ldap_error, handle_tls_error};
+use crate::configs::LdapGroupNesting;
+use crate::handle_ldap_error;
 
 use super::Result;
 use super::errors::VkLdapError;
+use super::group_batch;
+use super::group_graph::{self, VkGroupRules};
+use super::metrics::{VkAuthPhase, VkPhaseTimer};
 use super::server::VkLdapServer;
 use super::settings::{VkConnectionSettings, VkLdapSettings};
+use super::tls;
+
+/// The Active Directory matching rule that matches the members of a group
+/// through any number of nested groups.
+const LDAP_MATCHING_RULE_IN_CHAIN: &str = "1.2.840.113556.1.4.1941";
+/// The deepest nesting of groups followed when resolving nested groups.
+const MAX_GROUP_NESTING_DEPTH: usize = 32;
+
+/// The kind of LDAP operations that the connections of a pool are used for.
+///
+/// Connections of the bind pool are re-bound as a different user on each
+/// authentication, while the connections of the search pool are only used for
+/// searches, and stay bound as the search bind DN.
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub(super) enum VkPoolKind {
+    Bind,
+    Search,
+}
+
+impl VkPoolKind {
+    /// Returns true if the connections of the pool are shared by concurrent
+    /// operations instead of being used by one operation at a time.
+    fn is_multiplexed(&self, settings: &VkConnectionSettings) -> bool {
+        *self == VkPoolKind::Search && settings.search_connection_multiplexing
+    }
+
+    /// Returns the (min, max) number of connections of the pool.
+    fn pool_sizes(&self, settings: &VkConnectionSettings) -> (usize, usize) {
+        if self.is_multiplexed(settings) {
+            let size = settings.search_connection_pool_size;
+            return (size, size);
+        }
+
+        let (min_size, max_size) = match self {
+            VkPoolKind::Bind => (
+                settings.connection_pool_size,
+                settings.connection_pool_max_size,
+            ),
+            VkPoolKind::Search => (
+                settings.search_connection_pool_size,
+                settings.search_connection_pool_max_size,
+            ),
+        };
+        (min_size, max_size.max(min_size))
+    }
+}
+
+struct IdleConnection {
+    conn: VkLdapConnection,
+    since: Instant,
+}
 
 struct ConnectionQueue {
-    queue: VecDeque<VkLdapConnection>,
+    // Idle connections, the most recently used at the back
+    queue: VecDeque<IdleConnection>,
     epoch: u64,
+    // Connections of the current epoch, either idle, in use, or being opened
     size: usize,
+    min_size: usize,
+    max_size: usize,
+    opening: usize,
+    waiters: usize,
+    // In multiplexed pools the connections stay in the queue, and operations
+    // get a handle to one of them
+    multiplexed: bool,
+    shared: usize,
+    next_shared: usize,
+    settings: VkConnectionSettings,
 }
 
 impl ConnectionQueue {
@@ -28,12 +101,24 @@ impl ConnectionQueue {
             queue: VecDeque::new(),
             epoch: 0,
             size: 0,
+            min_size: 0,
+            max_size: 0,
+            opening: 0,
+            waiters: 0,
+            multiplexed: false,
+            shared: 0,
+            next_shared: 0,
+            settings: VkConnectionSettings::default(),
         }
     }
 
     async fn close_connections(&mut self) {
-        for conn in self.queue.iter_mut() {
-            conn.close().await;
+        // Connections still used by operations of a multiplexed pool are
+        // closed when their last handle is dropped
+        if self.shared == 0 {
+            for idle in self.queue.iter_mut() {
+                idle.conn.close().await;
+            }
         }
         self.queue.clear();
     }
@@ -41,16 +126,22 @@ impl ConnectionQueue {
     async fn reset_connections(
         &mut self,
         server: &VkLdapServer,
+        kind: VkPoolKind,
         settings: &VkConnectionSettings,
     ) -> Result<()> {
         self.close_connections().await;
 
         self.epoch += 1;
-        self.size = settings.connection_pool_size;
+        (self.min_size, self.max_size) = kind.pool_sizes(settings);
+        self.size = self.min_size;
+        self.opening = 0;
+        self.multiplexed = kind.is_multiplexed(settings);
+        self.shared = 0;
+        self.settings = settings.clone();
 
         for _ in 0..self.size {
             match VkLdapConnection::new(&settings, server).await {
-                Ok(conn) => self.queue.push_front(conn),
+                Ok(conn) => self.put(conn),
                 Err(err) => {
                     self.close_connections().await;
                     return Err(err);
@@ -66,33 +157,91 @@ impl ConnectionQueue {
     }
 
     fn has_all_connections(&self) -> bool {
-        self.queue.len() == self.size
+        self.queue.len() == self.size && self.shared == 0
+    }
+
+    fn in_use(&self) -> usize {
+        if self.multiplexed {
+            self.shared
+        } else {
+            self.size - self.queue.len()
+        }
+    }
+
+    fn can_grow(&self) -> bool {
+        self.size < self.max_size
     }
 
     fn take(&mut self) -> (VkLdapConnection, u64) {
         assert!(!self.is_empty());
-        (self.queue.pop_back().unwrap(), self.epoch)
+        (self.queue.pop_back().unwrap().conn, self.epoch)
+    }
+
+    /// Returns a handle to one of the connections of a multiplexed pool,
+    /// picked in turn.
+    fn share(&mut self) -> (VkLdapConnection, u64) {
+        assert!(!self.is_empty());
+        let idx = self.next_shared % self.queue.len();
+        self.next_shared = self.next_shared.wrapping_add(1);
+        self.shared += 1;
+        (self.queue[idx].conn.clone(), self.epoch)
     }
 
     fn put(&mut self, conn: VkLdapConnection) {
-        self.queue.push_front(conn);
+        self.queue.push_back(IdleConnection {
+            conn,
+            since: Instant::now(),
+        });
     }
 
     fn get_epoch(&self) -> u64 {
         self.epoch
     }
+
+    /// Removes the connections above the minimum size that have been idle
+    /// for longer than the idle timeout.
+    fn take_expired(&mut self) -> Vec<VkLdapConnection> {
+        let mut expired = Vec::new();
+        while self.size > self.min_size {
+            match self.queue.front() {
+                Some(idle)
+                    if idle.since.elapsed() >= self.settings.connection_pool_idle_timeout =>
+                {
+                    expired.push(self.queue.pop_front().unwrap().conn);
+                    self.size -= 1;
+                }
+                _ => break,
+            }
+        }
+        expired
+    }
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkPoolStats {
+    pub size: usize,
+    pub in_use: usize,
+    pub waiters: usize,
+    pub rejected: u64,
 }
 
 pub(super) struct VkConnectionPool {
     queue: Mutex<ConnectionQueue>,
     signal: Notify,
     server: VkLdapServer,
+    kind: VkPoolKind,
+    // Copies of the queue counters, readable without locking the queue
+    size: AtomicUsize,
+    in_use: AtomicUsize,
+    waiters: AtomicUsize,
+    rejected: AtomicU64,
 }
 
 pub(super) struct VkLdapPoolConnection {
     pub conn: VkLdapConnection,
     pub server: VkLdapServer,
     from_epoch: u64,
+    shared: bool,
 }
 
 macro_rules! notify_wait {
@@ -107,6 +256,20 @@ macro_rules! notify_wait {
 
         fut.await;
 
+        // Re-acaquire the lock
+        lock.lock().await
+    }};
+    ($notify:expr, $guard:expr, $timeout:expr) => {{
+        let fut = $notify.notified();
+        tokio::pin!(fut);
+        fut.as_mut().enable();
+
+        // Release the lock
+        let lock = MutexGuard::mutex(&$guard);
+        drop($guard);
+
+        let _ = tokio::time::timeout($timeout, fut).await;
+
         // Re-acaquire the lock
         lock.lock().await
     }};
@@ -115,56 +278,235 @@ macro_rules! notify_wait {
 impl VkConnectionPool {
     pub async fn new(
         server: VkLdapServer,
+        kind: VkPoolKind,
         settings: &VkConnectionSettings,
     ) -> (VkConnectionPool, Result<()>) {
         let mut c_queue = ConnectionQueue::new();
-        let res = c_queue.reset_connections(&server, settings).await;
-        (
-            VkConnectionPool {
-                queue: Mutex::new(c_queue),
-                signal: Notify::new(),
-                server,
-            },
-            res,
-        )
+        let res = c_queue.reset_connections(&server, kind, settings).await;
+        let pool = VkConnectionPool {
+            queue: Mutex::new(c_queue),
+            signal: Notify::new(),
+            server,
+            kind,
+            size: AtomicUsize::new(0),
+            in_use: AtomicUsize::new(0),
+            waiters: AtomicUsize::new(0),
+            rejected: AtomicU64::new(0),
+        };
+        pool.publish_stats(&*pool.queue.lock().await);
+        (pool, res)
+    }
+
+    fn publish_stats(&self, queue: &ConnectionQueue) {
+        self.size.store(queue.size, Ordering::Relaxed);
+        self.in_use.store(queue.in_use(), Ordering::Relaxed);
+        self.waiters.store(queue.waiters, Ordering::Relaxed);
+    }
+
+    pub fn stats(&self) -> VkPoolStats {
+        VkPoolStats {
+            size: self.size.load(Ordering::Relaxed),
+            in_use: self.in_use.load(Ordering::Relaxed),
+            waiters: self.waiters.load(Ordering::Relaxed),
+            rejected: self.rejected.load(Ordering::Relaxed),
+        }
     }
 
     pub async fn refresh_connections(&self, settings: &VkConnectionSettings) -> Result<()> {
         let mut queue = self.queue.lock().await;
 
-        queue.reset_connections(&self.server, settings).await?;
+        let res = queue
+            .reset_connections(&self.server, self.kind, settings)
+            .await;
+        self.publish_stats(&queue);
+        res?;
 
         self.signal.notify_waiters();
 
         Ok(())
     }
 
-    pub async fn take_connection(&self) -> VkLdapPoolConnection {
+    /// Takes an idle connection from the pool, waiting for one if needed.
+    ///
+    /// Fails with `VkLdapError::PoolExhausted` when the pool already has the
+    /// maximum number of waiters, or when no connection is available within
+    /// the maximum wait time.
+    pub async fn take_connection(&self) -> Result<VkLdapPoolConnection> {
+        match self.take_or_wait_connection().await {
+            Some(pool_conn) => Ok(pool_conn),
+            None => {
+                self.rejected.fetch_add(1, Ordering::Relaxed);
+                let url = self.server.get_url_ref();
+                debug!(
+                    "rejected operation on exhausted {:?} connection pool of {url}",
+                    self.kind
+                );
+                Err(VkLdapError::PoolExhausted(url.to_string()))
+            }
+        }
+    }
+
+    async fn take_or_wait_connection(&self) -> Option<VkLdapPoolConnection> {
         let mut queue = self.queue.lock().await;
+        let start = Instant::now();
+        let mut waiting_since = start;
 
         while queue.is_empty() {
-            queue = notify_wait!(self.signal, queue);
+            let mut timeout = None;
+
+            let max_waiters = queue.settings.connection_pool_max_waiters;
+            if max_waiters > 0 && queue.waiters >= max_waiters {
+                return None;
+            }
+
+            let max_wait = queue.settings.connection_pool_max_wait;
+            if !max_wait.is_zero() {
+                let waited = start.elapsed();
+                if waited >= max_wait {
+                    return None;
+                }
+                timeout = Some(max_wait - waited);
+            }
+
+            if queue.can_grow() {
+                let threshold = queue.settings.connection_pool_growth_threshold;
+                let waited = waiting_since.elapsed();
+
+                if waited >= threshold {
+                    if let Some(pool_conn) = self.open_connection(queue).await {
+                        return Some(pool_conn);
+                    }
+                    queue = self.queue.lock().await;
+                    waiting_since = Instant::now();
+                    continue;
+                }
+
+                let growth_timeout = threshold - waited;
+                timeout = Some(timeout.map_or(growth_timeout, |t: Duration| t.min(growth_timeout)));
+            }
+
+            queue.waiters += 1;
+            self.publish_stats(&queue);
+            queue = match timeout {
+                Some(timeout) => notify_wait!(self.signal, queue, timeout),
+                None => notify_wait!(self.signal, queue),
+            };
+            queue.waiters -= 1;
         }
 
-        let (conn, epoch) = queue.take();
+        Some(self.take_idle_connection(&mut queue))
+    }
+
+    /// Takes an idle connection from the pool, only if one is available right
+    /// away.
+    pub async fn try_take_connection(&self) -> Option<VkLdapPoolConnection> {
+        let mut queue = self.queue.lock().await;
+        if queue.is_empty() {
+            return None;
+        }
+        Some(self.take_idle_connection(&mut queue))
+    }
+
+    fn take_idle_connection(&self, queue: &mut ConnectionQueue) -> VkLdapPoolConnection {
+        let shared = queue.multiplexed;
+        let (conn, epoch) = if shared { queue.share() } else { queue.take() };
+        self.publish_stats(queue);
         VkLdapPoolConnection {
             conn,
             server: self.server.clone(),
             from_epoch: epoch,
+            shared,
+        }
+    }
+
+    /// Opens a new connection that is added to the pool in use by the
+    /// caller. The pool lock is released while connecting.
+    async fn open_connection(
+        &self,
+        mut queue: MutexGuard<'_, ConnectionQueue>,
+    ) -> Option<VkLdapPoolConnection> {
+        queue.size += 1;
+        queue.opening += 1;
+        self.publish_stats(&queue);
+
+        let epoch = queue.get_epoch();
+        let settings = queue.settings.clone();
+        drop(queue);
+
+        let res = VkLdapConnection::new(&settings, &self.server).await;
+
+        let mut queue = self.queue.lock().await;
+        // A refresh of the pool already reset the counters
+        if queue.get_epoch() == epoch {
+            queue.opening -= 1;
+            if res.is_err() {
+                queue.size -= 1;
+            }
+            self.publish_stats(&queue);
+        }
+        drop(queue);
+
+        match res {
+            Ok(conn) => {
+                let url = self.server.get_url_ref();
+                debug!("grew {:?} connection pool of {url}", self.kind);
+                Some(VkLdapPoolConnection {
+                    conn,
+                    server: self.server.clone(),
+                    from_epoch: epoch,
+                    shared: false,
+                })
+            }
+            Err(err) => {
+                debug!("failed to grow connection pool: {err}");
+                None
+            }
         }
     }
 
     pub async fn return_connection(&self, mut pool_conn: VkLdapPoolConnection) {
         let mut queue = self.queue.lock().await;
 
-        if queue.get_epoch() == pool_conn.from_epoch {
+        if pool_conn.shared {
+            // The connection is still used by other operations
+            if queue.get_epoch() == pool_conn.from_epoch {
+                queue.shared -= 1;
+                self.publish_stats(&queue);
+                self.signal.notify_waiters();
+            }
+        } else if queue.get_epoch() == pool_conn.from_epoch {
             queue.put(pool_conn.conn);
+            self.publish_stats(&queue);
             self.signal.notify_waiters();
         } else {
             pool_conn.conn.close().await;
         }
     }
 
+    /// Closes the connections above the minimum pool size that have been
+    /// idle for longer than the idle timeout.
+    pub async fn reap_idle_connections(&self) {
+        let mut expired = {
+            let mut queue = self.queue.lock().await;
+            let expired = queue.take_expired();
+            self.publish_stats(&queue);
+            expired
+        };
+
+        if !expired.is_empty() {
+            let url = self.server.get_url_ref();
+            debug!(
+                "closing {} idle connections of {:?} connection pool of {url}",
+                expired.len(),
+                self.kind
+            );
+        }
+
+        for conn in expired.iter_mut() {
+            conn.close().await;
+        }
+    }
+
     pub async fn shutdown(&self) {
         let mut queue = self.queue.lock().await;
 
@@ -176,8 +518,348 @@ impl VkConnectionPool {
     }
 }
 
+/// The DN of a user, and the groups listed in the entry of the user when
+/// `ldap.groups_member_of_attribute` is set.
+pub(super) struct VkUserEntry {
+    pub dn: String,
+    pub member_of: Option<Vec<String>>,
+}
+
+/// The members of a group, and the ACL rule tokens of the group.
+pub(super) struct VkGroupMembers {
+    pub dn: String,
+    pub members: Vec<String>,
+    pub rules: Vec<String>,
+}
+
+/// Appends the rule `tokens` that are not in `rules` yet.
+pub(super) fn merge_rule_tokens<'a, I>(rules: &mut Vec<String>, tokens: I)
+where
+    I: IntoIterator<Item = &'a str>,
+{
+    for token in tokens {
+        if !rules.iter().any(|rule| rule == token) {
+            rules.push(token.to_string());
+        }
+    }
+}
+
+/// Reads the ACL rule tokens of the group `group_dn` with the ldap handler
+/// `ldap`, and returns them with the DN of the group.
+async fn read_group_rules(
+    mut ldap: Ldap,
+    group_dn: &str,
+    filter: &str,
+    rules_attr: &str,
+    timeout: Duration,
+) -> (String, Result<Vec<String>>) {
+    let res = ldap
+        .with_timeout(timeout)
+        .search(group_dn, Scope::Base, filter, vec![rules_attr])
+        .await;
+    let entries = match res.map(|res| res.success()) {
+        Ok(Ok((entries, _))) => entries,
+        // noSuchObject, the group was deleted since
+        Ok(Err(LdapError::LdapResult { result })) if result.rc == 32 => Vec::new(),
+        Ok(Err(err)) => return (group_dn.to_string(), Err(VkLdapError::LdapSearchError(err))),
+        Err(err) => return (group_dn.to_string(), Err(streaming_search_error(err))),
+    };
+
+    // A group that does not match the group filter has no rules
+    let mut rules = Vec::new();
+    for entry in entries {
+        let sentry = SearchEntry::construct(entry);
+        for v in sentry.attrs.get(rules_attr).into_iter().flatten() {
+            merge_rule_tokens(&mut rules, v.split_whitespace());
+        }
+    }
+    (group_dn.to_string(), Ok(rules))
+}
+
+/// Normalizes `dn` to compare the DNs of the group members with the DNs of
+/// the users, which may differ in case and in the spaces around separators.
+pub(super) fn normalize_dn(dn: &str) -> String {
+    dn.split(',')
+        .map(|rdn| {
+            rdn.split('=')
+                .map(|part| part.trim())
+                .collect::<Vec<&str>>()
+                .join("=")
+        })
+        .collect::<Vec<String>>()
+        .join(",")
+        .to_lowercase()
+}
+
+/// Takes the members of a group from its `attrs`. Servers that cap the number
+/// of values of an attribute, like Active Directory, return the members of
+/// large groups in ranges, e.g. `member;range=0-1499`. When the members are
+/// incomplete, the start of the next range is returned too.
+fn take_members(
+    attrs: &mut HashMap<String, Vec<String>>,
+    member_attr: &str,
+) -> (Vec<String>, Option<u64>) {
+    let ranged_prefix = format!("{member_attr};range=").to_lowercase();
+    let ranged_attr = attrs
+        .keys()
+        .find(|attr| attr.to_lowercase().starts_with(&ranged_prefix))
+        .cloned();
+
+    let Some(ranged_attr) = ranged_attr else {
+        return (attrs.remove(member_attr).unwrap_or_default(), None);
+    };
+
+    let members = attrs.remove(&ranged_attr).unwrap_or_default();
+    let next = ranged_attr[ranged_prefix.len()..]
+        .split_once('-')
+        .and_then(|(_, end)| end.parse::<u64>().ok())
+        .map(|end| end + 1);
+    (members, next)
+}
+
+/// The OID of the RFC 3876 matched values control.
+const MATCHED_VALUES_OID: &str = "1.2.826.0.1.3344810.2.3";
+const PERSISTENT_SEARCH_OID: &str = "2.16.840.1.113730.3.4.3";
+const ENTRY_CHANGE_NOTIFICATION_OID: &str = "2.16.840.1.113730.3.4.7";
+/// The add, delete, modify and modDN change types of a persistent search.
+const ALL_CHANGE_TYPES: u8 = 1 | 2 | 4 | 8;
+
+/// BER encodes the `tag`, length and `content` of a value.
+fn ber_encode(tag: u8, content: &[u8]) -> Vec<u8> {
+    let mut out = vec![tag];
+    if content.len() < 0x80 {
+        out.push(content.len() as u8);
+    } else {
+        let len = content.len().to_be_bytes();
+        let skip = len.iter().take_while(|b| **b == 0).count();
+        out.push(0x80 | (len.len() - skip) as u8);
+        out.extend_from_slice(&len[skip..]);
+    }
+    out.extend_from_slice(content);
+    out
+}
+
+/// Returns a matched values control (RFC 3876) that limits the values of
+/// `attr` returned by a search to `values`. The control is not critical: the
+/// servers that do not support it return all the values.
+fn matched_values_control(attr: &str, values: &[String]) -> RawControl {
+    // ValuesReturnFilter ::= SEQUENCE OF SimpleFilterItem, with an
+    // equalityMatch [3] AttributeValueAssertion item for each value
+    let items: Vec<u8> = values
+        .iter()
+        .flat_map(|value| {
+            let mut assertion = ber_encode(0x04, attr.as_bytes());
+            assertion.extend(ber_encode(0x04, value.as_bytes()));
+            ber_encode(0xa3, &assertion)
+        })
+        .collect();
+
+    RawControl {
+        ctype: MATCHED_VALUES_OID.to_string(),
+        crit: false,
+        val: Some(ber_encode(0x30, &items)),
+    }
+}
+
+/// Splits the first BER value of `bytes` into its tag and content, and
+/// returns the bytes that follow it.
+fn ber_decode(bytes: &[u8]) -> Option<(u8, &[u8], &[u8])> {
+    let (&tag, rest) = bytes.split_first()?;
+    let (&first, rest) = rest.split_first()?;
+    let (len, rest) = if first < 0x80 {
+        (first as usize, rest)
+    } else {
+        let len_bytes = (first & 0x7f) as usize;
+        if len_bytes == 0 || len_bytes > size_of::<usize>() || rest.len() < len_bytes {
+            return None;
+        }
+        let (len, rest) = rest.split_at(len_bytes);
+        let len = len.iter().fold(0, |len, b| len << 8 | *b as usize);
+        (len, rest)
+    };
+
+    if rest.len() < len {
+        return None;
+    }
+    let (content, rest) = rest.split_at(len);
+    Some((tag, content, rest))
+}
+
+/// Returns a persistent search control, that keeps a search running to send
+/// each entry that changes, with an entry change notification. The entries
+/// are all sent first, without a notification.
+fn persistent_search_control() -> RawControl {
+    // PersistentSearch ::= SEQUENCE { changeTypes INTEGER, changesOnly
+    // BOOLEAN, returnECs BOOLEAN }
+    let mut content = ber_encode(0x02, &[ALL_CHANGE_TYPES]);
+    content.extend(ber_encode(0x01, &[0x00]));
+    content.extend(ber_encode(0x01, &[0xff]));
+
+    RawControl {
+        ctype: PERSISTENT_SEARCH_OID.to_string(),
+        crit: true,
+        val: Some(ber_encode(0x30, &content)),
+    }
+}
+
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub(super) enum VkEntryChangeType {
+    Add,
+    Delete,
+    Modify,
+    ModDn,
+}
+
+/// The change of an entry sent by a persistent search.
+#[derive(Debug)]
+pub(super) struct VkEntryChange {
+    pub change_type: VkEntryChangeType,
+    /// The DN of the entry before it was renamed, for a modDN change
+    pub previous_dn: Option<String>,
+}
+
+/// Returns the entry change notification among the controls `ctrls` of an
+/// entry sent by a persistent search, or `None` if the entry did not change.
+pub(super) fn entry_change(ctrls: &[Control]) -> Option<VkEntryChange> {
+    let ctrl = ctrls
+        .iter()
+        .find(|ctrl| ctrl.1.ctype == ENTRY_CHANGE_NOTIFICATION_OID)?;
+
+    // EntryChangeNotification ::= SEQUENCE { changeType ENUMERATED,
+    // previousDN LDAPDN OPTIONAL, changeNumber INTEGER OPTIONAL }
+    let (_, notification, _) = ber_decode(ctrl.1.val.as_deref()?)?;
+    let change_type = match ber_decode(notification)? {
+        (0x0a, [1], _) => VkEntryChangeType::Add,
+        (0x0a, [2], _) => VkEntryChangeType::Delete,
+        (0x0a, [4], _) => VkEntryChangeType::Modify,
+        (0x0a, [8], _) => VkEntryChangeType::ModDn,
+        _ => return None,
+    };
+    let previous_dn = match ber_decode(notification)?.2 {
+        [] => None,
+        rest => match ber_decode(rest) {
+            Some((0x04, dn, _)) => Some(String::from_utf8_lossy(dn).into_owned()),
+            _ => None,
+        },
+    };
+
+    Some(VkEntryChange {
+        change_type,
+        previous_dn,
+    })
+}
+
+/// The search of the groups that a group is a direct member of.
+trait VkParentGroupsSearch {
+    async fn search_parents(&mut self, group_dn: &str) -> Result<Vec<VkGroupRules>>;
+}
+
+struct VkMemberGroupsSearch<'a> {
+    conn: &'a mut VkLdapConnection,
+    settings: &'a VkLdapSettings,
+    base: &'a str,
+    filter: &'a str,
+    timeout: Duration,
+}
+
+impl VkParentGroupsSearch for VkMemberGroupsSearch<'_> {
+    async fn search_parents(&mut self, group_dn: &str) -> Result<Vec<VkGroupRules>> {
+        self.conn
+            .search_member_groups(
+                self.settings,
+                self.base,
+                self.filter,
+                group_dn,
+                self.timeout,
+            )
+            .await
+    }
+}
+
+/// Returns the groups that contain `groups`, directly or through nested
+/// groups, level by level. The parents of each group are taken from the group
+/// graph, and only searched with `search_parents` if they are not in the graph
+/// already.
+async fn walk_parent_groups<S: VkParentGroupsSearch>(
+    mut groups: Vec<VkGroupRules>,
+    mut search: S,
+) -> Result<Vec<VkGroupRules>> {
+    let mut visited: HashSet<String> = groups.iter().map(|group| normalize_dn(&group.dn)).collect();
+    let mut ancestors = Vec::new();
+
+    for depth in 0.. {
+        if groups.is_empty() {
+            break;
+        }
+        if depth == MAX_GROUP_NESTING_DEPTH {
+            info!(
+                "groups are nested more than {MAX_GROUP_NESTING_DEPTH} levels deep, ignoring the deeper groups"
+            );
+            break;
+        }
+
+        let mut parents = Vec::new();
+        for group in groups.iter() {
+            let group_parents = match group_graph::lookup(&group.dn) {
+                Some(group_parents) => group_parents,
+                None => {
+                    let group_parents = search.search_parents(&group.dn).await?;
+                    group_graph::store(&group.dn, &group_parents);
+                    group_parents
+                }
+            };
+
+            for parent in group_parents {
+                // Each group is visited once, which also ends the cycles of
+                // groups that are members of each other
+                if visited.insert(normalize_dn(&parent.dn)) {
+                    parents.push(parent);
+                } else {
+                    debug!("group '{}' was already visited, skipping it", parent.dn);
+                }
+            }
+        }
+
+        ancestors.extend(parents.iter().cloned());
+        groups = parents;
+    }
+
+    Ok(ancestors)
+}
+
+/// Returns the filter of the groups of `filter` that `member_dn` is a member
+/// of. With the in-chain nesting, the groups that `member_dn` is a member of
+/// through nested groups match too.
+fn member_groups_filter(settings: &VkLdapSettings, filter: &str, member_dn: &str) -> String {
+    let member_attr = &settings.groups_member_attribute;
+    let member_dn = ldap3::ldap_escape(member_dn);
+
+    match settings.groups_nesting {
+        LdapGroupNesting::InChain => {
+            format!("(&({filter})({member_attr}:{LDAP_MATCHING_RULE_IN_CHAIN}:={member_dn}))")
+        }
+        _ => format!("(&({filter})({member_attr}={member_dn}))"),
+    }
+}
+
+pub(super) fn streaming_search_error(err: LdapError) -> VkLdapError {
+    if VkLdapError::is_ldap_connection_error(&err) {
+        VkLdapError::LdapConnectionError(err)
+    } else {
+        VkLdapError::LdapSearchError(err)
+    }
+}
+
+/// A connection to an LDAP server.
+///
+/// Clones share the same underlying connection, and run their operations
+/// concurrently over it.
+#[derive(Clone)]
 pub(super) struct VkLdapConnection {
     ldap_handler: Ldap,
+    // The (DN, password) of the search bind currently in effect, if any. It
+    // is shared by the clones, as it is a state of the underlying connection.
+    search_bind: Arc<Mutex<Option<(String, String)>>>,
 }
 
 impl VkLdapConnection {
@@ -186,7 +868,10 @@ impl VkLdapConnection {
         debug!("creating LDAP connection to {url}");
 
         let ldap_handler = Self::create_ldap_connection(&settings, url).await?;
-        Ok(VkLdapConnection { ldap_handler })
+        Ok(VkLdapConnection {
+            ldap_handler,
+            search_bind: Arc::new(Mutex::new(None)),
+        })
     }
 
     pub async fn ping(&mut self) -> Result<()> {
@@ -207,45 +892,9 @@ impl VkLdapConnection {
         let requires_tls = server_url.scheme() == "ldaps" || use_starttls;
 
         if requires_tls {
-            let mut tls_builder = &mut TlsConnector::builder();
-
-            if let Some(path) = &settings.ca_cert_path {
-                let ca_cert_bytes =
-                    handle_io_error!(fs::read(path), "failed to read CA cert file".to_string());
-                let ca_cert = handle_tls_error!(
-                    Certificate::from_pem(&ca_cert_bytes),
-                    "failed to load CA certificate".to_string()
-                );
-                tls_builder = tls_builder.add_root_certificate(ca_cert);
-            }
-
-            if let Some(cert_path) = &settings.client_cert_path {
-                match &settings.client_key_path {
-                    None => return Err(VkLdapError::NoTLSKeyPathSet),
-                    Some(key_path) => {
-                        let cert_bytes = handle_io_error!(
-                            fs::read(cert_path),
-                            "failed to read client certificate file".to_string()
-                        );
-                        let key_bytes = handle_io_error!(
-                            fs::read(key_path),
-                            "failed to read client key file".to_string()
-                        );
-                        let client_cert = handle_tls_error!(
-                            Identity::from_pkcs8(&cert_bytes, &key_bytes),
-                            "failed to load client certificate".to_string()
-                        );
-                        tls_builder = tls_builder.identity(client_cert);
-                    }
-                }
-            }
-
-            let tls_connector = handle_tls_error!(
-                tls_builder.build(),
-                "failed to setup TLS connection".to_string()
-            );
+            let tls_config = tls::get_tls_config(settings)?;
 
-            ldap_conn_settings = ldap_conn_settings.set_connector(tls_connector);
+            ldap_conn_settings = ldap_conn_settings.set_config(tls_config);
             ldap_conn_settings = ldap_conn_settings.set_starttls(settings.use_starttls);
         }
 
@@ -261,6 +910,8 @@ impl VkLdapConnection {
     }
 
     pub async fn bind(&mut self, user_dn: &str, password: &str, timeout: Duration) -> Result<()> {
+        *self.search_bind.lock().await = None;
+        let _timer = VkPhaseTimer::start(VkAuthPhase::UserBind);
         debug!("running ldap bind with DN='{user_dn}'");
         handle_ldap_error!(
             self.ldap_handler
@@ -272,24 +923,46 @@ impl VkLdapConnection {
         Ok(())
     }
 
+    /// Binds as the search bind DN, if configured. Connections that are
+    /// already bound with the current search bind credentials are not
+    /// re-bound. Concurrent clones wait for the bind of the first one.
+    async fn search_bind(&mut self, settings: &VkLdapSettings, timeout: Duration) -> Result<()> {
+        let (Some(bind_dn), Some(bind_passwd)) =
+            (&settings.search_bind_dn, &settings.search_bind_passwd)
+        else {
+            return Ok(());
+        };
+
+        let mut search_bind = self.search_bind.lock().await;
+        if let Some((dn, passwd)) = &*search_bind {
+            if dn == bind_dn && passwd == bind_passwd {
+                return Ok(());
+            }
+        }
+
+        *search_bind = None;
+        let _timer = VkPhaseTimer::start(VkAuthPhase::AdminBind);
+        debug!("running ldap admin bind with DN='{bind_dn}'");
+        handle_ldap_error!(
+            self.ldap_handler
+                .with_timeout(timeout)
+                .simple_bind(&bind_dn, &bind_passwd)
+                .await,
+            VkLdapError::LdapAdminBindError
+        );
+        *search_bind = Some((bind_dn.clone(), bind_passwd.clone()));
+
+        Ok(())
+    }
+
     pub async fn search(
         &mut self,
         settings: &VkLdapSettings,
         username: &str,
         timeout: Duration,
-    ) -> Result<String> {
-        if let Some(bind_dn) = &settings.search_bind_dn {
-            if let Some(bind_passwd) = &settings.search_bind_passwd {
-                debug!("running ldap admin bind with DN='{bind_dn}'");
-                handle_ldap_error!(
-                    self.ldap_handler
-                        .with_timeout(timeout)
-                        .simple_bind(&bind_dn, &bind_passwd)
-                        .await,
-                    VkLdapError::LdapAdminBindError
-                );
-            }
-        }
+    ) -> Result<VkUserEntry> {
+        self.search_bind(settings, timeout).await?;
+        let _timer = VkPhaseTimer::start(VkAuthPhase::UserSearch);
 
         let mut base = "";
         if let Some(sbase) = &settings.search_base {
@@ -310,6 +983,12 @@ impl VkLdapConnection {
         let scope = settings.search_scope;
         let dn_attribute = &settings.search_dn_attribute;
 
+        // The groups of the user are read in the same search
+        let mut attrs = vec![dn_attribute.as_str()];
+        if let Some(member_of_attr) = &settings.groups_member_of_attribute {
+            attrs.push(member_of_attr.as_str());
+        }
+
         debug!(
             "running ldap search with filter='{search_filter}' scope='{:?}' attribute='{dn_attribute}'",
             scope
@@ -317,12 +996,7 @@ impl VkLdapConnection {
         let (rs, _res) = handle_ldap_error!(
             self.ldap_handler
                 .with_timeout(timeout)
-                .search(
-                    base,
-                    settings.search_scope,
-                    search_filter.as_str(),
-                    vec![dn_attribute],
-                )
+                .search(base, settings.search_scope, search_filter.as_str(), attrs)
                 .await,
             VkLdapError::LdapSearchError
         );
@@ -339,13 +1013,146 @@ impl VkLdapConnection {
             .into_iter()
             .next()
             .expect("there should be one element in rs");
-        let sentry = SearchEntry::construct(entry);
+        let mut sentry = SearchEntry::construct(entry);
 
         if !sentry.attrs.contains_key(dn_attribute) {
             return Err(VkLdapError::InvalidDNAttribute(dn_attribute.clone()));
         }
 
-        Ok(sentry.attrs[dn_attribute][0].clone())
+        Ok(VkUserEntry {
+            dn: sentry.attrs[dn_attribute][0].clone(),
+            member_of: settings
+                .groups_member_of_attribute
+                .as_ref()
+                .map(|attr| sentry.attrs.remove(attr).unwrap_or_default()),
+        })
+    }
+
+    /// Reads the groups listed in the entry of `user_dn`, in the
+    /// `ldap.groups_member_of_attribute` attribute.
+    async fn read_member_of(
+        &mut self,
+        user_dn: &str,
+        member_of_attr: &str,
+        timeout: Duration,
+    ) -> Result<Vec<String>> {
+        debug!("reading ldap entry '{user_dn}' attrs='{member_of_attr}'");
+        let (rs, _res) = handle_ldap_error!(
+            self.ldap_handler
+                .with_timeout(timeout)
+                .search(
+                    user_dn,
+                    Scope::Base,
+                    "(objectClass=*)",
+                    vec![member_of_attr]
+                )
+                .await,
+            VkLdapError::LdapSearchError
+        );
+
+        Ok(rs
+            .into_iter()
+            .next()
+            .map(|entry| SearchEntry::construct(entry))
+            .and_then(|mut sentry| sentry.attrs.remove(member_of_attr))
+            .unwrap_or_default())
+    }
+
+    /// Reads the members of the group `group_dn` that follow the first
+    /// `start` ones, one range at a time.
+    async fn read_member_ranges(
+        &mut self,
+        group_dn: &str,
+        member_attr: &str,
+        mut start: u64,
+        timeout: Duration,
+    ) -> Result<Vec<String>> {
+        let mut members = Vec::new();
+        loop {
+            let range_attr = format!("{member_attr};range={start}-*");
+            debug!("reading ldap entry '{group_dn}' attrs='{range_attr}'");
+            let (rs, _res) = handle_ldap_error!(
+                self.ldap_handler
+                    .with_timeout(timeout)
+                    .search(
+                        group_dn,
+                        Scope::Base,
+                        "(objectClass=*)",
+                        vec![range_attr.as_str()]
+                    )
+                    .await,
+                VkLdapError::LdapSearchError
+            );
+
+            let Some(entry) = rs.into_iter().next() else {
+                break;
+            };
+            let (range, next) = take_members(&mut SearchEntry::construct(entry).attrs, member_attr);
+            members.extend(range);
+            match next {
+                Some(next) if next > start => start = next,
+                _ => break,
+            }
+        }
+        Ok(members)
+    }
+
+    /// Returns the ACL rule tokens of the groups of `group_dns` that match
+    /// the group search, from the group graph when possible. The entries of
+    /// the other groups are read, and added to the group graph.
+    async fn read_groups_rules(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        filter: &str,
+        group_dns: &[String],
+        timeout: Duration,
+    ) -> Result<Vec<VkGroupRules>> {
+        let rules_attr = settings.groups_rules_attribute.as_str();
+        let search_filter = format!("({filter})");
+        let base = normalize_dn(base);
+
+        let mut groups = Vec::new();
+        let mut reads = Vec::new();
+        for group_dn in group_dns {
+            let normalized_dn = normalize_dn(group_dn);
+            let in_base = base.is_empty()
+                || normalized_dn == base
+                || normalized_dn.ends_with(format!(",{base}").as_str());
+            if !in_base {
+                continue;
+            }
+
+            if let Some(rules) = group_graph::lookup_rules(group_dn) {
+                groups.push(VkGroupRules {
+                    dn: group_dn.clone(),
+                    rules,
+                });
+                continue;
+            }
+
+            // The ldap handler is multiplexed, so its clones send the reads
+            // of the uncached groups concurrently on the same connection.
+            debug!("reading ldap group '{group_dn}' with filter='{search_filter}'");
+            reads.push(read_group_rules(
+                self.ldap_handler.clone(),
+                group_dn,
+                search_filter.as_str(),
+                rules_attr,
+                timeout,
+            ));
+        }
+
+        for (group_dn, res) in future::join_all(reads).await {
+            let rules = res?;
+            group_graph::store_rules(&group_dn, &rules);
+            groups.push(VkGroupRules {
+                dn: group_dn,
+                rules,
+            });
+        }
+
+        Ok(groups)
     }
 
     /// Helper function to perform admin bind and compute base/filter for group searches
@@ -355,18 +1162,7 @@ impl VkLdapConnection {
         timeout: Duration,
     ) -> Result<(&'a str, &'a str)> {
         // Admin bind if credentials are configured
-        if let Some(bind_dn) = &settings.search_bind_dn {
-            if let Some(bind_passwd) = &settings.search_bind_passwd {
-                debug!("running ldap admin bind with DN='{bind_dn}'");
-                handle_ldap_error!(
-                    self.ldap_handler
-                        .with_timeout(timeout)
-                        .simple_bind(&bind_dn, &bind_passwd)
-                        .await,
-                    VkLdapError::LdapAdminBindError
-                );
-            }
-        }
+        self.search_bind(settings, timeout).await?;
 
         // Determine search base
         let base = settings
@@ -384,6 +1180,63 @@ impl VkLdapConnection {
         Ok((base, filter))
     }
 
+    /// Streams the groups of `search_filter`, `ldap.groups_search_page_size`
+    /// groups per page, and passes each group to `on_group` as it arrives.
+    /// Fails if more than `size_limit` groups match, unless it is `0`.
+    async fn for_each_group<F>(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        search_filter: &str,
+        attrs: Vec<&str>,
+        size_limit: i32,
+        controls: Vec<RawControl>,
+        timeout: Duration,
+        mut on_group: F,
+    ) -> Result<()>
+    where
+        F: FnMut(SearchEntry),
+    {
+        let page_size = settings.groups_search_page_size;
+        let mut adapters: Vec<Box<dyn Adapter<_, _>>> = vec![Box::new(EntriesOnly::new())];
+        if page_size > 0 {
+            adapters.push(Box::new(PagedResults::new(page_size)));
+        }
+
+        // The timeout applies to each page
+        let ldap = self.ldap_handler.with_timeout(timeout);
+        if size_limit > 0 {
+            ldap.with_search_options(SearchOptions::new().sizelimit(size_limit));
+        }
+        if !controls.is_empty() {
+            ldap.with_controls(controls);
+        }
+        let mut stream = ldap
+            .streaming_search_with(adapters, base, settings.search_scope, search_filter, attrs)
+            .await
+            .map_err(streaming_search_error)?;
+
+        let mut count = 0;
+        while let Some(entry) = stream.next().await.map_err(streaming_search_error)? {
+            count += 1;
+            if size_limit > 0 && count > size_limit {
+                let msgid = stream.last_id();
+                let _ = stream.ldap_handle().abandon(msgid).await;
+                return Err(VkLdapError::GroupSearchSizeLimitExceeded(size_limit));
+            }
+            on_group(SearchEntry::construct(entry));
+        }
+
+        match stream.finish().await.success() {
+            Ok(_) => Ok(()),
+            // sizeLimitExceeded
+            Err(LdapError::LdapResult { result }) if result.rc == 4 => {
+                Err(VkLdapError::GroupSearchSizeLimitExceeded(size_limit))
+            }
+            Err(err) => Err(VkLdapError::LdapSearchError(err)),
+        }
+    }
+
     pub async fn search_groups(
         &mut self,
         settings: &VkLdapSettings,
@@ -392,91 +1245,501 @@ impl VkLdapConnection {
     ) -> Result<Vec<String>> {
         let (base, filter) = self.prepare_group_search(settings, timeout).await?;
 
-        let member_attr = &settings.groups_member_attribute;
-        let name_attr = &settings.groups_name_attribute;
+        let name_attr = settings.groups_name_attribute.as_str();
 
-        let search_filter = format!(
-            "(&({filter})({member_attr}={}))",
-            ldap3::ldap_escape(user_dn)
-        );
+        let search_filter = member_groups_filter(settings, filter, user_dn);
         let scope = settings.search_scope;
 
         debug!(
             "running ldap group search with filter='{search_filter}' scope='{:?}' attrs='{name_attr}'",
             scope
         );
-        let (rs, _res) = handle_ldap_error!(
-            self.ldap_handler
-                .with_timeout(timeout)
-                .search(base, scope, search_filter.as_str(), vec![name_attr])
-                .await,
-            VkLdapError::LdapSearchError
-        );
-
         let mut groups: Vec<String> = Vec::new();
-        for entry in rs.into_iter() {
-            let sentry = SearchEntry::construct(entry);
-            if let Some(vals) = sentry.attrs.get(name_attr) {
-                for v in vals {
-                    groups.push(v.clone());
+        self.for_each_group(
+            settings,
+            base,
+            search_filter.as_str(),
+            vec![name_attr],
+            settings.groups_search_size_limit,
+            Vec::new(),
+            timeout,
+            |mut sentry| groups.extend(sentry.attrs.remove(name_attr).unwrap_or_default()),
+        )
+        .await?;
+
+        Ok(groups)
+    }
+
+    /// Returns the groups that `member_dn` is a member of, with their ACL
+    /// rule tokens.
+    async fn search_member_groups(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        filter: &str,
+        member_dn: &str,
+        timeout: Duration,
+    ) -> Result<Vec<VkGroupRules>> {
+        let rules_attr = settings.groups_rules_attribute.as_str();
+
+        let search_filter = member_groups_filter(settings, filter, member_dn);
+        let scope = settings.search_scope;
+
+        debug!(
+            "running ldap group rules search with filter='{search_filter}' scope='{:?}' attrs='{rules_attr}'",
+            scope
+        );
+        let mut groups = Vec::new();
+        self.for_each_group(
+            settings,
+            base,
+            search_filter.as_str(),
+            vec![rules_attr],
+            settings.groups_search_size_limit,
+            Vec::new(),
+            timeout,
+            |sentry| {
+                let mut rules = Vec::new();
+                for v in sentry.attrs.get(rules_attr).into_iter().flatten() {
+                    merge_rule_tokens(&mut rules, v.split_whitespace());
                 }
-            }
-        }
+                groups.push(VkGroupRules {
+                    dn: sentry.dn,
+                    rules,
+                });
+            },
+        )
+        .await?;
+
         Ok(groups)
     }
 
+    /// Returns the groups that contain `groups`, directly or through nested
+    /// groups.
+    async fn search_parent_groups(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        filter: &str,
+        groups: Vec<VkGroupRules>,
+        timeout: Duration,
+    ) -> Result<Vec<VkGroupRules>> {
+        let search = VkMemberGroupsSearch {
+            conn: self,
+            settings,
+            base,
+            filter,
+            timeout,
+        };
+        walk_parent_groups(groups, search).await
+    }
+
+    /// Returns the ACL rules of the groups of `user_dn`. When the groups are
+    /// read from the user entry, `member_of` are the groups returned by the
+    /// search of the user, if any.
     pub async fn search_groups_rules(
         &mut self,
         settings: &VkLdapSettings,
         user_dn: &str,
+        member_of: Option<&[String]>,
         timeout: Duration,
     ) -> Result<Vec<String>> {
         let (base, filter) = self.prepare_group_search(settings, timeout).await?;
+        let _timer = VkPhaseTimer::start(VkAuthPhase::GroupRulesSearch);
+
+        let groups = match &settings.groups_member_of_attribute {
+            Some(member_of_attr) => {
+                let member_of = match member_of {
+                    Some(member_of) => member_of.to_vec(),
+                    None => {
+                        self.read_member_of(user_dn, member_of_attr, timeout)
+                            .await?
+                    }
+                };
+                self.read_groups_rules(settings, base, filter, &member_of, timeout)
+                    .await?
+            }
+            None => {
+                self.search_member_groups(settings, base, filter, user_dn, timeout)
+                    .await?
+            }
+        };
 
-        let member_attr = &settings.groups_member_attribute;
-        let rules_attr = &settings.groups_rules_attribute;
+        self.resolve_groups_rules(settings, base, filter, groups, timeout)
+            .await
+    }
 
-        let search_filter = format!(
-            "(&({filter})({member_attr}={}))",
-            ldap3::ldap_escape(user_dn)
-        );
+    /// Merges the ACL rules of `groups`, and of the groups that contain them
+    /// when nested groups are walked.
+    async fn resolve_groups_rules(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        filter: &str,
+        mut groups: Vec<VkGroupRules>,
+        timeout: Duration,
+    ) -> Result<Vec<String>> {
+        // The in-chain matching rule does not apply to the groups read from
+        // the user entry, their parents are searched instead
+        let walk_graph = match settings.groups_nesting {
+            LdapGroupNesting::Direct => false,
+            LdapGroupNesting::Graph => true,
+            LdapGroupNesting::InChain => settings.groups_member_of_attribute.is_some(),
+        };
+        if walk_graph {
+            let ancestors = self
+                .search_parent_groups(settings, base, filter, groups.clone(), timeout)
+                .await?;
+            groups.extend(ancestors);
+        }
+
+        let mut rules: Vec<String> = Vec::new();
+        for group in groups.iter() {
+            merge_rule_tokens(&mut rules, group.rules.iter().map(|rule| rule.as_str()));
+        }
+        Ok(rules)
+    }
+
+    /// Returns the ACL rules of the groups of each of `user_dns`, by normalized
+    /// user DN, with a single search of the groups that have any of the users
+    /// as a direct member.
+    ///
+    /// Returns `None` if the server did not return all the members of some
+    /// group at once, as then the groups of each user must be searched on
+    /// their own.
+    pub async fn search_members_groups_rules(
+        &mut self,
+        settings: &VkLdapSettings,
+        user_dns: &[String],
+        timeout: Duration,
+    ) -> Result<Option<HashMap<String, Vec<String>>>> {
+        let (base, filter) = self.prepare_group_search(settings, timeout).await?;
+        let _timer = VkPhaseTimer::start(VkAuthPhase::GroupRulesSearch);
+
+        let member_attr = settings.groups_member_attribute.as_str();
+        let rules_attr = settings.groups_rules_attribute.as_str();
+
+        let members_filter: String = user_dns
+            .iter()
+            .map(|user_dn| format!("({member_attr}={})", ldap3::ldap_escape(user_dn)))
+            .collect();
+        let search_filter = format!("(&({filter})(|{members_filter}))");
         let scope = settings.search_scope;
 
+        // The size limit applies to the groups of each user
+        let size_limit = settings
+            .groups_search_size_limit
+            .saturating_mul(user_dns.len() as i32);
+
         debug!(
-            "running ldap group rules search with filter='{search_filter}' scope='{:?}' attrs='{rules_attr}'",
+            "running ldap batched group rules search of {} users with scope='{:?}'",
+            user_dns.len(),
             scope
         );
-        let (rs, _res) = handle_ldap_error!(
-            self.ldap_handler
-                .with_timeout(timeout)
-                .search(base, scope, search_filter.as_str(), vec![rules_attr])
-                .await,
-            VkLdapError::LdapSearchError
-        );
+        let mut groups = Vec::new();
+        let mut ranged = false;
+        self.for_each_group(
+            settings,
+            base,
+            search_filter.as_str(),
+            vec![member_attr, rules_attr],
+            size_limit,
+            vec![matched_values_control(member_attr, user_dns)],
+            timeout,
+            |mut sentry| {
+                let (members, next) = take_members(&mut sentry.attrs, member_attr);
+                ranged |= next.is_some();
+                let mut rules = Vec::new();
+                for v in sentry.attrs.get(rules_attr).into_iter().flatten() {
+                    merge_rule_tokens(&mut rules, v.split_whitespace());
+                }
+                groups.push(VkGroupMembers {
+                    members,
+                    dn: sentry.dn,
+                    rules,
+                });
+            },
+        )
+        .await?;
 
-        use std::collections::HashSet;
-        let mut rules: Vec<String> = Vec::new();
-        let mut seen: HashSet<String> = HashSet::new();
-        for entry in rs.into_iter() {
-            let sentry = SearchEntry::construct(entry);
-            if let Some(vals) = sentry.attrs.get(rules_attr) {
-                for v in vals {
-                    for tok in v.split_whitespace() {
-                        let t = tok.trim();
-                        if !t.is_empty() {
-                            let ts = t.to_string();
-                            if seen.insert(ts.clone()) {
-                                rules.push(ts);
-                            }
-                        }
-                    }
+        if ranged {
+            debug!("the members of some groups were returned as ranges, not batching");
+            return Ok(None);
+        }
+
+        let mut rules_by_user = HashMap::new();
+        for (user_dn, groups) in group_batch::groups_by_member(user_dns, groups) {
+            let rules = self
+                .resolve_groups_rules(settings, base, filter, groups, timeout)
+                .await?;
+            rules_by_user.insert(user_dn, rules);
+        }
+        Ok(Some(rules_by_user))
+    }
+
+    /// Pages through all the groups, and returns the members and the ACL rule
+    /// tokens of each group. The size limit of the group searches does not
+    /// apply, as all the groups are expected.
+    pub async fn search_all_groups_rules(
+        &mut self,
+        settings: &VkLdapSettings,
+        timeout: Duration,
+    ) -> Result<Vec<VkGroupMembers>> {
+        let (base, filter) = self.prepare_group_search(settings, timeout).await?;
+
+        let member_attr = settings.groups_member_attribute.as_str();
+        let rules_attr = settings.groups_rules_attribute.as_str();
+
+        let search_filter = format!("({filter})");
+        let scope = settings.search_scope;
+
+        debug!(
+            "running ldap paged group search with filter='{search_filter}' scope='{:?}' page_size={}",
+            scope, settings.groups_search_page_size
+        );
+        let mut groups = Vec::new();
+        // The groups whose members were returned in ranges, and the start of
+        // their next range
+        let mut ranged = Vec::new();
+        self.for_each_group(
+            settings,
+            base,
+            search_filter.as_str(),
+            vec![member_attr, rules_attr],
+            0,
+            Vec::new(),
+            timeout,
+            |mut sentry| {
+                let (members, next) = take_members(&mut sentry.attrs, member_attr);
+                if let Some(next) = next {
+                    ranged.push((groups.len(), next));
                 }
-            }
+                let mut rules = Vec::new();
+                for v in sentry.attrs.get(rules_attr).into_iter().flatten() {
+                    merge_rule_tokens(&mut rules, v.split_whitespace());
+                }
+                groups.push(VkGroupMembers {
+                    members,
+                    dn: sentry.dn,
+                    rules,
+                });
+            },
+        )
+        .await?;
+
+        for (pos, next) in ranged {
+            let group = &mut groups[pos];
+            let members = self
+                .read_member_ranges(&group.dn, member_attr, next, timeout)
+                .await?;
+            group.members.extend(members);
         }
-        Ok(rules)
+
+        Ok(groups)
+    }
+
+    /// Starts an RFC 4533 content synchronization of the entries of `base`,
+    /// resuming from `cookie` when given. The search does not time out, as
+    /// it keeps running to send the changes of the entries.
+    pub async fn content_sync(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        attrs: Vec<String>,
+        cookie: Option<Vec<u8>>,
+    ) -> Result<SearchStream<'static, String, Vec<String>>> {
+        self.search_bind(settings, settings.timeout_ldap_operation)
+            .await?;
+
+        debug!(
+            "running ldap content sync with base='{base}' resume={}",
+            cookie.is_some()
+        );
+        self.ldap_handler
+            .with_controls(SyncRequest {
+                mode: RefreshMode::RefreshAndPersist,
+                cookie,
+                reload_hint: false,
+            })
+            .streaming_search(base, Scope::Subtree, "(objectClass=*)", attrs)
+            .await
+            .map_err(streaming_search_error)
+    }
+
+    /// Starts a persistent search of the entries of `base`, for the servers
+    /// that do not support the content synchronization. The search does not
+    /// time out, as it keeps running to send the changes of the entries.
+    pub async fn persistent_search(
+        &mut self,
+        settings: &VkLdapSettings,
+        base: &str,
+        attrs: Vec<String>,
+    ) -> Result<SearchStream<'static, String, Vec<String>>> {
+        self.search_bind(settings, settings.timeout_ldap_operation)
+            .await?;
+
+        debug!("running ldap persistent search with base='{base}'");
+        self.ldap_handler
+            .with_controls(persistent_search_control())
+            .streaming_search(base, Scope::Subtree, "(objectClass=*)", attrs)
+            .await
+            .map_err(streaming_search_error)
+    }
+
+    /// Asks the server to abandon the last operation sent through this
+    /// connection, when its result is no longer awaited.
+    pub async fn abandon_last_operation(&mut self) {
+        let msgid = self.ldap_handler.last_id();
+        let _ = self.ldap_handler.abandon(msgid).await;
     }
 
     pub async fn close(&mut self) {
         let _ = self.ldap_handler.unbind().await;
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn group(dn: &str, rules: &[&str]) -> VkGroupRules {
+        VkGroupRules {
+            dn: dn.to_string(),
+            rules: rules.iter().map(|rule| rule.to_string()).collect(),
+        }
+    }
+
+    /// Parent groups searches in a directory of `(group, parents)`.
+    struct VkTestDirectory {
+        parents: HashMap<&'static str, Vec<VkGroupRules>>,
+        searches: Vec<String>,
+    }
+
+    impl VkParentGroupsSearch for &mut VkTestDirectory {
+        async fn search_parents(&mut self, group_dn: &str) -> Result<Vec<VkGroupRules>> {
+            self.searches.push(group_dn.to_string());
+            Ok(self.parents.get(group_dn).cloned().unwrap_or_default())
+        }
+    }
+
+    #[test]
+    fn test_walk_parent_groups() {
+        let rt = tokio::runtime::Builder::new_current_thread()
+            .build()
+            .unwrap();
+        group_graph::refresh_settings(Duration::from_secs(60), 1000);
+
+        // A team in a department, which is in a division that is also a
+        // member of the team
+        let mut directory = VkTestDirectory {
+            parents: HashMap::from([
+                ("cn=walk-team", vec![group("cn=walk-dept", &["+@read"])]),
+                ("cn=walk-dept", vec![group("cn=walk-division", &["+@all"])]),
+                ("cn=walk-division", vec![group("cn=walk-team", &[])]),
+            ]),
+            searches: Vec::new(),
+        };
+
+        let res = rt.block_on(walk_parent_groups(
+            vec![group("cn=walk-team", &[])],
+            &mut directory,
+        ));
+        let ancestors = res.unwrap_or_default();
+        let ancestor_dns: Vec<&str> = ancestors.iter().map(|group| group.dn.as_str()).collect();
+        assert_eq!(ancestor_dns, vec!["cn=walk-dept", "cn=walk-division"]);
+        assert_eq!(
+            directory.searches,
+            vec!["cn=walk-team", "cn=walk-dept", "cn=walk-division"]
+        );
+
+        // The parents are now taken from the group graph
+        directory.searches.clear();
+        let res = rt.block_on(walk_parent_groups(
+            vec![group("CN=Walk-Team", &[])],
+            &mut directory,
+        ));
+        assert_eq!(res.unwrap_or_default().len(), 2);
+        assert!(directory.searches.is_empty());
+    }
+
+    #[test]
+    fn test_matched_values_control() {
+        let control = matched_values_control("member", &["cn=u1".to_string()]);
+        assert_eq!(control.ctype, MATCHED_VALUES_OID);
+        assert!(!control.crit);
+        assert_eq!(
+            control.val.unwrap(),
+            b"\x30\x11\xa3\x0f\x04\x06member\x04\x05cn=u1".to_vec()
+        );
+
+        // Long values use the long form of the length
+        let value = "x".repeat(200);
+        assert_eq!(ber_encode(0x04, value.as_bytes())[..3], [0x04, 0x81, 200]);
+    }
+
+    #[test]
+    fn test_persistent_search_controls() {
+        let control = persistent_search_control();
+        assert_eq!(control.ctype, PERSISTENT_SEARCH_OID);
+        assert!(control.crit);
+        assert_eq!(
+            control.val.unwrap(),
+            b"\x30\x09\x02\x01\x0f\x01\x01\x00\x01\x01\xff".to_vec()
+        );
+
+        let notification = |val: &[u8]| {
+            vec![Control(
+                None,
+                RawControl {
+                    ctype: ENTRY_CHANGE_NOTIFICATION_OID.to_string(),
+                    crit: false,
+                    val: Some(val.to_vec()),
+                },
+            )]
+        };
+        let change = entry_change(&notification(b"\x30\x03\x0a\x01\x04")).unwrap();
+        assert_eq!(change.change_type, VkEntryChangeType::Modify);
+        assert_eq!(change.previous_dn, None);
+
+        let change = entry_change(&notification(
+            b"\x30\x0e\x0a\x01\x08\x04\x06cn=old\x02\x01\x07",
+        ))
+        .unwrap();
+        assert_eq!(change.change_type, VkEntryChangeType::ModDn);
+        assert_eq!(change.previous_dn.as_deref(), Some("cn=old"));
+
+        // Entries of the initial content, and truncated notifications
+        assert!(entry_change(&[]).is_none());
+        assert!(entry_change(&notification(b"\x30\x03\x0a\x01")).is_none());
+    }
+
+    #[test]
+    fn test_take_ranged_members() {
+        let mut attrs = HashMap::from([
+            ("member".to_string(), vec!["cn=user1".to_string()]),
+            ("valkeyACL".to_string(), vec!["+@all".to_string()]),
+        ]);
+        assert_eq!(
+            take_members(&mut attrs, "member"),
+            (vec!["cn=user1".to_string()], None)
+        );
+
+        let mut attrs = HashMap::from([(
+            "Member;Range=0-1499".to_string(),
+            vec!["cn=user1".to_string()],
+        )]);
+        assert_eq!(
+            take_members(&mut attrs, "member"),
+            (vec!["cn=user1".to_string()], Some(1500))
+        );
+        assert!(attrs.is_empty());
+
+        // The last range ends with '*'
+        let mut attrs =
+            HashMap::from([("member;range=1500-*".to_string(), vec!["cn=u2".to_string()])]);
+        assert_eq!(
+            take_members(&mut attrs, "member"),
+            (vec!["cn=u2".to_string()], None)
+        );
+    }
+}
@@ -1,33 +1,53 @@
+use arc_swap::ArcSwap;
 use lazy_static::lazy_static;
-use std::{sync::Arc, time::Duration};
+use std::{
+    collections::HashMap,
+    sync::{Arc, Mutex},
+    time::{Duration, Instant},
+};
 
-use log::{debug, info};
+use log::{debug, error, info};
 use tokio::sync::Mutex as TokioMutex;
-use tokio::sync::Mutex;
 use url::Url;
 
+use crate::configs::LdapGroupNesting;
+
 use super::{
     Result,
-    connection::{VkConnectionPool, VkLdapConnection, VkLdapPoolConnection},
+    balancer::{self, VkServerLoadGuard},
+    breaker::VkCircuitState,
+    connection::{
+        VkConnectionPool, VkGroupMembers, VkLdapConnection, VkLdapPoolConnection, VkPoolKind,
+        VkPoolStats, VkUserEntry, normalize_dn,
+    },
+    dn_cache,
     errors::VkLdapError,
+    group_batch, group_index,
+    group_rules::{self, CachedGroupRules},
+    hedging,
+    metrics::{VkAuthPhase, VkPhaseTimer},
     server::{VkLdapServer, VkLdapServerStatus},
     settings::{VkConnectionSettings, VkLdapSettings},
+    slowlog,
 };
 
+#[derive(Clone)]
 struct VkLdapContext {
     servers: Vec<VkLdapServer>,
-    conn_pools: Vec<Arc<VkConnectionPool>>,
-    ldap_settings: VkLdapSettings,
-    connection_settings: VkConnectionSettings,
+    bind_pools: Vec<Arc<VkConnectionPool>>,
+    search_pools: Vec<Arc<VkConnectionPool>>,
+    ldap_settings: Arc<VkLdapSettings>,
+    connection_settings: Arc<VkConnectionSettings>,
 }
 
 impl VkLdapContext {
     fn new() -> VkLdapContext {
         VkLdapContext {
             servers: Vec::new(),
-            conn_pools: Vec::new(),
-            ldap_settings: VkLdapSettings::default(),
-            connection_settings: VkConnectionSettings::default(),
+            bind_pools: Vec::new(),
+            search_pools: Vec::new(),
+            ldap_settings: Arc::new(VkLdapSettings::default()),
+            connection_settings: Arc::new(VkConnectionSettings::default()),
         }
     }
 
@@ -35,31 +55,32 @@ impl VkLdapContext {
         *self = VkLdapContext::new();
     }
 
-    fn get_ldap_settings(&self) -> VkLdapSettings {
-        self.ldap_settings.clone()
+    fn get_ldap_settings(&self) -> Arc<VkLdapSettings> {
+        Arc::clone(&self.ldap_settings)
     }
 
-    fn get_connection_settings(&self) -> VkConnectionSettings {
-        self.connection_settings.clone()
+    fn get_connection_settings(&self) -> Arc<VkConnectionSettings> {
+        Arc::clone(&self.connection_settings)
     }
 
     fn refresh_ldap_settings(&mut self, settings: VkLdapSettings) {
-        self.ldap_settings = settings
+        self.ldap_settings = Arc::new(settings)
     }
 
     fn refresh_connection_settings(&mut self, settings: VkConnectionSettings) {
-        self.connection_settings = settings;
+        self.connection_settings = Arc::new(settings);
     }
 
     fn clear_server_list(&mut self) -> Vec<Arc<VkConnectionPool>> {
         self.servers.clear();
 
-        let mut pools = Vec::with_capacity(self.conn_pools.len());
-        for pool in self.conn_pools.iter() {
+        let mut pools = Vec::with_capacity(self.bind_pools.len() + self.search_pools.len());
+        for pool in self.bind_pools.iter().chain(self.search_pools.iter()) {
             pools.push(Arc::clone(pool));
         }
 
-        self.conn_pools.clear();
+        self.bind_pools.clear();
+        self.search_pools.clear();
         pools
     }
 
@@ -68,13 +89,26 @@ impl VkLdapContext {
         VkLdapServer::new(server_url, server_id, VkLdapServerStatus::HEALTHY)
     }
 
-    fn add_server(&mut self, server: VkLdapServer, pool: VkConnectionPool) {
+    fn add_server(
+        &mut self,
+        server: VkLdapServer,
+        bind_pool: VkConnectionPool,
+        search_pool: VkConnectionPool,
+    ) {
         self.servers.push(server);
-        self.conn_pools.push(Arc::new(pool));
+        self.bind_pools.push(Arc::new(bind_pool));
+        self.search_pools.push(Arc::new(search_pool));
     }
 
-    fn get_connection_pool(&self, server: &VkLdapServer) -> Arc<VkConnectionPool> {
-        Arc::clone(&self.conn_pools[server.get_id()])
+    fn get_connection_pool(
+        &self,
+        server: &VkLdapServer,
+        kind: VkPoolKind,
+    ) -> Arc<VkConnectionPool> {
+        match kind {
+            VkPoolKind::Bind => Arc::clone(&self.bind_pools[server.get_id()]),
+            VkPoolKind::Search => Arc::clone(&self.search_pools[server.get_id()]),
+        }
     }
 
     fn get_current_servers(&self) -> Vec<VkLdapServer> {
@@ -107,48 +141,116 @@ impl VkLdapContext {
             server.set_status(status);
         }
 
+        if let Some(ping_time) = ping_time {
+            server.get_load().observe_latency(ping_time);
+        }
         server.set_ping_time(ping_time)
     }
 
-    fn find_server(&self) -> Result<VkLdapServer> {
+    /// Returns the server of the next operation, and whether the operation is
+    /// a trial of a server whose circuit breaker is half-open.
+    fn find_server(&self) -> Result<(VkLdapServer, bool)> {
         if self.servers.is_empty() {
             return Err(VkLdapError::NoServerConfigured);
         }
 
-        for server in self.servers.iter() {
-            if server.is_healthy() {
-                return Ok(server.clone());
+        let healthy: Vec<&VkLdapServer> = self.servers.iter().filter(|s| s.is_healthy()).collect();
+
+        for server in healthy.iter() {
+            if server.get_breaker().try_start_trial() {
+                return Ok(((*server).clone(), true));
             }
         }
 
-        Err(VkLdapError::NoHealthyServerAvailable)
+        let closed: Vec<&VkLdapServer> = healthy
+            .into_iter()
+            .filter(|s| s.get_circuit_state() == VkCircuitState::Closed)
+            .collect();
+        if closed.is_empty() {
+            return Err(VkLdapError::NoHealthyServerAvailable);
+        }
+
+        Ok((balancer::select_server(&closed).clone(), false))
+    }
+
+    /// Returns the healthy servers whose circuit breaker is closed.
+    fn get_available_servers(&self) -> Vec<VkLdapServer> {
+        self.servers
+            .iter()
+            .filter(|s| s.is_healthy() && s.get_circuit_state() == VkCircuitState::Closed)
+            .cloned()
+            .collect()
+    }
+
+    /// Returns a healthy server other than `server` to hedge its operations.
+    fn find_hedge_server(&self, server: &VkLdapServer) -> Option<VkLdapServer> {
+        let healthy: Vec<&VkLdapServer> = self
+            .servers
+            .iter()
+            .filter(|s| {
+                s.is_healthy()
+                    && s.get_circuit_state() == VkCircuitState::Closed
+                    && s.get_id() != server.get_id()
+            })
+            .collect();
+        if healthy.is_empty() {
+            return None;
+        }
+
+        Some(balancer::select_server(&healthy).clone())
     }
 }
 
+// The context is an immutable snapshot that is replaced as a whole on every
+// change. Readers load the current snapshot without taking any lock, and
+// writers are serialized by VK_LDAP_CONTEXT_WRITER.
 lazy_static! {
-    static ref VK_LDAP_CONTEXT: Mutex<VkLdapContext> = Mutex::new(VkLdapContext::new());
+    static ref VK_LDAP_CONTEXT: ArcSwap<VkLdapContext> =
+        ArcSwap::from_pointee(VkLdapContext::new());
+    static ref VK_LDAP_CONTEXT_WRITER: Mutex<()> = Mutex::new(());
+}
+
+fn load_context() -> Arc<VkLdapContext> {
+    VK_LDAP_CONTEXT.load_full()
+}
+
+fn update_context<F, R>(update: F) -> R
+where
+    F: FnOnce(&mut VkLdapContext) -> R,
+{
+    let _guard = match VK_LDAP_CONTEXT_WRITER.lock() {
+        Ok(guard) => guard,
+        Err(poisoned) => {
+            error!("LDAP context writer mutex is poisoned, recovering");
+            poisoned.into_inner()
+        }
+    };
+
+    let mut ldap_ctx = VkLdapContext::clone(&VK_LDAP_CONTEXT.load());
+    let res = update(&mut ldap_ctx);
+    VK_LDAP_CONTEXT.store(Arc::new(ldap_ctx));
+    res
 }
 
 pub(super) async fn add_server(server_url: Url) {
-    let mut server;
-    let settings;
-    {
-        let ldap_ctx = VK_LDAP_CONTEXT.lock().await;
-        server = ldap_ctx.new_server(server_url);
-        settings = ldap_ctx.get_connection_settings();
-    }
+    let ldap_ctx = load_context();
+    let mut server = ldap_ctx.new_server(server_url);
+    let settings = ldap_ctx.get_connection_settings();
 
-    let (pool, res) = VkConnectionPool::new(server.clone(), &settings).await;
+    let (bind_pool, bind_res) =
+        VkConnectionPool::new(server.clone(), VkPoolKind::Bind, &settings).await;
+    let (search_pool, search_res) =
+        VkConnectionPool::new(server.clone(), VkPoolKind::Search, &settings).await;
 
-    if let Err(err) = res {
+    if let Err(err) = bind_res.and(search_res) {
         server.set_status(VkLdapServerStatus::UNHEALTHY(err.to_string()));
     }
 
-    VK_LDAP_CONTEXT.lock().await.add_server(server, pool);
+    update_context(|ldap_ctx| ldap_ctx.add_server(server, bind_pool, search_pool));
 }
 
 pub(super) async fn clear_server_list() {
-    let pools = VK_LDAP_CONTEXT.lock().await.clear_server_list();
+    let pools = update_context(|ldap_ctx| ldap_ctx.clear_server_list());
     tokio::spawn(async move {
         for pool in pools.iter() {
             pool.shutdown().await
@@ -157,7 +259,7 @@ pub(super) async fn clear_server_list() {
 }
 
 pub async fn reset_context() {
-    VK_LDAP_CONTEXT.lock().await.reset();
+    update_context(|ldap_ctx| ldap_ctx.reset());
 }
 
 pub async fn refresh_ldap_settings(settings: VkLdapSettings) {
@@ -165,7 +267,7 @@ pub async fn refresh_ldap_settings(settings: VkLdapSettings) {
         "refreshing LDAP settings: search_base={:?}",
         settings.search_base
     );
-    VK_LDAP_CONTEXT.lock().await.refresh_ldap_settings(settings);
+    update_context(|ldap_ctx| ldap_ctx.refresh_ldap_settings(settings));
 }
 
 pub fn refresh_ldap_settings_blocking(settings: VkLdapSettings) {
@@ -173,57 +275,39 @@ pub fn refresh_ldap_settings_blocking(settings: VkLdapSettings) {
         "refreshing LDAP settings (blocking): search_base={:?}",
         settings.search_base
     );
-    // Use try_lock to avoid deadlock - this is called during initialization when no other tasks are running
-    if let Ok(mut ctx) = VK_LDAP_CONTEXT.try_lock() {
-        ctx.refresh_ldap_settings(settings);
-    } else {
-        log::error!("Failed to acquire lock for refreshing LDAP settings");
-    }
+    update_context(|ldap_ctx| ldap_ctx.refresh_ldap_settings(settings));
 }
 
 pub async fn refresh_connection_settings(settings: VkConnectionSettings) {
-    VK_LDAP_CONTEXT
-        .lock()
-        .await
-        .refresh_connection_settings(settings);
+    update_context(|ldap_ctx| ldap_ctx.refresh_connection_settings(settings));
 
-    let servers = VK_LDAP_CONTEXT.lock().await.get_current_servers();
+    let servers = load_context().get_current_servers();
 
     for server in servers {
-        refresh_pool_connections(&server).await
+        let _ = refresh_pool_connections(&server).await;
     }
 }
 
 pub fn refresh_connection_settings_blocking(settings: VkConnectionSettings) {
     debug!("refreshing connection settings (blocking)");
-    // Use try_lock to avoid deadlock - this is called during initialization when no other tasks are running
-    if let Ok(mut ctx) = VK_LDAP_CONTEXT.try_lock() {
-        ctx.refresh_connection_settings(settings);
-    } else {
-        log::error!("Failed to acquire lock for refreshing connection settings");
-    }
+    update_context(|ldap_ctx| ldap_ctx.refresh_connection_settings(settings));
 }
 
 pub(super) async fn get_servers_health_status() -> Vec<VkLdapServer> {
-    VK_LDAP_CONTEXT.lock().await.get_current_servers()
+    load_context().get_current_servers()
 }
 
-pub(super) async fn get_connection(server: &VkLdapServer) -> Result<VkLdapConnection> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_connection_settings();
-    VkLdapConnection::new(&settings, &server).await
+pub(super) fn get_ldap_settings() -> Arc<VkLdapSettings> {
+    load_context().get_ldap_settings()
 }
 
-pub(super) async fn get_pool_connection(server: &VkLdapServer) -> VkLdapPoolConnection {
-    let pool = VK_LDAP_CONTEXT.lock().await.get_connection_pool(server);
-    pool.take_connection().await
+pub(super) fn get_available_servers() -> Vec<VkLdapServer> {
+    load_context().get_available_servers()
 }
 
-pub(super) async fn return_pool_connection(pool_conn: VkLdapPoolConnection) {
-    let pool = VK_LDAP_CONTEXT
-        .lock()
-        .await
-        .get_connection_pool(&pool_conn.server);
-    pool.return_connection(pool_conn).await
+pub(super) async fn get_connection(server: &VkLdapServer) -> Result<VkLdapConnection> {
+    let settings = load_context().get_connection_settings();
+    VkLdapConnection::new(&settings, &server).await
 }
 
 pub(super) async fn update_server_status(
@@ -231,47 +315,161 @@ pub(super) async fn update_server_status(
     status: VkLdapServerStatus,
     ping_time: Option<Duration>,
 ) {
-    VK_LDAP_CONTEXT
-        .lock()
-        .await
-        .update_server_status(server, status, ping_time)
+    update_context(|ldap_ctx| ldap_ctx.update_server_status(server, status, ping_time))
 }
 
-pub(super) async fn refresh_pool_connections(server: &VkLdapServer) {
-    let pool;
-    let settings;
-    {
-        let ldap_ctx = VK_LDAP_CONTEXT.lock().await;
-        pool = ldap_ctx.get_connection_pool(server);
-        settings = ldap_ctx.get_connection_settings();
-    }
+pub(super) async fn refresh_pool_connections(server: &VkLdapServer) -> Result<()> {
+    let ldap_ctx = load_context();
+    let bind_pool = ldap_ctx.get_connection_pool(server, VkPoolKind::Bind);
+    let search_pool = ldap_ctx.get_connection_pool(server, VkPoolKind::Search);
+    let settings = ldap_ctx.get_connection_settings();
 
-    match pool.refresh_connections(&settings).await {
+    let res = bind_pool
+        .refresh_connections(&settings)
+        .await
+        .and(search_pool.refresh_connections(&settings).await);
+
+    match &res {
         Ok(_) => update_server_status(server, VkLdapServerStatus::HEALTHY, None).await,
         Err(err) => {
             update_server_status(server, VkLdapServerStatus::UNHEALTHY(err.to_string()), None).await
         }
     }
+
+    res
+}
+
+/// Returns the stats of the (bind, search) connection pools of each server.
+pub(super) fn get_connection_pool_stats() -> Vec<(VkPoolStats, VkPoolStats)> {
+    let ldap_ctx = load_context();
+    ldap_ctx
+        .bind_pools
+        .iter()
+        .zip(ldap_ctx.search_pools.iter())
+        .map(|(bind_pool, search_pool)| (bind_pool.stats(), search_pool.stats()))
+        .collect()
+}
+
+pub(super) async fn reap_idle_connections() {
+    let ldap_ctx = load_context();
+    for pool in ldap_ctx
+        .bind_pools
+        .iter()
+        .chain(ldap_ctx.search_pools.iter())
+    {
+        pool.reap_idle_connections().await;
+    }
+}
+
+/// The connections used by an LDAP operation on a server.
+///
+/// Connections are taken from the server pools when first needed. At most one
+/// connection is held at a time, so that operations that need connections of
+/// both pools cannot deadlock each other.
+struct VkLdapOpConnections {
+    server: VkLdapServer,
+    bind_pool: Arc<VkConnectionPool>,
+    search_pool: Arc<VkConnectionPool>,
+    held: Option<(VkPoolKind, VkLdapPoolConnection)>,
+}
+
+impl VkLdapOpConnections {
+    fn new(
+        server: VkLdapServer,
+        bind_pool: Arc<VkConnectionPool>,
+        search_pool: Arc<VkConnectionPool>,
+    ) -> VkLdapOpConnections {
+        VkLdapOpConnections {
+            server,
+            bind_pool,
+            search_pool,
+            held: None,
+        }
+    }
+
+    fn get_pool(&self, kind: VkPoolKind) -> &Arc<VkConnectionPool> {
+        match kind {
+            VkPoolKind::Bind => &self.bind_pool,
+            VkPoolKind::Search => &self.search_pool,
+        }
+    }
+
+    async fn take(&mut self, kind: VkPoolKind) -> Result<&mut VkLdapConnection> {
+        let held_kind = self.held.as_ref().map(|(held_kind, _)| *held_kind);
+        if held_kind != Some(kind) {
+            self.release().await;
+            let timer = VkPhaseTimer::start(VkAuthPhase::PoolWait);
+            let pool_conn = self.get_pool(kind).take_connection().await?;
+            drop(timer);
+            self.held = Some((kind, pool_conn));
+        }
+
+        let (_, pool_conn) = self.held.as_mut().expect("a connection should be held");
+        Ok(&mut pool_conn.conn)
+    }
+
+    /// Returns a connection of the bind pool, to verify user credentials
+    async fn bind_conn(&mut self) -> Result<&mut VkLdapConnection> {
+        self.take(VkPoolKind::Bind).await
+    }
+
+    /// Returns a connection of the search pool, to run searches
+    async fn search_conn(&mut self) -> Result<&mut VkLdapConnection> {
+        self.take(VkPoolKind::Search).await
+    }
+
+    async fn release(&mut self) {
+        if let Some((kind, pool_conn)) = self.held.take() {
+            self.get_pool(kind).return_connection(pool_conn).await;
+        }
+    }
 }
 
 async fn run_ldap_op_with_failover<F>(ldap_op: F) -> Result<()>
 where
-    F: AsyncFn(&mut VkLdapConnection) -> Result<()>,
+    F: AsyncFn(&mut VkLdapOpConnections) -> Result<()>,
 {
     loop {
-        let server;
-        let pool;
-        {
-            let ldap_ctx = VK_LDAP_CONTEXT.lock().await;
-            server = ldap_ctx.find_server()?;
-            pool = ldap_ctx.get_connection_pool(&server);
+        let ldap_ctx = load_context();
+        let (server, trial) = ldap_ctx.find_server()?;
+        slowlog::note_attempt(|| server.get_host_string());
+        let mut conns = VkLdapOpConnections::new(
+            server.clone(),
+            ldap_ctx.get_connection_pool(&server, VkPoolKind::Bind),
+            ldap_ctx.get_connection_pool(&server, VkPoolKind::Search),
+        );
+        drop(ldap_ctx);
+
+        let load_guard = VkServerLoadGuard::new(server.get_load());
+        let start = Instant::now();
+        let op_res = ldap_op(&mut conns).await;
+        drop(load_guard);
+
+        // The operations that failed before reaching the server, such as
+        // when the connection pool is exhausted, tell nothing about the server
+        let reached_server = !op_res
+            .as_ref()
+            .is_err_and(|err| err.is_server_unavailable() && !err.is_server_failure());
+        if reached_server {
+            server.get_breaker().record(
+                trial,
+                op_res.as_ref().is_err_and(|err| err.is_server_failure()),
+                start.elapsed(),
+            );
+        } else if trial {
+            server.get_breaker().cancel_trial();
         }
 
-        let mut pool_conn = pool.take_connection().await;
-
-        let op_res = ldap_op(&mut pool_conn.conn).await;
+        tokio::spawn(async move { conns.release().await });
 
-        tokio::spawn(async move { pool.return_connection(pool_conn).await });
+        // Any answer of the server, even a failed authentication, shows that
+        // the server is alive, and spares a health probe
+        if !op_res
+            .as_ref()
+            .is_err_and(|err| err.is_server_unavailable())
+        {
+            server.get_load().record_response();
+        }
 
         if let Err(err) = &op_res {
             if let VkLdapError::LdapConnectionError(_) = err {
@@ -289,47 +487,230 @@ where
     }
 }
 
+/// A read-only search, that can be sent to any of the servers.
+trait VkLdapSearch {
+    type Output;
+
+    async fn run(&self, conn: &mut VkLdapConnection) -> Result<Self::Output>;
+}
+
+/// The search of the DN of a user.
+struct VkUserDnSearch<'a> {
+    settings: &'a VkLdapSettings,
+    username: &'a str,
+}
+
+impl VkLdapSearch for VkUserDnSearch<'_> {
+    type Output = VkUserEntry;
+
+    async fn run(&self, conn: &mut VkLdapConnection) -> Result<VkUserEntry> {
+        conn.search(
+            self.settings,
+            self.username,
+            self.settings.timeout_ldap_operation,
+        )
+        .await
+    }
+}
+
+/// The search of the ACL rules of the groups of a user.
+struct VkGroupRulesSearch<'a> {
+    settings: &'a VkLdapSettings,
+    user_dn: &'a str,
+    member_of: Option<&'a [String]>,
+}
+
+impl VkLdapSearch for VkGroupRulesSearch<'_> {
+    type Output = Vec<String>;
+
+    async fn run(&self, conn: &mut VkLdapConnection) -> Result<Vec<String>> {
+        conn.search_groups_rules(
+            self.settings,
+            self.user_dn,
+            self.member_of,
+            self.settings.timeout_ldap_operation,
+        )
+        .await
+    }
+}
+
+/// Runs the read-only `search` on a search connection of `conns`.
+///
+/// When hedging is enabled and the search takes longer than the usual search
+/// latency of the server, the same search is sent to another healthy server
+/// with an idle search connection. The first answer is used, and the other
+/// search is abandoned.
+async fn hedged_search<S: VkLdapSearch>(
+    conns: &mut VkLdapOpConnections,
+    search: S,
+) -> Result<S::Output> {
+    let server = conns.server.clone();
+    let delay = hedging::hedge_delay(server.get_load());
+
+    let conn = conns.search_conn().await?;
+    let start = Instant::now();
+
+    let Some(delay) = delay else {
+        let res = search.run(conn).await;
+        server.get_load().observe_search_latency(start.elapsed());
+        return res;
+    };
+
+    hedging::count_search();
+
+    let mut primary = Box::pin(search.run(conn));
+    if let Ok(res) = tokio::time::timeout(delay, &mut primary).await {
+        server.get_load().observe_search_latency(start.elapsed());
+        return res;
+    }
+
+    let ldap_ctx = load_context();
+    let hedge_pool = ldap_ctx
+        .find_hedge_server(&server)
+        .map(|hedge_server| ldap_ctx.get_connection_pool(&hedge_server, VkPoolKind::Search));
+    drop(ldap_ctx);
+
+    let hedge_conn = match &hedge_pool {
+        Some(pool) => pool.try_take_connection().await,
+        None => None,
+    };
+
+    let (Some(hedge_pool), Some(mut hedge_conn)) = (hedge_pool, hedge_conn) else {
+        let res = primary.await;
+        server.get_load().observe_search_latency(start.elapsed());
+        return res;
+    };
+
+    let hedge_server = hedge_conn.server.clone();
+    debug!(
+        "hedging search on {} to {}",
+        server.get_url_ref(),
+        hedge_server.get_url_ref()
+    );
+
+    let load_guard = VkServerLoadGuard::new(hedge_server.get_load());
+    let mut hedge = Box::pin(search.run(&mut hedge_conn.conn));
+
+    let (res, hedge_won, hedge_done) = tokio::select! {
+        res = &mut primary => (res, false, false),
+        res = &mut hedge => match res {
+            Ok(res) => (Ok(res), true, true),
+            // A failed hedge cannot do better than the primary search
+            Err(_) => ((&mut primary).await, false, true),
+        },
+    };
+
+    drop(hedge);
+    drop(primary);
+    drop(load_guard);
+
+    hedging::count_hedge(hedge_won);
+    // The latency of a search cancelled by the hedge is at least the elapsed
+    // time
+    server.get_load().observe_search_latency(start.elapsed());
+
+    if hedge_won {
+        hedge_server.get_load().record_response();
+        if let Ok(conn) = conns.search_conn().await {
+            conn.abandon_last_operation().await;
+        }
+    } else if !hedge_done {
+        hedge_conn.conn.abandon_last_operation().await;
+    }
+    tokio::spawn(async move { hedge_pool.return_connection(hedge_conn).await });
+
+    res
+}
+
 #[allow(dead_code)]
 pub(super) async fn ldap_bind(username: String, password: String) -> Result<()> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
-    run_ldap_op_with_failover(async move |conn| {
+    run_ldap_op_with_failover(async move |conns| {
         let prefix = settings.bind_db_prefix.clone();
         let suffix = settings.bind_db_suffix.clone();
         let user_dn = format!("{prefix}{username}{suffix}");
-        conn.bind(
-            user_dn.as_str(),
-            password.as_str(),
-            settings.timeout_ldap_operation,
-        )
-        .await
+        conns
+            .bind_conn()
+            .await?
+            .bind(
+                user_dn.as_str(),
+                password.as_str(),
+                settings.timeout_ldap_operation,
+            )
+            .await
     })
     .await
 }
 
+/// Binds as the user with the DN returned by the search of `username`, and
+/// returns that DN.
+///
+/// The DN is taken from the DN cache when possible. As a server may answer a
+/// bind to a DN that no longer exists with invalid credentials, any failed
+/// bind to a cached DN drops the cache entry, and the search is run again. The
+/// user bind is only retried if the search finds a different DN.
+async fn search_and_bind(
+    conns: &mut VkLdapOpConnections,
+    settings: &VkLdapSettings,
+    username: &str,
+    password: &str,
+) -> Result<VkUserEntry> {
+    let timeout = settings.timeout_ldap_operation;
+
+    let mut cached_bind = None;
+    if let Some(user_dn) = dn_cache::lookup(username) {
+        slowlog::note_user_dn(&user_dn);
+        match conns
+            .bind_conn()
+            .await?
+            .bind(user_dn.as_str(), password, timeout)
+            .await
+        {
+            Ok(_) => {
+                return Ok(VkUserEntry {
+                    dn: user_dn,
+                    member_of: None,
+                });
+            }
+            Err(err) if err.is_server_unavailable() || err.is_server_failure() => {
+                return Err(err);
+            }
+            Err(err) => {
+                debug!("bind to the cached DN '{user_dn}' of user {username} failed: {err}");
+                dn_cache::invalidate(username);
+                cached_bind = Some((user_dn, err));
+            }
+        }
+    }
+
+    let user = hedged_search(conns, VkUserDnSearch { settings, username }).await?;
+    dn_cache::store(username, &user.dn);
+    slowlog::note_user_dn(&user.dn);
+
+    // The credentials were already rejected for this DN
+    if let Some((cached_dn, err)) = cached_bind {
+        if normalize_dn(&cached_dn) == normalize_dn(&user.dn) {
+            return Err(err);
+        }
+    }
+
+    conns
+        .bind_conn()
+        .await?
+        .bind(user.dn.as_str(), password, timeout)
+        .await?;
+    Ok(user)
+}
+
 #[allow(dead_code)]
 pub(super) async fn ldap_search_and_bind(username: String, password: String) -> Result<()> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
-    run_ldap_op_with_failover(async move |conn| {
-        let search_res = conn
-            .search(
-                &settings,
-                username.as_str(),
-                settings.timeout_ldap_operation,
-            )
-            .await;
-        match search_res {
-            Ok(user_dn) => {
-                conn.bind(
-                    user_dn.as_str(),
-                    password.as_str(),
-                    settings.timeout_ldap_operation,
-                )
-                .await
-            }
-            Err(err) => Err(err),
-        }
+    run_ldap_op_with_failover(async move |conns| {
+        search_and_bind(conns, &settings, username.as_str(), password.as_str())
+            .await
+            .map(|_| ())
     })
     .await
 }
@@ -339,24 +720,29 @@ pub(super) async fn ldap_bind_and_groups(
     username: String,
     password: String,
 ) -> Result<Vec<String>> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
     let groups_out: Arc<TokioMutex<Option<Vec<String>>>> = Arc::new(TokioMutex::new(None));
     let groups_out_cl = groups_out.clone();
 
-    run_ldap_op_with_failover(async move |conn| {
+    run_ldap_op_with_failover(async move |conns| {
         let prefix = settings.bind_db_prefix.clone();
         let suffix = settings.bind_db_suffix.clone();
         let user_dn = format!("{prefix}{username}{suffix}");
         // Bind first
-        conn.bind(
-            user_dn.as_str(),
-            password.as_str(),
-            settings.timeout_ldap_operation,
-        )
-        .await?;
+        conns
+            .bind_conn()
+            .await?
+            .bind(
+                user_dn.as_str(),
+                password.as_str(),
+                settings.timeout_ldap_operation,
+            )
+            .await?;
         // Then fetch groups
-        let groups = conn
+        let groups = conns
+            .search_conn()
+            .await?
             .search_groups(&settings, user_dn.as_str(), settings.timeout_ldap_operation)
             .await?;
         let mut guard = groups_out_cl.lock().await;
@@ -373,66 +759,249 @@ pub(super) async fn ldap_search_bind_and_groups(
     username: String,
     password: String,
 ) -> Result<Vec<String>> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
     let groups_out: Arc<TokioMutex<Option<Vec<String>>>> = Arc::new(TokioMutex::new(None));
     let groups_out_cl = groups_out.clone();
 
-    run_ldap_op_with_failover(async move |conn| {
-        let search_res = conn
-            .search(
+    run_ldap_op_with_failover(async move |conns| {
+        let user = search_and_bind(conns, &settings, username.as_str(), password.as_str()).await?;
+        let groups = conns
+            .search_conn()
+            .await?
+            .search_groups(&settings, user.dn.as_str(), settings.timeout_ldap_operation)
+            .await?;
+        let mut guard = groups_out_cl.lock().await;
+        *guard = Some(groups);
+        Ok(())
+    })
+    .await?;
+    let guard = groups_out.lock().await;
+    Ok(guard.clone().unwrap_or_default())
+}
+
+/// Returns the ACL rules of `user_dn`, from the group index or the group rules
+/// cache if possible. `member_of` are the groups read by the search of the
+/// user, if any.
+///
+/// When the cached rules are stale they are still returned, and a refresh is
+/// run in the background.
+///
+/// Without search bind credentials, the searches of the search connections
+/// would be anonymous. The groups are then searched with the bind connection,
+/// still bound as the user, and stale rules are refreshed right away.
+async fn get_group_rules(
+    conns: &mut VkLdapOpConnections,
+    settings: &VkLdapSettings,
+    user_dn: &str,
+    member_of: Option<&[String]>,
+) -> Result<Vec<String>> {
+    if let Some(rules) = group_index::lookup(user_dn) {
+        return Ok(rules);
+    }
+
+    if !settings.has_search_bind() {
+        return get_user_bound_group_rules(conns, settings, user_dn, member_of).await;
+    }
+
+    match group_rules::lookup(user_dn) {
+        Some(CachedGroupRules::Fresh(rules)) => return Ok(rules),
+        Some(CachedGroupRules::Stale(rules)) => {
+            tokio::spawn(refresh_group_rules(user_dn.to_string()));
+            return Ok(rules);
+        }
+        None => (),
+    }
+
+    // Only the searches of the direct groups of the users can be batched
+    let batched = group_batch::is_enabled()
+        && settings.groups_member_of_attribute.is_none()
+        && settings.groups_nesting != LdapGroupNesting::InChain;
+    let batch_rules = match batched {
+        true => group_batch::lookup(user_dn).await?,
+        false => None,
+    };
+
+    let rules = match batch_rules {
+        Some(rules) => rules,
+        None => {
+            let search = VkGroupRulesSearch {
+                settings,
+                user_dn,
+                member_of,
+            };
+            hedged_search(conns, search).await?
+        }
+    };
+    group_rules::store(user_dn, &rules);
+    Ok(rules)
+}
+
+/// Returns the ACL rules of `user_dn`, searched with the bind connection of
+/// `conns` that the user was just bound on.
+async fn get_user_bound_group_rules(
+    conns: &mut VkLdapOpConnections,
+    settings: &VkLdapSettings,
+    user_dn: &str,
+    member_of: Option<&[String]>,
+) -> Result<Vec<String>> {
+    let stale_rules = match group_rules::lookup(user_dn) {
+        Some(CachedGroupRules::Fresh(rules)) => return Ok(rules),
+        Some(CachedGroupRules::Stale(rules)) => Some(rules),
+        None => None,
+    };
+
+    let res = match conns.bind_conn().await {
+        Ok(conn) => {
+            conn.search_groups_rules(
+                settings,
+                user_dn,
+                member_of,
+                settings.timeout_ldap_operation,
+            )
+            .await
+        }
+        Err(err) => Err(err),
+    };
+
+    match (res, stale_rules) {
+        (Ok(rules), Some(_)) => {
+            group_rules::end_refresh(user_dn, Some(&rules));
+            Ok(rules)
+        }
+        (Ok(rules), None) => {
+            group_rules::store(user_dn, &rules);
+            Ok(rules)
+        }
+        (Err(err), Some(rules)) => {
+            debug!("failed to refresh the group rules of {user_dn}: {err}");
+            group_rules::end_refresh(user_dn, None);
+            Ok(rules)
+        }
+        (Err(err), None) => Err(err),
+    }
+}
+
+/// Searches the groups of all of `user_dns` at once, and returns the ACL rules
+/// of each user by normalized user DN.
+pub(super) async fn search_batched_groups_rules(
+    user_dns: Vec<String>,
+) -> Result<Option<HashMap<String, Vec<String>>>> {
+    let settings = load_context().get_ldap_settings();
+
+    let rules_out: Arc<TokioMutex<Option<HashMap<String, Vec<String>>>>> =
+        Arc::new(TokioMutex::new(None));
+    let rules_out_cl = rules_out.clone();
+
+    run_ldap_op_with_failover(async move |conns| {
+        let rules_by_user = conns
+            .search_conn()
+            .await?
+            .search_members_groups_rules(&settings, &user_dns, settings.timeout_ldap_operation)
+            .await?;
+        let mut guard = rules_out_cl.lock().await;
+        *guard = rules_by_user;
+        Ok(())
+    })
+    .await?;
+
+    let rules_by_user = rules_out.lock().await.take();
+    Ok(rules_by_user)
+}
+
+async fn refresh_group_rules(user_dn: String) {
+    debug!("refreshing the cached group rules of {user_dn}");
+    let settings = load_context().get_ldap_settings();
+
+    let rules_out: Arc<TokioMutex<Option<Vec<String>>>> = Arc::new(TokioMutex::new(None));
+    let rules_out_cl = rules_out.clone();
+    let dn = user_dn.clone();
+
+    let res = run_ldap_op_with_failover(async move |conns| {
+        let rules = conns
+            .search_conn()
+            .await?
+            .search_groups_rules(
                 &settings,
-                username.as_str(),
+                dn.as_str(),
+                None,
                 settings.timeout_ldap_operation,
             )
-            .await;
-        match search_res {
-            Ok(user_dn) => {
-                conn.bind(
-                    user_dn.as_str(),
-                    password.as_str(),
-                    settings.timeout_ldap_operation,
-                )
-                .await?;
-                let groups = conn
-                    .search_groups(&settings, user_dn.as_str(), settings.timeout_ldap_operation)
-                    .await?;
-                let mut guard = groups_out_cl.lock().await;
-                *guard = Some(groups);
-                Ok(())
+            .await?;
+        let mut guard = rules_out_cl.lock().await;
+        *guard = Some(rules);
+        Ok(())
+    })
+    .await;
+
+    if let Err(err) = res {
+        debug!("failed to refresh the group rules of {user_dn}: {err}");
+    }
+
+    let rules = rules_out.lock().await.take();
+    group_rules::end_refresh(&user_dn, rules.as_deref());
+}
+
+/// Searches all the groups, through a new connection so that the long running
+/// search does not hold a connection of the pools. The servers are tried in
+/// turn until one of them answers.
+pub(super) async fn search_all_groups_rules() -> Result<Vec<VkGroupMembers>> {
+    let ldap_ctx = load_context();
+    let settings = ldap_ctx.get_ldap_settings();
+    let servers = ldap_ctx.get_available_servers();
+    drop(ldap_ctx);
+
+    let mut res = Err(VkLdapError::NoHealthyServerAvailable);
+    for server in servers {
+        res = match get_connection(&server).await {
+            Ok(mut conn) => {
+                let res = conn
+                    .search_all_groups_rules(&settings, settings.timeout_ldap_operation)
+                    .await;
+                conn.close().await;
+                res
             }
             Err(err) => Err(err),
+        };
+
+        match &res {
+            Err(VkLdapError::LdapConnectionError(_)) => {
+                let url = server.get_url_ref();
+                debug!("failed to search the groups on {url}, trying the next server");
+            }
+            _ => return res,
         }
-    })
-    .await?;
-    let guard = groups_out.lock().await;
-    Ok(guard.clone().unwrap_or_default())
+    }
+
+    res
 }
 
 pub(super) async fn ldap_bind_and_group_rules(
     username: String,
     password: String,
 ) -> Result<Vec<String>> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
     let rules_out: Arc<TokioMutex<Option<Vec<String>>>> = Arc::new(TokioMutex::new(None));
     let rules_out_cl = rules_out.clone();
 
-    run_ldap_op_with_failover(async move |conn| {
+    run_ldap_op_with_failover(async move |conns| {
         let prefix = settings.bind_db_prefix.clone();
         let suffix = settings.bind_db_suffix.clone();
         let user_dn = format!("{prefix}{username}{suffix}");
+        slowlog::note_user_dn(&user_dn);
         // Bind first
-        conn.bind(
-            user_dn.as_str(),
-            password.as_str(),
-            settings.timeout_ldap_operation,
-        )
-        .await?;
-        // Then fetch rules
-        let rules = conn
-            .search_groups_rules(&settings, user_dn.as_str(), settings.timeout_ldap_operation)
+        conns
+            .bind_conn()
+            .await?
+            .bind(
+                user_dn.as_str(),
+                password.as_str(),
+                settings.timeout_ldap_operation,
+            )
             .await?;
+        // Then fetch rules
+        let rules = get_group_rules(conns, &settings, user_dn.as_str(), None).await?;
         let mut guard = rules_out_cl.lock().await;
         *guard = Some(rules);
         Ok(())
@@ -446,42 +1015,106 @@ pub(super) async fn ldap_search_bind_and_group_rules(
     username: String,
     password: String,
 ) -> Result<Vec<String>> {
-    let settings = VK_LDAP_CONTEXT.lock().await.get_ldap_settings();
+    let settings = load_context().get_ldap_settings();
 
     let rules_out: Arc<TokioMutex<Option<Vec<String>>>> = Arc::new(TokioMutex::new(None));
     let rules_out_cl = rules_out.clone();
 
-    run_ldap_op_with_failover(async move |conn| {
-        let search_res = conn
-            .search(
-                &settings,
-                username.as_str(),
-                settings.timeout_ldap_operation,
-            )
-            .await;
-        match search_res {
-            Ok(user_dn) => {
-                conn.bind(
-                    user_dn.as_str(),
-                    password.as_str(),
-                    settings.timeout_ldap_operation,
-                )
-                .await?;
-                let rules = conn
-                    .search_groups_rules(
-                        &settings,
-                        user_dn.as_str(),
-                        settings.timeout_ldap_operation,
-                    )
-                    .await?;
-                let mut guard = rules_out_cl.lock().await;
-                *guard = Some(rules);
-                Ok(())
-            }
-            Err(err) => Err(err),
-        }
+    run_ldap_op_with_failover(async move |conns| {
+        let user = search_and_bind(conns, &settings, username.as_str(), password.as_str()).await?;
+        let rules = get_group_rules(
+            conns,
+            &settings,
+            user.dn.as_str(),
+            user.member_of.as_deref(),
+        )
+        .await?;
+        let mut guard = rules_out_cl.lock().await;
+        *guard = Some(rules);
+        Ok(())
     })
     .await?;
     let guard = rules_out.lock().await;
     Ok(guard.clone().unwrap_or_default())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use std::sync::atomic::{AtomicBool, Ordering};
+    use std::time::Instant;
+
+    /// Measures the throughput of the context snapshot reads while a writer
+    /// keeps publishing health transitions. Each read loads the snapshot,
+    /// selects a server with `find_server()` and reads the settings, which
+    /// is only the start of an authentication: no connection is taken and no
+    /// LDAP operation is sent. With the round robin policy, `find_server()`
+    /// also increments the `NEXT_SERVER` counter shared by all the workers,
+    /// so the throughput includes the contention on that counter.
+    ///
+    /// Run with `cargo test --release -- --ignored --nocapture`.
+    #[test]
+    #[ignore]
+    fn bench_context_snapshot_reads() {
+        const READS_PER_TASK: usize = 200_000;
+
+        update_context(|ldap_ctx| {
+            for host in ["ldap1", "ldap2", "ldap3"] {
+                let url = Url::parse(&format!("ldap://{host}")).unwrap();
+                let server = ldap_ctx.new_server(url);
+                ldap_ctx.servers.push(server);
+            }
+        });
+
+        for workers in [1, 2, 4, 8] {
+            let rt = tokio::runtime::Builder::new_multi_thread()
+                .worker_threads(workers)
+                .build()
+                .unwrap();
+
+            let stop = Arc::new(AtomicBool::new(false));
+            let writer_stop = Arc::clone(&stop);
+            let writer = std::thread::spawn(move || {
+                let (server, _) = load_context().find_server().ok().unwrap();
+                while !writer_stop.load(Ordering::Relaxed) {
+                    update_context(|ldap_ctx| {
+                        ldap_ctx.update_server_status(&server, VkLdapServerStatus::HEALTHY, None)
+                    });
+                    std::thread::sleep(Duration::from_millis(1));
+                }
+            });
+
+            let start = Instant::now();
+            rt.block_on(async {
+                let tasks: Vec<_> = (0..workers)
+                    .map(|_| {
+                        tokio::spawn(async {
+                            for _ in 0..READS_PER_TASK {
+                                let ldap_ctx = load_context();
+                                let server = ldap_ctx.find_server().ok().unwrap();
+                                let settings = ldap_ctx.get_ldap_settings();
+                                std::hint::black_box((server, settings));
+                            }
+                        })
+                    })
+                    .collect();
+                for task in tasks {
+                    task.await.unwrap();
+                }
+            });
+            let elapsed = start.elapsed();
+
+            stop.store(true, Ordering::Relaxed);
+            writer.join().unwrap();
+
+            let reads = (workers * READS_PER_TASK) as f64;
+            println!(
+                "{workers} worker(s): {:.0} reads/s",
+                reads / elapsed.as_secs_f64()
+            );
+        }
+
+        update_context(|ldap_ctx| ldap_ctx.reset());
+    }
+}
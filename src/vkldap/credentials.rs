@@ -0,0 +1,79 @@
+use std::sync::Mutex;
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::cache::{VkCacheStats, VkLruCache, VkPasswordHash};
+
+struct CachedCredential {
+    password: VkPasswordHash,
+    rules: Vec<String>,
+}
+
+impl CachedCredential {
+    fn new(password: &str, rules: Vec<String>) -> CachedCredential {
+        CachedCredential {
+            password: VkPasswordHash::new(password),
+            rules,
+        }
+    }
+}
+
+lazy_static! {
+    static ref CREDENTIAL_CACHE: Mutex<VkLruCache<CachedCredential>> =
+        Mutex::new(VkLruCache::new(Duration::ZERO, 0));
+}
+
+macro_rules! lock_cache {
+    () => {
+        match CREDENTIAL_CACHE.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("credential cache mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+pub(super) fn refresh_settings(ttl: Duration, max_entries: usize) {
+    lock_cache!().reconfigure(ttl, max_entries);
+}
+
+/// Returns the ACL rules of `username` if the pair (`username`, `password`)
+/// was recently verified against the LDAP server.
+pub(super) fn lookup(username: &str, password: &str) -> Option<Vec<String>> {
+    // Verify the password after releasing the lock to not stall concurrent
+    // lookups, and only return the rules if the entry was not replaced since
+    let cached = lock_cache!()
+        .peek(username)
+        .map(|cred| cred.password.clone());
+    let verified = cached.filter(|hash| hash.verify(password));
+
+    lock_cache!()
+        .get_if(username, |cred| verified.as_ref() == Some(&cred.password))
+        .map(|cred| cred.rules.clone())
+}
+
+pub(super) fn store(username: &str, password: &str, rules: &[String]) {
+    if !lock_cache!().is_enabled() {
+        return ();
+    }
+
+    // Hash the password before taking the lock to not stall concurrent lookups
+    let credential = CachedCredential::new(password, rules.to_vec());
+    lock_cache!().insert(username.to_string(), credential);
+}
+
+pub(super) fn invalidate(username: &str) -> bool {
+    lock_cache!().remove(username)
+}
+
+pub(super) fn clear() -> usize {
+    lock_cache!().clear()
+}
+
+pub(super) fn stats() -> VkCacheStats {
+    lock_cache!().stats()
+}
@@ -0,0 +1,48 @@
+use std::sync::Mutex;
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::cache::{VkCacheStats, VkLruCache};
+
+lazy_static! {
+    static ref DN_CACHE: Mutex<VkLruCache<String>> = Mutex::new(VkLruCache::new(Duration::ZERO, 0));
+}
+
+macro_rules! lock_cache {
+    () => {
+        match DN_CACHE.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("DN cache mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+pub(super) fn refresh_settings(ttl: Duration, max_entries: usize) {
+    lock_cache!().reconfigure(ttl, max_entries);
+}
+
+/// Returns the DN that the search of `username` returned recently.
+pub(super) fn lookup(username: &str) -> Option<String> {
+    lock_cache!().get(username).cloned()
+}
+
+pub(super) fn store(username: &str, user_dn: &str) {
+    lock_cache!().insert(username.to_string(), user_dn.to_string());
+}
+
+pub(super) fn invalidate(username: &str) -> bool {
+    lock_cache!().remove(username)
+}
+
+pub(super) fn clear() -> usize {
+    lock_cache!().clear()
+}
+
+pub(super) fn stats() -> VkCacheStats {
+    lock_cache!().stats()
+}
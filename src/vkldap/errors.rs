@@ -1,10 +1,12 @@
+use std::time::Duration;
+
 use ldap3::LdapError;
 use valkey_module::ValkeyError;
 
 pub enum VkLdapError {
     IOError(String, std::io::Error),
     NoTLSKeyPathSet,
-    TLSError(String, native_tls::Error),
+    TLSError(String, rustls::Error),
     LdapBindError(LdapError),
     LdapAdminBindError(LdapError),
     LdapSearchError(LdapError),
@@ -12,17 +14,68 @@ pub enum VkLdapError {
     LdapServerPingError(LdapError),
     NoLdapEntryFound(String),
     MultipleEntryFound(String),
+    GroupSearchSizeLimitExceeded(i32),
     InvalidDNAttribute(String),
     NoServerConfigured,
     NoHealthyServerAvailable,
     FailedToStopFailuredDetectorThread,
     FailedToShutdownJobScheduler,
-    FailedToSendJobToScheduler(String),
+    ScheduledTaskFailed(String),
     SchedulerNotReady,
+    PoolExhausted(String),
+    ProbeTimeout(Duration),
+    Coalesced(VkLdapErrorSummary),
 }
 
 unsafe impl Send for VkLdapError {}
 
+/// The classes of errors that the callers of a coalesced operation tell apart.
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum VkLdapErrorKind {
+    UserNotFound,
+    InvalidCredentials,
+    /// The connection to the server failed, which makes the server both
+    /// unavailable and failing
+    ConnectionFailure,
+    ServerFailure,
+    ServerUnavailable,
+    Other,
+}
+
+/// What the callers of a coalesced operation need to know about its error.
+/// Unlike the error itself, it can be shared between threads.
+#[derive(Clone, Debug)]
+pub struct VkLdapErrorSummary {
+    pub kind: VkLdapErrorKind,
+    pub result_code: Option<u32>,
+    pub message: String,
+}
+
+impl From<&VkLdapError> for VkLdapErrorSummary {
+    fn from(err: &VkLdapError) -> Self {
+        let kind = if let VkLdapError::Coalesced(summary) = err {
+            summary.kind
+        } else if err.is_user_not_found() {
+            VkLdapErrorKind::UserNotFound
+        } else if err.is_invalid_credentials() {
+            VkLdapErrorKind::InvalidCredentials
+        } else {
+            match (err.is_server_failure(), err.is_server_unavailable()) {
+                (true, true) => VkLdapErrorKind::ConnectionFailure,
+                (true, false) => VkLdapErrorKind::ServerFailure,
+                (false, true) => VkLdapErrorKind::ServerUnavailable,
+                (false, false) => VkLdapErrorKind::Other,
+            }
+        };
+
+        VkLdapErrorSummary {
+            kind,
+            result_code: err.result_code(),
+            message: err.to_string(),
+        }
+    }
+}
+
 fn ldap_error_to_string(ldap_err: &LdapError) -> String {
     let msg = ldap_err.to_string();
     // When using Active Directory LDAP API, some error messages might containing a
@@ -38,6 +91,7 @@ impl VkLdapError {
         match self {
             // User not found in LDAP search
             VkLdapError::NoLdapEntryFound(_) => true,
+            VkLdapError::Coalesced(summary) => summary.kind == VkLdapErrorKind::UserNotFound,
             // Check LDAP bind errors for specific result codes indicating user doesn't exist
             VkLdapError::LdapBindError(ldap_err) => {
                 // Extract the result code from LdapError
@@ -78,16 +132,69 @@ impl VkLdapError {
         }
     }
 
+    /// Returns true if the error indicates that the user exists but LDAP
+    /// rejected the password
+    pub fn is_invalid_credentials(&self) -> bool {
+        match self {
+            VkLdapError::LdapBindError(ldap3::LdapError::LdapResult { result }) => {
+                result.rc == 49 && !self.is_user_not_found()
+            }
+            VkLdapError::Coalesced(summary) => summary.kind == VkLdapErrorKind::InvalidCredentials,
+            _ => false,
+        }
+    }
+
+    /// Returns true if the error shows that the LDAP server failed to serve
+    /// the operation, as opposed to answering it with a rejection
+    pub fn is_server_failure(&self) -> bool {
+        match self {
+            VkLdapError::LdapConnectionError(_) => true,
+            VkLdapError::LdapBindError(ldap3::LdapError::LdapResult { result })
+            | VkLdapError::LdapAdminBindError(ldap3::LdapError::LdapResult { result })
+            | VkLdapError::LdapSearchError(ldap3::LdapError::LdapResult { result }) => {
+                // RFC 4511 result codes: timeLimitExceeded (3), busy (51),
+                // unavailable (52) and other (80)
+                matches!(result.rc, 3 | 51 | 52 | 80)
+            }
+            VkLdapError::Coalesced(summary) => matches!(
+                summary.kind,
+                VkLdapErrorKind::ConnectionFailure | VkLdapErrorKind::ServerFailure
+            ),
+            _ => false,
+        }
+    }
+
+    /// Returns the LDAP result code of the operation that failed, if the
+    /// LDAP server answered it
+    pub fn result_code(&self) -> Option<u32> {
+        match self {
+            VkLdapError::LdapBindError(ldap3::LdapError::LdapResult { result })
+            | VkLdapError::LdapAdminBindError(ldap3::LdapError::LdapResult { result })
+            | VkLdapError::LdapSearchError(ldap3::LdapError::LdapResult { result }) => {
+                Some(result.rc)
+            }
+            VkLdapError::Coalesced(summary) => summary.result_code,
+            _ => None,
+        }
+    }
+
     /// Returns true if the error indicates the LDAP server is unavailable
     /// This is used to distinguish server unavailability from authentication failures
     pub fn is_server_unavailable(&self) -> bool {
-        matches!(
-            self,
-            VkLdapError::NoHealthyServerAvailable
-                | VkLdapError::LdapConnectionError(_)
-                | VkLdapError::NoServerConfigured
-                | VkLdapError::SchedulerNotReady
-        )
+        match self {
+            VkLdapError::Coalesced(summary) => matches!(
+                summary.kind,
+                VkLdapErrorKind::ConnectionFailure | VkLdapErrorKind::ServerUnavailable
+            ),
+            _ => matches!(
+                self,
+                VkLdapError::NoHealthyServerAvailable
+                    | VkLdapError::LdapConnectionError(_)
+                    | VkLdapError::NoServerConfigured
+                    | VkLdapError::SchedulerNotReady
+                    | VkLdapError::PoolExhausted(_)
+            ),
+        }
     }
 }
 
@@ -129,6 +236,12 @@ impl std::fmt::Display for VkLdapError {
             VkLdapError::MultipleEntryFound(filter) => {
                 write!(f, "search filter '{filter}' returned multiple entries")
             }
+            VkLdapError::GroupSearchSizeLimitExceeded(limit) => {
+                write!(
+                    f,
+                    "the group search matched more than {limit} groups. Please check the ldap.groups_search_size_limit config option"
+                )
+            }
             VkLdapError::InvalidDNAttribute(attribute) => {
                 write!(
                     f,
@@ -151,13 +264,23 @@ impl std::fmt::Display for VkLdapError {
                 f,
                 "failed to shutdown job scheduler. Please check the logs for more information"
             ),
-            VkLdapError::FailedToSendJobToScheduler(errmsg) => {
-                write!(f, "failed to send job to scheduler: {errmsg}")
+            VkLdapError::ScheduledTaskFailed(errmsg) => {
+                write!(f, "scheduled task failed: {errmsg}")
             }
             VkLdapError::SchedulerNotReady => write!(
                 f,
                 "LDAP scheduler is not ready. Module may still be initializing"
             ),
+            VkLdapError::PoolExhausted(server) => write!(
+                f,
+                "no connection to LDAP server {server} available in time. The connection pool is exhausted"
+            ),
+            VkLdapError::ProbeTimeout(timeout) => write!(
+                f,
+                "LDAP server did not answer the health probe within {}ms",
+                timeout.as_millis()
+            ),
+            VkLdapError::Coalesced(summary) => write!(f, "{}", summary.message),
         }
     }
 }
@@ -1,53 +1,126 @@
 use lazy_static::lazy_static;
 
+use std::collections::HashMap;
+use std::sync::Mutex;
 use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
-use std::sync::{Arc, Mutex};
-use std::thread;
 use std::time::{Duration, Instant};
 
 use futures::future;
 use log::{debug, error};
+use tokio::sync::Notify;
+use tokio::task::JoinHandle;
+use url::Url;
 
+use super::connection::VkLdapConnection;
 use super::context;
 use super::errors::VkLdapError;
 use super::server::{VkLdapServer, VkLdapServerStatus};
 use super::{Result, scheduler};
 
-async fn check_server_health(server: VkLdapServer) {
-    if server.is_healthy() {
-        let mut pool_conn = context::get_pool_connection(&server).await;
+/// The shortest delay between two iterations of the failure detector.
+const MIN_INTERVAL: Duration = Duration::from_millis(10);
+/// The shortest delay between two reconnection attempts to a server.
+const MIN_RECONNECT_BACKOFF: Duration = Duration::from_millis(100);
+
+/// The health checking state of a server.
+struct VkServerProbe {
+    url: Url,
+    // Dedicated connection, so that probes neither wait for, nor take,
+    // connections from the pools
+    conn: Option<VkLdapConnection>,
+    backoff: Duration,
+    next_attempt: Instant,
+}
+
+impl VkServerProbe {
+    fn new(server: &VkLdapServer) -> VkServerProbe {
+        VkServerProbe {
+            url: server.get_url_ref().clone(),
+            conn: None,
+            backoff: Duration::ZERO,
+            next_attempt: Instant::now(),
+        }
+    }
+
+    /// Pings the server through the probe connection, opening it first if
+    /// needed. Returns the ping time.
+    async fn ping(&mut self, server: &VkLdapServer, timeout: Duration) -> Result<Duration> {
+        let conn = match self.conn.as_mut() {
+            Some(conn) => conn,
+            None => self.conn.insert(context::get_connection(server).await?),
+        };
 
         let now = Instant::now();
-        let res = pool_conn.conn.ping().await;
-        let ping_time = now.elapsed();
-
-        context::return_pool_connection(pool_conn).await;
-
-        if let Err(err) = res {
-            context::update_server_status(
-                &server,
-                VkLdapServerStatus::UNHEALTHY(err.to_string()),
-                None,
-            )
-            .await;
+        let res = match tokio::time::timeout(timeout, conn.ping()).await {
+            Ok(res) => res,
+            Err(_) => Err(VkLdapError::ProbeTimeout(timeout)),
+        };
+
+        match res {
+            Ok(_) => Ok(now.elapsed()),
+            Err(err) => {
+                // The connection is closed when dropped
+                self.conn = None;
+                Err(err)
+            }
+        }
+    }
+
+    fn reset_backoff(&mut self) {
+        self.backoff = Duration::ZERO;
+        self.next_attempt = Instant::now();
+    }
+
+    /// Delays the next reconnection attempt with an exponential backoff,
+    /// randomized to spread the attempts of the different servers.
+    fn schedule_reconnect(&mut self, settings: &VkProbeSettings) {
+        self.backoff = if self.backoff.is_zero() {
+            settings.interval.max(MIN_RECONNECT_BACKOFF)
         } else {
-            context::update_server_status(
-                &server,
-                super::server::VkLdapServerStatus::HEALTHY,
-                Some(ping_time),
-            )
-            .await;
+            (self.backoff * 2).min(settings.max_backoff.max(MIN_RECONNECT_BACKOFF))
+        };
+
+        let jitter = rand::random_range(0.5..=1.0);
+        self.next_attempt = Instant::now() + self.backoff.mul_f64(jitter);
+    }
+}
+
+struct VkProbeSettings {
+    interval: Duration,
+    timeout: Duration,
+    max_backoff: Duration,
+}
+
+async fn check_server_health(
+    server: VkLdapServer,
+    mut probe: VkServerProbe,
+    settings: &VkProbeSettings,
+) -> (usize, VkServerProbe) {
+    if server.is_healthy() {
+        probe.reset_backoff();
+
+        // The server answered an LDAP operation recently
+        if server.get_load().responded_within(settings.interval) {
+            return (server.get_id(), probe);
         }
-    } else {
-        let conn_res = context::get_connection(&server).await;
-
-        match conn_res {
-            Ok(mut conn) => {
-                let res = conn.ping().await;
-                if let Ok(_) = res {
-                    context::refresh_pool_connections(&server).await;
-                }
+
+        match probe.ping(&server, settings.timeout).await {
+            Ok(ping_time) => {
+                context::update_server_status(&server, VkLdapServerStatus::HEALTHY, Some(ping_time))
+                    .await
             }
+            Err(err) => {
+                context::update_server_status(
+                    &server,
+                    VkLdapServerStatus::UNHEALTHY(err.to_string()),
+                    None,
+                )
+                .await
+            }
+        }
+    } else if Instant::now() >= probe.next_attempt {
+        let res = match probe.ping(&server, settings.timeout).await {
+            Ok(_) => context::refresh_pool_connections(&server).await,
             Err(err) => {
                 context::update_server_status(
                     &server,
@@ -55,75 +128,125 @@ async fn check_server_health(server: VkLdapServer) {
                     None,
                 )
                 .await;
+                Err(err)
+            }
+        };
+
+        match res {
+            Ok(_) => probe.reset_backoff(),
+            Err(_) => {
+                probe.schedule_reconnect(settings);
+                let url = server.get_url_ref();
+                debug!(
+                    "next reconnection attempt to {url} in {}ms",
+                    probe.backoff.as_millis()
+                );
             }
         }
     }
+
+    (server.get_id(), probe)
 }
 
-async fn failure_detector_iteration() {
+async fn failure_detector_iteration(
+    probes: &mut HashMap<usize, VkServerProbe>,
+    settings: &VkProbeSettings,
+) {
     let servers = context::get_servers_health_status().await;
 
+    // Forget the probes of the servers that were removed
+    probes.retain(|id, probe| {
+        servers
+            .get(*id)
+            .is_some_and(|server| *server.get_url_ref() == probe.url)
+    });
+
     let mut futures = Vec::new();
 
     for server in servers {
-        futures.push(check_server_health(server));
+        let probe = match probes.remove(&server.get_id()) {
+            Some(probe) => probe,
+            None => VkServerProbe::new(&server),
+        };
+        futures.push(check_server_health(server, probe, settings));
     }
 
-    future::join_all(futures).await;
+    for (id, probe) in future::join_all(futures).await {
+        probes.insert(id, probe);
+    }
+
+    context::reap_idle_connections().await;
+}
+
+async fn failure_detector_loop() {
+    debug!("initiating failure detector");
+
+    let mut probes = HashMap::new();
+
+    loop {
+        let settings = FAILURE_DETECTOR.get_settings();
+        let _ = tokio::time::timeout(settings.interval, FAILURE_DETECTOR.wakeup.notified()).await;
+
+        if FAILURE_DETECTOR.should_stop() {
+            debug!("exiting failure detector loop");
+            return ();
+        }
+
+        failure_detector_iteration(&mut probes, &settings).await;
+    }
 }
 
 struct FailureDetector {
-    thread: Mutex<Option<thread::JoinHandle<()>>>,
+    task: Mutex<Option<JoinHandle<()>>>,
     stop: AtomicBool,
-    interval: AtomicU64,
+    wakeup: Notify,
+    interval_ms: AtomicU64,
+    probe_timeout_ms: AtomicU64,
+    max_backoff_ms: AtomicU64,
 }
 
 impl FailureDetector {
     fn new() -> FailureDetector {
         FailureDetector {
-            thread: Mutex::new(None),
+            task: Mutex::new(None),
             stop: AtomicBool::new(false),
-            interval: AtomicU64::new(1),
+            wakeup: Notify::new(),
+            interval_ms: AtomicU64::new(1000),
+            probe_timeout_ms: AtomicU64::new(1000),
+            max_backoff_ms: AtomicU64::new(30000),
+        }
+    }
+
+    fn get_settings(&self) -> VkProbeSettings {
+        VkProbeSettings {
+            interval: Duration::from_millis(self.interval_ms.load(Ordering::Relaxed))
+                .max(MIN_INTERVAL),
+            timeout: Duration::from_millis(self.probe_timeout_ms.load(Ordering::Relaxed)),
+            max_backoff: Duration::from_millis(self.max_backoff_ms.load(Ordering::Relaxed)),
         }
     }
 
     fn start(&self) {
         self.stop.store(false, Ordering::Release);
-        let mut thread = self.thread.lock().unwrap();
-
-        *thread = Some(thread::spawn(move || {
-            debug!("initiating failure detector thread");
-
-            loop {
-                std::thread::sleep(Duration::from_secs(
-                    FAILURE_DETECTOR.interval.load(Ordering::Relaxed),
-                ));
-
-                if let Err(err) = scheduler::submit_sync_task(failure_detector_iteration()) {
-                    error!("failed to run failure detector iteration: {err}");
-                }
 
-                if FAILURE_DETECTOR.should_stop() {
-                    debug!("exiting failure detector loop");
-                    return ();
-                }
-            }
-        }))
+        match scheduler::spawn_task(failure_detector_loop()) {
+            Ok(handle) => *self.task.lock().unwrap() = Some(handle),
+            Err(err) => error!("failed to start the failure detector: {err}"),
+        }
     }
 
     fn shutdown(&self) -> Result<()> {
         self.stop.store(true, Ordering::Release);
+        self.wakeup.notify_one();
 
-        let mut thread = self.thread.lock().unwrap();
-        let handler_opt = (*thread).take();
+        let task = self.task.lock().unwrap().take();
 
-        if let Some(handler) = handler_opt {
-            match handler.join() {
+        match task {
+            Some(handle) => match scheduler::submit_sync_task(handle)? {
                 Ok(_) => Ok(()),
                 Err(_) => Err(VkLdapError::FailedToStopFailuredDetectorThread),
-            }
-        } else {
-            panic!("failure detector thread should have been initialized");
+            },
+            None => Ok(()),
         }
     }
 
@@ -133,17 +256,61 @@ impl FailureDetector {
 }
 
 lazy_static! {
-    static ref FAILURE_DETECTOR: Arc<FailureDetector> = Arc::new(FailureDetector::new());
+    static ref FAILURE_DETECTOR: FailureDetector = FailureDetector::new();
 }
 
-pub fn start_failure_detector_thread() {
+pub fn start_failure_detector() {
     FAILURE_DETECTOR.start();
 }
 
-pub fn shutdown_failure_detector_thread() -> Result<()> {
+pub fn shutdown_failure_detector() -> Result<()> {
     FAILURE_DETECTOR.shutdown()
 }
 
-pub fn set_failure_detector_interval(interval: u64) {
-    FAILURE_DETECTOR.interval.store(interval, Ordering::Relaxed);
+pub fn refresh_failure_detector_settings(
+    interval: Duration,
+    probe_timeout: Duration,
+    max_backoff: Duration,
+) {
+    let detector = &*FAILURE_DETECTOR;
+    detector
+        .interval_ms
+        .store(interval.as_millis() as u64, Ordering::Relaxed);
+    detector
+        .probe_timeout_ms
+        .store(probe_timeout.as_millis() as u64, Ordering::Relaxed);
+    detector
+        .max_backoff_ms
+        .store(max_backoff.as_millis() as u64, Ordering::Relaxed);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_reconnect_backoff() {
+        let url = Url::parse("ldap://ldap").unwrap();
+        let server = VkLdapServer::new(url, 0, VkLdapServerStatus::HEALTHY);
+        let mut probe = VkServerProbe::new(&server);
+        let settings = VkProbeSettings {
+            interval: Duration::from_secs(1),
+            timeout: Duration::from_secs(1),
+            max_backoff: Duration::from_secs(5),
+        };
+
+        let mut backoffs = Vec::new();
+        for _ in 0..5 {
+            let now = Instant::now();
+            probe.schedule_reconnect(&settings);
+            assert!(probe.next_attempt >= now + probe.backoff / 2);
+            assert!(probe.next_attempt <= Instant::now() + probe.backoff);
+            backoffs.push(probe.backoff.as_secs());
+        }
+        assert_eq!(backoffs, vec![1, 2, 4, 5, 5]);
+
+        probe.reset_backoff();
+        assert!(probe.backoff.is_zero());
+        assert!(probe.next_attempt <= Instant::now());
+    }
 }
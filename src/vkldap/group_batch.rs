@@ -0,0 +1,265 @@
+use std::collections::HashMap;
+use std::mem;
+use std::sync::Mutex;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::Duration;
+
+use futures::channel::oneshot;
+use lazy_static::lazy_static;
+use log::{debug, error};
+
+use super::Result;
+use super::connection::{VkGroupMembers, normalize_dn};
+use super::context;
+use super::errors::{VkLdapError, VkLdapErrorSummary};
+use super::group_graph::VkGroupRules;
+use super::metrics;
+
+/// The answer to a lookup of a batch: the ACL rules of the user, or `None` if
+/// the user must be searched on its own.
+type VkBatchResult = std::result::Result<Option<Vec<String>>, VkLdapErrorSummary>;
+
+static WINDOW_MS: AtomicU64 = AtomicU64::new(0);
+static MAX_SIZE: AtomicU64 = AtomicU64::new(32);
+
+static BATCHES: AtomicU64 = AtomicU64::new(0);
+static LOOKUPS: AtomicU64 = AtomicU64::new(0);
+static FALLBACKS: AtomicU64 = AtomicU64::new(0);
+
+struct VkPendingLookup {
+    user_dn: String,
+    tx: oneshot::Sender<VkBatchResult>,
+}
+
+/// The lookups waiting for the next batch.
+#[derive(Default)]
+struct VkPendingBatch {
+    // Identifies the batch, so that the timer of a batch that was already
+    // sent for being full does not send the next one early
+    id: u64,
+    lookups: Vec<VkPendingLookup>,
+}
+
+impl VkPendingBatch {
+    /// Takes the pending lookups, and starts the next batch.
+    fn take(&mut self) -> Vec<VkPendingLookup> {
+        self.id = self.id.wrapping_add(1);
+        mem::take(&mut self.lookups)
+    }
+}
+
+lazy_static! {
+    static ref PENDING: Mutex<VkPendingBatch> = Mutex::new(VkPendingBatch::default());
+}
+
+macro_rules! lock_pending {
+    () => {
+        match PENDING.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("group batch mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkGroupBatchStats {
+    pub batches: u64,
+    pub lookups: u64,
+    pub fallbacks: u64,
+}
+
+pub(super) fn refresh_settings(window: Duration, max_size: usize) {
+    WINDOW_MS.store(window.as_millis() as u64, Ordering::Relaxed);
+    MAX_SIZE.store(max_size as u64, Ordering::Relaxed);
+}
+
+pub(super) fn is_enabled() -> bool {
+    WINDOW_MS.load(Ordering::Relaxed) > 0
+}
+
+/// Returns the ACL rules of the groups of `user_dn`, searched together with
+/// the other lookups that arrive within the batch window.
+///
+/// Returns `None` if the batch could not tell the groups of the users apart,
+/// and the groups of `user_dn` must be searched on their own.
+pub(super) async fn lookup(user_dn: &str) -> Result<Option<Vec<String>>> {
+    let window = Duration::from_millis(WINDOW_MS.load(Ordering::Relaxed));
+    let max_size = MAX_SIZE.load(Ordering::Relaxed) as usize;
+
+    let (tx, rx) = oneshot::channel();
+    let (full_batch, timer) = {
+        let mut pending = lock_pending!();
+        pending.lookups.push(VkPendingLookup {
+            user_dn: user_dn.to_string(),
+            tx,
+        });
+
+        if pending.lookups.len() >= max_size {
+            (Some(pending.take()), None)
+        } else if pending.lookups.len() == 1 {
+            (None, Some(pending.id))
+        } else {
+            (None, None)
+        }
+    };
+
+    if let Some(batch) = full_batch {
+        tokio::spawn(metrics::in_auth(run_batch(batch)));
+    }
+
+    // The first lookup of a batch sends the batch when the window ends
+    if let Some(batch_id) = timer {
+        tokio::spawn(metrics::in_auth(async move {
+            tokio::time::sleep(window).await;
+            let batch = {
+                let mut pending = lock_pending!();
+                if pending.id != batch_id {
+                    return;
+                }
+                pending.take()
+            };
+            run_batch(batch).await;
+        }));
+    }
+
+    match rx.await {
+        Ok(Ok(rules)) => Ok(rules),
+        Ok(Err(err)) => Err(VkLdapError::Coalesced(err)),
+        Err(_) => Ok(None),
+    }
+}
+
+async fn run_batch(batch: Vec<VkPendingLookup>) {
+    let mut user_dns: Vec<String> = batch.iter().map(|lookup| lookup.user_dn.clone()).collect();
+    user_dns.sort();
+    user_dns.dedup();
+
+    BATCHES.fetch_add(1, Ordering::Relaxed);
+    LOOKUPS.fetch_add(batch.len() as u64, Ordering::Relaxed);
+    debug!(
+        "searching the groups of {} users in a batch",
+        user_dns.len()
+    );
+
+    match context::search_batched_groups_rules(user_dns).await {
+        Ok(Some(rules_by_user)) => {
+            for lookup in batch {
+                let rules = rules_by_user
+                    .get(&normalize_dn(&lookup.user_dn))
+                    .cloned()
+                    .unwrap_or_default();
+                let _ = lookup.tx.send(Ok(Some(rules)));
+            }
+        }
+        Ok(None) => {
+            FALLBACKS.fetch_add(batch.len() as u64, Ordering::Relaxed);
+            for lookup in batch {
+                let _ = lookup.tx.send(Ok(None));
+            }
+        }
+        Err(err) => {
+            let err = VkLdapErrorSummary::from(&err);
+            for lookup in batch {
+                let _ = lookup.tx.send(Err(err.clone()));
+            }
+        }
+    }
+}
+
+/// Splits the groups returned by a batched search among the users of
+/// `user_dns`, by normalized user DN. Every user gets an entry, even if it is
+/// not a member of any group.
+pub(super) fn groups_by_member(
+    user_dns: &[String],
+    groups: Vec<VkGroupMembers>,
+) -> HashMap<String, Vec<VkGroupRules>> {
+    let mut groups_by_member: HashMap<String, Vec<VkGroupRules>> = user_dns
+        .iter()
+        .map(|user_dn| (normalize_dn(user_dn), Vec::new()))
+        .collect();
+
+    for group in groups {
+        for member in group.members.iter() {
+            if let Some(member_groups) = groups_by_member.get_mut(&normalize_dn(member)) {
+                member_groups.push(VkGroupRules {
+                    dn: group.dn.clone(),
+                    rules: group.rules.clone(),
+                });
+            }
+        }
+    }
+    groups_by_member
+}
+
+pub(super) fn stats() -> VkGroupBatchStats {
+    VkGroupBatchStats {
+        batches: BATCHES.load(Ordering::Relaxed),
+        lookups: LOOKUPS.load(Ordering::Relaxed),
+        fallbacks: FALLBACKS.load(Ordering::Relaxed),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn group(dn: &str, members: &[&str], rules: &[&str]) -> VkGroupMembers {
+        VkGroupMembers {
+            dn: dn.to_string(),
+            members: members.iter().map(|member| member.to_string()).collect(),
+            rules: rules.iter().map(|rule| rule.to_string()).collect(),
+        }
+    }
+
+    #[test]
+    fn test_batched_groups_are_split_by_member() {
+        let user_dns = vec![
+            "cn=user1,ou=devops,dc=valkey,dc=io".to_string(),
+            "CN=u2, OU=devops, DC=valkey, DC=io".to_string(),
+            "cn=u3,ou=devops,dc=valkey,dc=io".to_string(),
+        ];
+        let groups = vec![
+            group(
+                "cn=devops-team,ou=groups,dc=valkey,dc=io",
+                &[
+                    "cn=user1,ou=devops,dc=valkey,dc=io",
+                    "cn=other,ou=devops,dc=valkey,dc=io",
+                ],
+                &["+@all"],
+            ),
+            group(
+                "cn=appdev-team,ou=groups,dc=valkey,dc=io",
+                &[
+                    "cn=user1,ou=devops,dc=valkey,dc=io",
+                    "cn=u2,ou=devops,dc=valkey,dc=io",
+                ],
+                &["+@read", "~*"],
+            ),
+        ];
+
+        let groups_by_member = groups_by_member(&user_dns, groups);
+        assert_eq!(groups_by_member.len(), 3);
+
+        let group_dns = |user_dn: &str| -> Vec<String> {
+            groups_by_member[&normalize_dn(user_dn)]
+                .iter()
+                .map(|group| group.dn.clone())
+                .collect()
+        };
+        assert_eq!(
+            group_dns(&user_dns[0]),
+            vec![
+                "cn=devops-team,ou=groups,dc=valkey,dc=io",
+                "cn=appdev-team,ou=groups,dc=valkey,dc=io",
+            ]
+        );
+        assert_eq!(
+            group_dns(&user_dns[1]),
+            vec!["cn=appdev-team,ou=groups,dc=valkey,dc=io"]
+        );
+        assert!(group_dns(&user_dns[2]).is_empty());
+    }
+}
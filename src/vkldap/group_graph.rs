@@ -0,0 +1,131 @@
+use std::sync::Mutex;
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::cache::{VkCacheStats, VkLruCache};
+use super::connection::normalize_dn;
+
+/// A group, and the ACL rule tokens of the group.
+#[derive(Clone)]
+pub(super) struct VkGroupRules {
+    pub dn: String,
+    pub rules: Vec<String>,
+}
+
+/// The groups seen by the group searches, by normalized group DN.
+struct VkGroupGraph {
+    // The parent groups of each group
+    parents: VkLruCache<Vec<VkGroupRules>>,
+    // The ACL rule tokens of each group
+    rules: VkLruCache<Vec<String>>,
+}
+
+lazy_static! {
+    static ref GROUP_GRAPH: Mutex<VkGroupGraph> = Mutex::new(VkGroupGraph {
+        parents: VkLruCache::new(Duration::ZERO, 0),
+        rules: VkLruCache::new(Duration::ZERO, 0),
+    });
+}
+
+macro_rules! lock_cache {
+    () => {
+        match GROUP_GRAPH.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("group graph mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+pub(super) fn refresh_settings(ttl: Duration, max_entries: usize) {
+    let mut graph = lock_cache!();
+    graph.parents.reconfigure(ttl, max_entries);
+    graph.rules.reconfigure(ttl, max_entries);
+}
+
+/// Returns the groups that `group_dn` was recently found to be a member of.
+pub(super) fn lookup(group_dn: &str) -> Option<Vec<VkGroupRules>> {
+    lock_cache!().parents.get(&normalize_dn(group_dn)).cloned()
+}
+
+pub(super) fn store(group_dn: &str, parents: &[VkGroupRules]) {
+    let mut graph = lock_cache!();
+    for parent in parents {
+        graph
+            .rules
+            .insert(normalize_dn(&parent.dn), parent.rules.clone());
+    }
+    graph
+        .parents
+        .insert(normalize_dn(group_dn), parents.to_vec());
+}
+
+/// Returns the ACL rule tokens that `group_dn` recently had.
+pub(super) fn lookup_rules(group_dn: &str) -> Option<Vec<String>> {
+    lock_cache!().rules.get(&normalize_dn(group_dn)).cloned()
+}
+
+pub(super) fn store_rules(group_dn: &str, rules: &[String]) {
+    lock_cache!()
+        .rules
+        .insert(normalize_dn(group_dn), rules.to_vec());
+}
+
+pub(super) fn clear() -> usize {
+    let mut graph = lock_cache!();
+    graph.parents.clear() + graph.rules.clear()
+}
+
+pub(super) fn stats() -> VkCacheStats {
+    let graph = lock_cache!();
+    let parents = graph.parents.stats();
+    let rules = graph.rules.stats();
+
+    VkCacheStats {
+        entries: parents.entries + rules.entries,
+        hits: parents.hits + rules.hits,
+        misses: parents.misses + rules.misses,
+        evictions: parents.evictions + rules.evictions,
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_group_graph() {
+        refresh_settings(Duration::from_secs(60), 1000);
+
+        let parents = vec![VkGroupRules {
+            dn: "cn=graph-dept,dc=valkey,dc=io".to_string(),
+            rules: vec!["+@all".to_string()],
+        }];
+        assert!(lookup("cn=graph-team,dc=valkey,dc=io").is_none());
+        store("cn=graph-team,dc=valkey,dc=io", &parents);
+
+        // The DNs are normalized
+        let found = lookup("CN=graph-team, DC=valkey, DC=io").unwrap_or_default();
+        assert_eq!(found.len(), 1);
+        assert_eq!(found[0].dn, "cn=graph-dept,dc=valkey,dc=io");
+
+        // The rules of the parents are stored too
+        assert_eq!(
+            lookup_rules("cn=graph-dept,dc=valkey,dc=io"),
+            Some(vec!["+@all".to_string()])
+        );
+        store_rules("cn=graph-dept,dc=valkey,dc=io", &["+@read".to_string()]);
+        assert_eq!(
+            lookup_rules("CN=Graph-Dept,DC=valkey,DC=io"),
+            Some(vec!["+@read".to_string()])
+        );
+
+        // A group without parents is remembered as such
+        store("cn=graph-dept,dc=valkey,dc=io", &[]);
+        assert!(lookup("cn=graph-dept,dc=valkey,dc=io").is_some_and(|p| p.is_empty()));
+    }
+}
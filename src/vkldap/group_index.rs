@@ -0,0 +1,405 @@
+use std::collections::{HashMap, HashSet};
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+use arc_swap::ArcSwapOption;
+use lazy_static::lazy_static;
+use log::{debug, error, info};
+use tokio::sync::Notify;
+use tokio::task::JoinHandle;
+
+use crate::configs::LdapGroupNesting;
+
+use super::connection::{VkGroupMembers, merge_rule_tokens, normalize_dn};
+use super::context;
+use super::scheduler;
+
+/// The index is no longer used once it is older than this number of refresh
+/// intervals, for instance when the refreshes keep failing.
+const MAX_AGE_INTERVALS: u32 = 3;
+/// The longest delay before a failed refresh is retried.
+const RETRY_DELAY: Duration = Duration::from_secs(5);
+
+/// The ACL rules of each member DN, built from a search of all the groups.
+struct VkGroupIndex {
+    rules: HashMap<String, Vec<String>>,
+    groups: usize,
+    built_at: Instant,
+    build_duration: Duration,
+}
+
+impl VkGroupIndex {
+    fn build(groups: Vec<VkGroupMembers>, nested: bool, started_at: Instant) -> VkGroupIndex {
+        let mut rules: HashMap<String, Vec<String>> = HashMap::new();
+        let groups_count = groups.len();
+
+        let groups_rules = match nested {
+            true => nested_groups_rules(&groups),
+            false => groups.iter().map(|group| group.rules.clone()).collect(),
+        };
+
+        // Members of groups without rules are left out, as they get no rules
+        // from these groups anyway
+        for (group, group_rules) in groups.iter().zip(groups_rules.iter()) {
+            if group_rules.is_empty() {
+                continue;
+            }
+            for member in group.members.iter() {
+                let member_rules = rules.entry(normalize_dn(member)).or_default();
+                merge_rule_tokens(member_rules, group_rules.iter().map(|rule| rule.as_str()));
+            }
+        }
+
+        VkGroupIndex {
+            rules,
+            groups: groups_count,
+            built_at: started_at,
+            build_duration: started_at.elapsed(),
+        }
+    }
+
+    fn lookup(&self, user_dn: &str) -> Vec<String> {
+        self.rules
+            .get(&normalize_dn(user_dn))
+            .cloned()
+            .unwrap_or_default()
+    }
+}
+
+/// Returns the rules of each group, merged with the rules of the groups that
+/// contain it, directly or through nested groups.
+fn nested_groups_rules(groups: &[VkGroupMembers]) -> Vec<Vec<String>> {
+    let positions: HashMap<String, usize> = groups
+        .iter()
+        .enumerate()
+        .map(|(pos, group)| (normalize_dn(&group.dn), pos))
+        .collect();
+
+    let mut parents: Vec<Vec<usize>> = vec![Vec::new(); groups.len()];
+    for (pos, group) in groups.iter().enumerate() {
+        for member in group.members.iter() {
+            if let Some(&child) = positions.get(&normalize_dn(member)) {
+                parents[child].push(pos);
+            }
+        }
+    }
+
+    (0..groups.len())
+        .map(|pos| {
+            let mut rules = groups[pos].rules.clone();
+            // Each group is visited once, which also ends the cycles of
+            // groups that are members of each other
+            let mut visited = HashSet::from([pos]);
+            let mut pending = parents[pos].clone();
+            while let Some(parent) = pending.pop() {
+                if visited.insert(parent) {
+                    merge_rule_tokens(&mut rules, groups[parent].rules.iter().map(|r| r.as_str()));
+                    pending.extend(parents[parent].iter().copied());
+                }
+            }
+            rules
+        })
+        .collect()
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkGroupIndexStats {
+    pub members: usize,
+    pub groups: usize,
+    pub age: Option<Duration>,
+    pub last_refresh_duration: Option<Duration>,
+    pub refreshes: u64,
+    pub refresh_failures: u64,
+}
+
+struct GroupIndexRefresher {
+    task: Mutex<Option<JoinHandle<()>>>,
+    stop: AtomicBool,
+    wakeup: Notify,
+    interval_s: AtomicU64,
+    index: ArcSwapOption<VkGroupIndex>,
+    // Incremented when the index is cleared, so that a refresh that started
+    // before does not store an index built with the previous settings
+    generation: Mutex<u64>,
+    refreshes: AtomicU64,
+    refresh_failures: AtomicU64,
+}
+
+impl GroupIndexRefresher {
+    fn new() -> GroupIndexRefresher {
+        GroupIndexRefresher {
+            task: Mutex::new(None),
+            stop: AtomicBool::new(false),
+            wakeup: Notify::new(),
+            interval_s: AtomicU64::new(0),
+            index: ArcSwapOption::empty(),
+            generation: Mutex::new(0),
+            refreshes: AtomicU64::new(0),
+            refresh_failures: AtomicU64::new(0),
+        }
+    }
+
+    /// Returns the refresh interval, or `None` if the index is disabled.
+    fn get_interval(&self) -> Option<Duration> {
+        match self.interval_s.load(Ordering::Relaxed) {
+            0 => None,
+            interval => Some(Duration::from_secs(interval)),
+        }
+    }
+
+    fn get_generation(&self) -> u64 {
+        *self.generation.lock().unwrap()
+    }
+
+    fn start(&self) {
+        self.stop.store(false, Ordering::Release);
+
+        match scheduler::spawn_task(group_index_loop()) {
+            Ok(handle) => *self.task.lock().unwrap() = Some(handle),
+            Err(err) => error!("failed to start the group index refresher: {err}"),
+        }
+    }
+
+    fn shutdown(&self) {
+        self.stop.store(true, Ordering::Release);
+
+        // A refresh may be waiting for the LDAP server, there is no need to
+        // wait for it to complete
+        if let Some(handle) = self.task.lock().unwrap().take() {
+            handle.abort();
+        }
+        self.index.store(None);
+    }
+
+    fn should_stop(&self) -> bool {
+        self.stop.load(Ordering::Acquire)
+    }
+
+    /// Builds a new index, and returns true if it succeeded.
+    async fn refresh(&self, generation: u64) -> bool {
+        let started_at = Instant::now();
+        let nested = context::get_ldap_settings().groups_nesting != LdapGroupNesting::Direct;
+        let res = context::search_all_groups_rules().await;
+        self.refreshes.fetch_add(1, Ordering::Relaxed);
+
+        let groups = match res {
+            Ok(groups) => groups,
+            Err(err) => {
+                self.refresh_failures.fetch_add(1, Ordering::Relaxed);
+                error!("failed to refresh the group index: {err}");
+                return false;
+            }
+        };
+
+        let index = VkGroupIndex::build(groups, nested, started_at);
+        debug!(
+            "group index refreshed with {} groups and {} members in {}ms",
+            index.groups,
+            index.rules.len(),
+            index.build_duration.as_millis()
+        );
+
+        let current_generation = self.generation.lock().unwrap();
+        if *current_generation == generation {
+            self.index.store(Some(Arc::new(index)));
+        }
+        true
+    }
+
+    fn clear(&self) -> usize {
+        let mut generation = self.generation.lock().unwrap();
+        *generation += 1;
+        let index = self.index.swap(None);
+        drop(generation);
+
+        // Build a new index right away
+        self.wakeup.notify_one();
+
+        index.map_or(0, |index| index.rules.len())
+    }
+}
+
+lazy_static! {
+    static ref GROUP_INDEX: GroupIndexRefresher = GroupIndexRefresher::new();
+}
+
+async fn group_index_loop() {
+    debug!("initiating group index refresher");
+
+    // The start time, the outcome, and the generation, of the last refresh
+    let mut last_refresh: Option<(Instant, bool, u64)> = None;
+
+    loop {
+        if GROUP_INDEX.should_stop() {
+            debug!("exiting group index refresher loop");
+            return ();
+        }
+
+        let generation = GROUP_INDEX.get_generation();
+        let delay = GROUP_INDEX
+            .get_interval()
+            .map(|interval| match last_refresh {
+                Some((started_at, succeeded, refresh_generation))
+                    if refresh_generation == generation =>
+                {
+                    let delay = match succeeded {
+                        true => interval,
+                        false => interval.min(RETRY_DELAY),
+                    };
+                    delay.saturating_sub(started_at.elapsed())
+                }
+                _ => Duration::ZERO,
+            });
+
+        match delay {
+            Some(delay) if delay.is_zero() => {
+                let started_at = Instant::now();
+                let succeeded = GROUP_INDEX.refresh(generation).await;
+                last_refresh = Some((started_at, succeeded, generation));
+            }
+            Some(delay) => {
+                let _ = tokio::time::timeout(delay, GROUP_INDEX.wakeup.notified()).await;
+            }
+            None => GROUP_INDEX.wakeup.notified().await,
+        }
+    }
+}
+
+pub fn start_group_index_refresher() {
+    GROUP_INDEX.start();
+}
+
+pub fn shutdown_group_index_refresher() {
+    GROUP_INDEX.shutdown();
+}
+
+pub fn refresh_group_index_settings(interval: Duration) {
+    let previous = GROUP_INDEX
+        .interval_s
+        .swap(interval.as_secs(), Ordering::Relaxed);
+
+    if previous == interval.as_secs() {
+        return ();
+    }
+
+    if interval.is_zero() {
+        info!("group index disabled");
+        GROUP_INDEX.clear();
+    } else {
+        GROUP_INDEX.wakeup.notify_one();
+    }
+}
+
+/// Returns the ACL rules of `user_dn` from the group index, or `None` if
+/// there is no usable index.
+pub(super) fn lookup(user_dn: &str) -> Option<Vec<String>> {
+    let interval = GROUP_INDEX.get_interval()?;
+    let index = GROUP_INDEX.index.load_full()?;
+
+    if index.built_at.elapsed() > interval * MAX_AGE_INTERVALS {
+        return None;
+    }
+
+    Some(index.lookup(user_dn))
+}
+
+/// Drops the index, and starts building a new one. Returns the number of
+/// members of the dropped index.
+pub(super) fn clear() -> usize {
+    GROUP_INDEX.clear()
+}
+
+pub(super) fn stats() -> VkGroupIndexStats {
+    let index = GROUP_INDEX.index.load_full();
+
+    VkGroupIndexStats {
+        members: index.as_ref().map_or(0, |index| index.rules.len()),
+        groups: index.as_ref().map_or(0, |index| index.groups),
+        age: index.as_ref().map(|index| index.built_at.elapsed()),
+        last_refresh_duration: index.as_ref().map(|index| index.build_duration),
+        refreshes: GROUP_INDEX.refreshes.load(Ordering::Relaxed),
+        refresh_failures: GROUP_INDEX.refresh_failures.load(Ordering::Relaxed),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_index_merges_member_rules() {
+        let groups = vec![
+            VkGroupMembers {
+                dn: "cn=devops-read,dc=valkey,dc=io".to_string(),
+                members: vec![
+                    "cn=user1,ou=devops,dc=valkey,dc=io".to_string(),
+                    "cn=user2,ou=devops,dc=valkey,dc=io".to_string(),
+                ],
+                rules: vec!["+@read".to_string(), "~*".to_string()],
+            },
+            VkGroupMembers {
+                dn: "cn=devops-write,dc=valkey,dc=io".to_string(),
+                members: vec!["CN=User1, OU=devops, DC=valkey, DC=io".to_string()],
+                rules: vec!["+@write".to_string(), "~*".to_string()],
+            },
+            VkGroupMembers {
+                dn: "cn=devops-none,dc=valkey,dc=io".to_string(),
+                members: vec!["cn=user3,ou=devops,dc=valkey,dc=io".to_string()],
+                rules: vec![],
+            },
+        ];
+
+        let index = VkGroupIndex::build(groups, false, Instant::now());
+        assert_eq!(index.groups, 3);
+        assert_eq!(index.rules.len(), 2);
+
+        assert_eq!(
+            index.lookup("cn=user1,OU=devops,DC=valkey,DC=io"),
+            vec!["+@read", "~*", "+@write"]
+        );
+        assert_eq!(
+            index.lookup("cn=user2,ou=devops,dc=valkey,dc=io"),
+            vec!["+@read", "~*"]
+        );
+        assert!(
+            index
+                .lookup("cn=user3,ou=devops,dc=valkey,dc=io")
+                .is_empty()
+        );
+    }
+
+    #[test]
+    fn test_index_resolves_nested_groups() {
+        let group = |dn: &str, members: &[&str], rules: &[&str]| VkGroupMembers {
+            dn: dn.to_string(),
+            members: members.iter().map(|m| m.to_string()).collect(),
+            rules: rules.iter().map(|r| r.to_string()).collect(),
+        };
+        let user1 = "cn=user1,ou=devops,dc=valkey,dc=io";
+        let groups = vec![
+            group("cn=team,dc=valkey,dc=io", &[user1], &[]),
+            group(
+                "cn=department,dc=valkey,dc=io",
+                &["CN=team, DC=valkey, DC=io", "cn=company,dc=valkey,dc=io"],
+                &["+@read"],
+            ),
+            // A cycle between the department and the company
+            group(
+                "cn=company,dc=valkey,dc=io",
+                &["cn=department,dc=valkey,dc=io"],
+                &["~*"],
+            ),
+        ];
+
+        let index = VkGroupIndex::build(groups, true, Instant::now());
+        assert_eq!(index.lookup(user1), vec!["+@read", "~*"]);
+
+        let direct = VkGroupIndex::build(
+            vec![group("cn=team,dc=valkey,dc=io", &[user1], &[])],
+            false,
+            Instant::now(),
+        );
+        assert!(direct.lookup(user1).is_empty());
+    }
+}
@@ -0,0 +1,157 @@
+use std::collections::HashSet;
+use std::sync::Mutex;
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::cache::{VkCacheStats, VkLruCache};
+use super::connection::normalize_dn;
+
+pub(super) enum CachedGroupRules {
+    Fresh(Vec<String>),
+    /// The rules are older than the TTL, and the caller is in charge of
+    /// refreshing them.
+    Stale(Vec<String>),
+}
+
+/// Caches the ACL rules obtained from the groups of each user DN. The DNs are
+/// normalized, so that the entries can be found from the DNs returned by the
+/// LDAP server.
+///
+/// Rules older than `ttl` are stale. Stale rules are still served for up to
+/// `max_stale`, while a single background refresh replaces them.
+struct VkGroupRulesCache {
+    entries: VkLruCache<Vec<String>>,
+    ttl: Duration,
+    refreshing: HashSet<String>,
+}
+
+impl VkGroupRulesCache {
+    fn new() -> VkGroupRulesCache {
+        VkGroupRulesCache {
+            entries: VkLruCache::new(Duration::ZERO, 0),
+            ttl: Duration::ZERO,
+            refreshing: HashSet::new(),
+        }
+    }
+
+    fn reconfigure(&mut self, ttl: Duration, max_stale: Duration, max_entries: usize) {
+        self.ttl = ttl;
+        if ttl.is_zero() {
+            self.entries.reconfigure(Duration::ZERO, max_entries);
+        } else {
+            self.entries.reconfigure(ttl + max_stale, max_entries);
+        }
+    }
+
+    fn lookup(&mut self, user_dn: &str) -> Option<CachedGroupRules> {
+        let ttl = self.ttl;
+        let (rules, age) = self.entries.get_with_age(user_dn)?;
+        let rules = rules.clone();
+
+        if age < ttl || self.refreshing.contains(user_dn) {
+            return Some(CachedGroupRules::Fresh(rules));
+        }
+
+        self.refreshing.insert(user_dn.to_string());
+        Some(CachedGroupRules::Stale(rules))
+    }
+
+    fn clear(&mut self) -> usize {
+        self.refreshing.clear();
+        self.entries.clear()
+    }
+}
+
+lazy_static! {
+    static ref GROUP_RULES_CACHE: Mutex<VkGroupRulesCache> = Mutex::new(VkGroupRulesCache::new());
+}
+
+macro_rules! lock_cache {
+    () => {
+        match GROUP_RULES_CACHE.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("group rules cache mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+pub(super) fn refresh_settings(ttl: Duration, max_stale: Duration, max_entries: usize) {
+    lock_cache!().reconfigure(ttl, max_stale, max_entries);
+}
+
+/// Returns the cached ACL rules of `user_dn`. When the rules are stale, only
+/// the first caller gets `CachedGroupRules::Stale` until `end_refresh` is
+/// called for `user_dn`.
+pub(super) fn lookup(user_dn: &str) -> Option<CachedGroupRules> {
+    lock_cache!().lookup(&normalize_dn(user_dn))
+}
+
+pub(super) fn store(user_dn: &str, rules: &[String]) {
+    lock_cache!()
+        .entries
+        .insert(normalize_dn(user_dn), rules.to_vec());
+}
+
+/// Ends the background refresh of `user_dn`. The refreshed `rules` are only
+/// stored if the cache was not flushed while the refresh was running.
+pub(super) fn end_refresh(user_dn: &str, rules: Option<&[String]>) {
+    let user_dn = normalize_dn(user_dn);
+    let mut cache = lock_cache!();
+    if !cache.refreshing.remove(&user_dn) {
+        return ();
+    }
+
+    if let Some(rules) = rules {
+        cache.entries.insert(user_dn, rules.to_vec());
+    }
+}
+
+pub(super) fn invalidate(user_dn: &str) -> bool {
+    let user_dn = normalize_dn(user_dn);
+    let mut cache = lock_cache!();
+    cache.refreshing.remove(&user_dn);
+    cache.entries.remove(&user_dn)
+}
+
+pub(super) fn clear() -> usize {
+    lock_cache!().clear()
+}
+
+pub(super) fn stats() -> VkCacheStats {
+    lock_cache!().entries.stats()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_stale_rules_are_refreshed_once() {
+        let mut cache = VkGroupRulesCache::new();
+        cache.reconfigure(Duration::from_millis(10), Duration::from_secs(60), 10);
+        cache
+            .entries
+            .insert("cn=user1".to_string(), vec!["+@all".to_string()]);
+
+        assert!(matches!(
+            cache.lookup("cn=user1"),
+            Some(CachedGroupRules::Fresh(_))
+        ));
+
+        std::thread::sleep(Duration::from_millis(20));
+        assert!(matches!(
+            cache.lookup("cn=user1"),
+            Some(CachedGroupRules::Stale(_))
+        ));
+        assert!(matches!(
+            cache.lookup("cn=user1"),
+            Some(CachedGroupRules::Fresh(_))
+        ));
+        assert_eq!(cache.refreshing.len(), 1);
+    }
+}
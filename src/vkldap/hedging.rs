@@ -0,0 +1,92 @@
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::time::Duration;
+
+use super::balancer::VkServerLoad;
+
+/// Number of search latency samples of a server needed before its searches
+/// are hedged.
+const MIN_LATENCY_SAMPLES: u64 = 20;
+
+static ENABLED: AtomicBool = AtomicBool::new(false);
+static MIN_DELAY_MS: AtomicU64 = AtomicU64::new(10);
+
+static SEARCHES: AtomicU64 = AtomicU64::new(0);
+static HEDGED: AtomicU64 = AtomicU64::new(0);
+static HEDGE_WINS: AtomicU64 = AtomicU64::new(0);
+
+#[derive(Clone, Copy, Default)]
+pub struct VkHedgingStats {
+    pub searches: u64,
+    pub hedged: u64,
+    pub hedge_wins: u64,
+}
+
+pub(super) fn refresh_settings(enabled: bool, min_delay: Duration) {
+    ENABLED.store(enabled, Ordering::Relaxed);
+    MIN_DELAY_MS.store(min_delay.as_millis() as u64, Ordering::Relaxed);
+}
+
+/// Returns how long a search on the server of `load` may run before it is
+/// hedged, or `None` if searches must not be hedged.
+///
+/// The delay is the 95th percentile of the search latency of the server, so
+/// that only the slowest searches are hedged.
+pub(super) fn hedge_delay(load: &VkServerLoad) -> Option<Duration> {
+    if !ENABLED.load(Ordering::Relaxed) {
+        return None;
+    }
+
+    let (p95, samples) = load.search_latency_p95();
+    if samples < MIN_LATENCY_SAMPLES {
+        return None;
+    }
+
+    let min_delay = Duration::from_millis(MIN_DELAY_MS.load(Ordering::Relaxed));
+    Some(p95.max(min_delay))
+}
+
+pub(super) fn count_search() {
+    SEARCHES.fetch_add(1, Ordering::Relaxed);
+}
+
+pub(super) fn count_hedge(won: bool) {
+    HEDGED.fetch_add(1, Ordering::Relaxed);
+    if won {
+        HEDGE_WINS.fetch_add(1, Ordering::Relaxed);
+    }
+}
+
+pub(super) fn stats() -> VkHedgingStats {
+    VkHedgingStats {
+        searches: SEARCHES.load(Ordering::Relaxed),
+        hedged: HEDGED.load(Ordering::Relaxed),
+        hedge_wins: HEDGE_WINS.load(Ordering::Relaxed),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_hedge_delay_needs_latency_samples() {
+        refresh_settings(true, Duration::from_millis(10));
+
+        let load = VkServerLoad::default();
+        for _ in 0..MIN_LATENCY_SAMPLES - 1 {
+            load.observe_search_latency(Duration::from_millis(50));
+            assert_eq!(hedge_delay(&load), None);
+        }
+
+        load.observe_search_latency(Duration::from_millis(50));
+        let delay = hedge_delay(&load).unwrap();
+        assert!(delay >= Duration::from_millis(10));
+
+        // The delay is never shorter than the minimum delay
+        refresh_settings(true, Duration::from_secs(1));
+        assert_eq!(hedge_delay(&load), Some(Duration::from_secs(1)));
+
+        refresh_settings(false, Duration::from_millis(10));
+        assert_eq!(hedge_delay(&load), None);
+    }
+}
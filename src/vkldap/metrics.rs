@@ -0,0 +1,396 @@
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::{Duration, Instant};
+
+use super::slowlog;
+
+/// Values below `1 << SUB_BUCKET_BITS` microseconds get a bucket each. Above
+/// that, each power of two is split in `1 << SUB_BUCKET_BITS` buckets, so
+/// that the percentiles are within 1/16 of the recorded latencies.
+const SUB_BUCKET_BITS: u32 = 4;
+const SUB_BUCKETS: usize = 1 << SUB_BUCKET_BITS;
+/// Latencies above 2^36 microseconds, about 19 hours, are recorded as that.
+const MAX_EXPONENT: u32 = 35;
+const BUCKETS: usize = SUB_BUCKETS * (MAX_EXPONENT - SUB_BUCKET_BITS + 2) as usize;
+
+/// The phases of an authentication that are timed.
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum VkAuthPhase {
+    /// From the submission of the authentication until a worker runs it
+    QueueWait,
+    /// Getting a connection from a connection pool
+    PoolWait,
+    /// The bind with the search bind DN
+    AdminBind,
+    /// The search of the user DN
+    UserSearch,
+    /// The bind that verifies the user credentials
+    UserBind,
+    /// The search of the group ACL rules
+    GroupRulesSearch,
+    /// Applying the ACL rules of the user on the main thread
+    AclApply,
+}
+
+const PHASES: [VkAuthPhase; 7] = [
+    VkAuthPhase::QueueWait,
+    VkAuthPhase::PoolWait,
+    VkAuthPhase::AdminBind,
+    VkAuthPhase::UserSearch,
+    VkAuthPhase::UserBind,
+    VkAuthPhase::GroupRulesSearch,
+    VkAuthPhase::AclApply,
+];
+
+impl VkAuthPhase {
+    pub fn name(&self) -> &'static str {
+        match self {
+            VkAuthPhase::QueueWait => "queue_wait",
+            VkAuthPhase::PoolWait => "pool_wait",
+            VkAuthPhase::AdminBind => "admin_bind",
+            VkAuthPhase::UserSearch => "user_search",
+            VkAuthPhase::UserBind => "user_bind",
+            VkAuthPhase::GroupRulesSearch => "group_rules_search",
+            VkAuthPhase::AclApply => "acl_apply",
+        }
+    }
+}
+
+/// The outcomes of an authentication.
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum VkAuthOutcome {
+    Success,
+    /// The LDAP server rejected the credentials
+    Rejected,
+    /// The user does not exist in the LDAP server
+    NotFound,
+    /// No LDAP server could verify the credentials
+    Unavailable,
+    /// No LDAP server could verify the credentials, and the local ACL user
+    /// was used instead
+    Fallback,
+}
+
+/// A latency histogram with logarithmic buckets, in the spirit of HDR
+/// histograms. Samples are recorded with atomic increments only, so that
+/// concurrent authentications never wait for each other to record them.
+struct VkHistogram {
+    buckets: [AtomicU64; BUCKETS],
+    count: AtomicU64,
+    max_us: AtomicU64,
+}
+
+impl VkHistogram {
+    const fn new() -> VkHistogram {
+        VkHistogram {
+            buckets: [const { AtomicU64::new(0) }; BUCKETS],
+            count: AtomicU64::new(0),
+            max_us: AtomicU64::new(0),
+        }
+    }
+
+    fn record(&self, latency: Duration) {
+        let us = latency.as_micros().min(u64::MAX as u128) as u64;
+        self.buckets[bucket_index(us)].fetch_add(1, Ordering::Relaxed);
+        self.count.fetch_add(1, Ordering::Relaxed);
+        self.max_us.fetch_max(us, Ordering::Relaxed);
+    }
+
+    /// Returns the latency below which `quantile` of the samples are, or
+    /// `None` if there are no samples.
+    fn value_at_quantile(&self, quantile: f64) -> Option<Duration> {
+        let counts: Vec<u64> = self
+            .buckets
+            .iter()
+            .map(|bucket| bucket.load(Ordering::Relaxed))
+            .collect();
+        let total: u64 = counts.iter().sum();
+        if total == 0 {
+            return None;
+        }
+
+        let rank = ((quantile * total as f64).ceil() as u64).clamp(1, total);
+        let mut seen = 0;
+        for (idx, count) in counts.iter().enumerate() {
+            seen += count;
+            if seen >= rank {
+                // The percentile is never above the largest sample
+                let us = bucket_upper_bound(idx).min(self.max_us.load(Ordering::Relaxed));
+                return Some(Duration::from_micros(us));
+            }
+        }
+        None
+    }
+
+    fn stats(&self) -> VkLatencyStats {
+        VkLatencyStats {
+            count: self.count.load(Ordering::Relaxed),
+            p50: self.value_at_quantile(0.5),
+            p90: self.value_at_quantile(0.9),
+            p99: self.value_at_quantile(0.99),
+            p999: self.value_at_quantile(0.999),
+            max: Duration::from_micros(self.max_us.load(Ordering::Relaxed)),
+        }
+    }
+
+    fn reset(&self) {
+        for bucket in self.buckets.iter() {
+            bucket.store(0, Ordering::Relaxed);
+        }
+        self.count.store(0, Ordering::Relaxed);
+        self.max_us.store(0, Ordering::Relaxed);
+    }
+}
+
+fn bucket_index(us: u64) -> usize {
+    if us < SUB_BUCKETS as u64 {
+        return us as usize;
+    }
+
+    let exponent = (u64::BITS - 1 - us.leading_zeros()).min(MAX_EXPONENT);
+    let shift = exponent - SUB_BUCKET_BITS;
+    let sub_bucket = ((us >> shift) as usize).min(2 * SUB_BUCKETS - 1) - SUB_BUCKETS;
+    SUB_BUCKETS * (shift as usize + 1) + sub_bucket
+}
+
+/// Returns the largest latency, in microseconds, recorded in bucket `idx`.
+fn bucket_upper_bound(idx: usize) -> u64 {
+    if idx < SUB_BUCKETS {
+        return idx as u64;
+    }
+
+    let shift = (idx / SUB_BUCKETS - 1) as u32;
+    let sub_bucket = (idx % SUB_BUCKETS + SUB_BUCKETS) as u64;
+    ((sub_bucket + 1) << shift) - 1
+}
+
+static HISTOGRAMS: [VkHistogram; PHASES.len()] = [const { VkHistogram::new() }; PHASES.len()];
+
+static SUCCESS: AtomicU64 = AtomicU64::new(0);
+static REJECTED: AtomicU64 = AtomicU64::new(0);
+static NOT_FOUND: AtomicU64 = AtomicU64::new(0);
+static UNAVAILABLE: AtomicU64 = AtomicU64::new(0);
+static FALLBACK: AtomicU64 = AtomicU64::new(0);
+
+static QUEUED: AtomicU64 = AtomicU64::new(0);
+static IN_FLIGHT: AtomicU64 = AtomicU64::new(0);
+
+pub struct VkLatencyStats {
+    pub count: u64,
+    pub p50: Option<Duration>,
+    pub p90: Option<Duration>,
+    pub p99: Option<Duration>,
+    pub p999: Option<Duration>,
+    pub max: Duration,
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkAuthStats {
+    pub success: u64,
+    pub rejected: u64,
+    pub not_found: u64,
+    pub unavailable: u64,
+    pub fallback: u64,
+    pub queued: u64,
+    pub running: u64,
+}
+
+fn histogram(phase: VkAuthPhase) -> &'static VkHistogram {
+    &HISTOGRAMS[phase as usize]
+}
+
+pub fn record_phase(phase: VkAuthPhase, latency: Duration) {
+    histogram(phase).record(latency);
+}
+
+pub fn record_outcome(outcome: VkAuthOutcome) {
+    let counter = match outcome {
+        VkAuthOutcome::Success => &SUCCESS,
+        VkAuthOutcome::Rejected => &REJECTED,
+        VkAuthOutcome::NotFound => &NOT_FOUND,
+        VkAuthOutcome::Unavailable => &UNAVAILABLE,
+        VkAuthOutcome::Fallback => &FALLBACK,
+    };
+    counter.fetch_add(1, Ordering::Relaxed);
+}
+
+tokio::task_local! {
+    // Set while an authentication tracked by `track_auth` runs, so that the
+    // background work, such as group rules refreshes, is not timed as part
+    // of the authentications
+    static IN_AUTH: ();
+}
+
+/// Times a phase, and records its latency when dropped, so that the phases
+/// that fail are timed too. Only the phases of a tracked authentication are
+/// recorded.
+pub struct VkPhaseTimer {
+    phase: VkAuthPhase,
+    start: Instant,
+    tracked: bool,
+}
+
+impl VkPhaseTimer {
+    pub fn start(phase: VkAuthPhase) -> VkPhaseTimer {
+        VkPhaseTimer {
+            phase,
+            start: Instant::now(),
+            tracked: IN_AUTH.try_with(|_| ()).is_ok(),
+        }
+    }
+
+    /// Times a phase of an authentication that runs outside of its tracked
+    /// task, such as applying its ACL rules on the main thread.
+    pub fn start_in_auth(phase: VkAuthPhase) -> VkPhaseTimer {
+        VkPhaseTimer {
+            phase,
+            start: Instant::now(),
+            tracked: true,
+        }
+    }
+}
+
+impl Drop for VkPhaseTimer {
+    fn drop(&mut self) {
+        if !self.tracked {
+            return;
+        }
+
+        let latency = self.start.elapsed();
+        record_phase(self.phase, latency);
+        slowlog::add_phase(self.phase, latency);
+    }
+}
+
+/// Decrements `gauge` when dropped.
+struct VkGaugeGuard(&'static AtomicU64);
+
+impl VkGaugeGuard {
+    fn new(gauge: &'static AtomicU64) -> VkGaugeGuard {
+        gauge.fetch_add(1, Ordering::Relaxed);
+        VkGaugeGuard(gauge)
+    }
+}
+
+impl Drop for VkGaugeGuard {
+    fn drop(&mut self) {
+        self.0.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+/// Wraps the authentication `task` to count it as queued until a worker
+/// runs it, and as in flight until it completes.
+pub(super) fn track_auth<F>(task: F) -> impl Future<Output = F::Output> + Send + 'static
+where
+    F: Future + Send + 'static,
+{
+    let submitted = Instant::now();
+    let queued = VkGaugeGuard::new(&QUEUED);
+
+    async move {
+        drop(queued);
+        record_phase(VkAuthPhase::QueueWait, submitted.elapsed());
+
+        let _in_flight = VkGaugeGuard::new(&IN_FLIGHT);
+        IN_AUTH.scope((), task).await
+    }
+}
+
+/// Wraps `task`, that runs on behalf of tracked authentications in a task of
+/// its own, so that its phases are recorded too.
+pub(super) fn in_auth<F>(task: F) -> impl Future<Output = F::Output> + Send + 'static
+where
+    F: Future + Send + 'static,
+{
+    IN_AUTH.scope((), task)
+}
+
+/// Returns the latency stats of each phase, by phase name.
+pub fn phase_stats() -> Vec<(&'static str, VkLatencyStats)> {
+    PHASES
+        .iter()
+        .map(|phase| (phase.name(), histogram(*phase).stats()))
+        .collect()
+}
+
+pub fn auth_stats() -> VkAuthStats {
+    VkAuthStats {
+        success: SUCCESS.load(Ordering::Relaxed),
+        rejected: REJECTED.load(Ordering::Relaxed),
+        not_found: NOT_FOUND.load(Ordering::Relaxed),
+        unavailable: UNAVAILABLE.load(Ordering::Relaxed),
+        fallback: FALLBACK.load(Ordering::Relaxed),
+        queued: QUEUED.load(Ordering::Relaxed),
+        running: IN_FLIGHT.load(Ordering::Relaxed),
+    }
+}
+
+/// Resets the latency histograms and the outcome counters. The gauges are
+/// kept, as they count the authentications that are still running.
+pub fn reset() {
+    for histogram in HISTOGRAMS.iter() {
+        histogram.reset();
+    }
+    for counter in [&SUCCESS, &REJECTED, &NOT_FOUND, &UNAVAILABLE, &FALLBACK] {
+        counter.store(0, Ordering::Relaxed);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_bucket_bounds() {
+        for us in [0, 1, 15, 16, 17, 31, 32, 1000, 123_456, (1 << 36) - 1] {
+            let idx = bucket_index(us);
+            assert!(us <= bucket_upper_bound(idx), "{us} above bucket {idx}");
+            if idx > 0 {
+                assert!(us > bucket_upper_bound(idx - 1), "{us} below bucket {idx}");
+            }
+        }
+        assert_eq!(bucket_index(u64::MAX), BUCKETS - 1);
+    }
+
+    #[test]
+    fn test_only_tracked_phases_are_recorded() {
+        let rt = tokio::runtime::Builder::new_current_thread()
+            .build()
+            .unwrap();
+        let count = || histogram(VkAuthPhase::AdminBind).stats().count;
+        let before = count();
+
+        rt.block_on(async {
+            drop(VkPhaseTimer::start(VkAuthPhase::AdminBind));
+        });
+        assert_eq!(count(), before);
+
+        rt.block_on(track_auth(async {
+            drop(VkPhaseTimer::start(VkAuthPhase::AdminBind));
+        }));
+        assert_eq!(count(), before + 1);
+    }
+
+    #[test]
+    fn test_histogram_percentiles() {
+        let histogram = VkHistogram::new();
+        assert_eq!(histogram.value_at_quantile(0.5), None);
+
+        for ms in 1..=1000 {
+            histogram.record(Duration::from_millis(ms));
+        }
+
+        let stats = histogram.stats();
+        assert_eq!(stats.count, 1000);
+        assert_eq!(stats.max, Duration::from_millis(1000));
+        for (value, expected_ms) in [(stats.p50, 500), (stats.p90, 900), (stats.p99, 990)] {
+            let ms = value.unwrap().as_secs_f64() * 1000.0;
+            let error = (ms - expected_ms as f64).abs() / expected_ms as f64;
+            assert!(error < 1.0 / 16.0, "{ms} is not close to {expected_ms}");
+        }
+        assert_eq!(stats.p999, Some(Duration::from_millis(1000)));
+
+        histogram.reset();
+        assert_eq!(histogram.stats().count, 0);
+        assert_eq!(histogram.value_at_quantile(0.99), None);
+    }
+}
@@ -1,18 +1,46 @@
+mod balancer;
+mod bloom;
+mod breaker;
+mod cache;
 mod connection;
 mod context;
+mod credentials;
+mod dn_cache;
 pub mod errors;
 pub mod failure_detector;
+mod group_batch;
+mod group_graph;
+pub mod group_index;
+mod group_rules;
+mod hedging;
+pub mod metrics;
+mod negative_cache;
 pub mod scheduler;
 pub mod server;
 pub mod settings;
+mod single_flight;
+pub mod slowlog;
+pub mod sync_listener;
+mod tls;
 
+pub use cache::VkCacheStats;
+pub use connection::VkPoolStats;
 use errors::VkLdapError;
-use log::error;
+pub use group_batch::VkGroupBatchStats;
+pub use group_index::VkGroupIndexStats;
+pub use hedging::VkHedgingStats;
+use log::{debug, error};
+pub use negative_cache::VkCachedRejection;
 use scheduler::CallbackTrait;
 use server::VkLdapServer;
-use settings::{VkConnectionSettings, VkLdapSettings};
+use settings::{VkCacheSettings, VkCircuitBreakerSettings, VkConnectionSettings, VkLdapSettings};
+pub use single_flight::VkCoalescingStats;
+use std::time::Duration;
+pub use sync_listener::VkSyncListenerStats;
 use url::Url;
 
+use crate::configs::LdapLoadBalancingPolicy;
+
 type Result<T> = std::result::Result<T, VkLdapError>;
 
 pub fn refresh_ldap_settings(settings: VkLdapSettings) {
@@ -20,6 +48,10 @@ pub fn refresh_ldap_settings(settings: VkLdapSettings) {
         return ();
     }
 
+    // Cached results may no longer hold with the new settings
+    flush_caches();
+    sync_listener::restart();
+
     let res = scheduler::submit_sync_task(context::refresh_ldap_settings(settings));
     if let Err(err) = res {
         error!("refresh ldap settings returned an error: {err}");
@@ -45,10 +77,173 @@ pub fn refresh_connection_settings_blocking(settings: VkConnectionSettings) {
     context::refresh_connection_settings_blocking(settings);
 }
 
+pub fn refresh_cache_settings(settings: VkCacheSettings) {
+    credentials::refresh_settings(
+        settings.credential_cache_ttl,
+        settings.credential_cache_max_entries,
+    );
+    negative_cache::refresh_settings(
+        settings.negative_cache_ttl,
+        settings.negative_cache_max_entries,
+        settings.negative_cache_filter_capacity,
+    );
+    dn_cache::refresh_settings(settings.dn_cache_ttl, settings.dn_cache_max_entries);
+    group_rules::refresh_settings(
+        settings.group_rules_cache_ttl,
+        settings.group_rules_cache_max_stale,
+        settings.group_rules_cache_max_entries,
+    );
+    group_graph::refresh_settings(
+        settings.group_graph_cache_ttl,
+        settings.group_graph_cache_max_entries,
+    );
+}
+
+pub fn set_load_balancing_policy(policy: LdapLoadBalancingPolicy) {
+    balancer::set_policy(policy);
+}
+
+pub fn refresh_circuit_breaker_settings(settings: VkCircuitBreakerSettings) {
+    breaker::refresh_settings(settings);
+}
+
+pub fn refresh_hedging_settings(enabled: bool, min_delay: Duration) {
+    hedging::refresh_settings(enabled, min_delay);
+}
+
+pub fn refresh_group_batch_settings(window: Duration, batch_size: usize) {
+    group_batch::refresh_settings(window, batch_size);
+}
+
+pub fn refresh_slowlog_settings(threshold: Option<Duration>, max_len: usize, sample_rate: u64) {
+    slowlog::refresh_settings(threshold, max_len, sample_rate);
+}
+
+/// Returns the ACL rules of `username` if its credentials were recently
+/// verified by the LDAP server, without contacting the LDAP server.
+pub fn vk_ldap_cached_credentials(username: &str, password: &str) -> Option<Vec<String>> {
+    credentials::lookup(username, password)
+}
+
+/// Returns the reason why LDAP recently rejected the credentials of
+/// `username`, without contacting the LDAP server.
+pub fn vk_ldap_cached_rejection(username: &str, password: &str) -> Option<VkCachedRejection> {
+    negative_cache::lookup(username, password)
+}
+
+pub fn invalidate_cached_user(username: &str) -> usize {
+    credentials::invalidate(username) as usize
+        + negative_cache::invalidate(username) as usize
+        + dn_cache::invalidate(username) as usize
+}
+
+pub fn invalidate_cached_group_rules(user_dn: &str) -> usize {
+    group_rules::invalidate(user_dn) as usize
+}
+
+pub fn flush_group_rules_cache() -> usize {
+    group_rules::clear() + group_graph::clear() + group_index::clear()
+}
+
+pub fn flush_caches() -> usize {
+    credentials::clear()
+        + negative_cache::clear()
+        + dn_cache::clear()
+        + group_rules::clear()
+        + group_graph::clear()
+        + group_index::clear()
+}
+
+pub fn get_cache_stats() -> Vec<(&'static str, VkCacheStats)> {
+    let mut stats = vec![
+        ("credential_cache", credentials::stats()),
+        ("negative_cache", negative_cache::stats()),
+        ("dn_cache", dn_cache::stats()),
+        ("group_rules_cache", group_rules::stats()),
+        ("group_graph_cache", group_graph::stats()),
+    ];
+    if let Some(filter_stats) = negative_cache::filter_stats() {
+        stats.push(("negative_cache_filter", filter_stats));
+    }
+    stats
+}
+
+pub fn get_coalescing_stats() -> VkCoalescingStats {
+    single_flight::stats()
+}
+
+pub fn get_hedging_stats() -> VkHedgingStats {
+    hedging::stats()
+}
+
+pub fn get_group_batch_stats() -> VkGroupBatchStats {
+    group_batch::stats()
+}
+
+pub fn get_group_index_stats() -> VkGroupIndexStats {
+    group_index::stats()
+}
+
+pub fn get_sync_listener_stats() -> VkSyncListenerStats {
+    sync_listener::stats()
+}
+
+/// Returns the stats of the (bind, search) connection pools of each server.
+pub fn get_connection_pool_stats() -> Vec<(VkPoolStats, VkPoolStats)> {
+    context::get_connection_pool_stats()
+}
+
+/// Runs the authentication `task` of `username`, sharing a single LDAP
+/// round-trip among the concurrent authentications with the same credentials.
+fn authenticate<F>(
+    username: String,
+    password: String,
+    task: F,
+) -> impl Future<Output = Result<Vec<String>>> + Send + 'static
+where
+    F: Future<Output = Result<Vec<String>>> + Send + 'static,
+{
+    single_flight::coalesce(
+        &username,
+        &password,
+        cache_auth_result(username.clone(), password.clone(), task),
+    )
+}
+
+async fn cache_auth_result<F>(username: String, password: String, task: F) -> Result<Vec<String>>
+where
+    F: Future<Output = Result<Vec<String>>>,
+{
+    let res = task.await;
+
+    match &res {
+        Ok(rules) => {
+            negative_cache::invalidate(&username);
+            credentials::store(&username, &password, rules);
+        }
+        Err(err) => {
+            // Any answer other than the server being unreachable means the
+            // cached credentials of this user can no longer be trusted.
+            if !err.is_server_unavailable() && credentials::invalidate(&username) {
+                debug!("invalidated cached credentials of user {username}");
+            }
+
+            if err.is_user_not_found() {
+                negative_cache::store_user_not_found(&username);
+            } else if err.is_invalid_credentials() {
+                negative_cache::store_invalid_credentials(&username, &password);
+            }
+        }
+    }
+
+    res
+}
+
 pub fn clear_server_list() -> Result<()> {
     if !scheduler::is_scheduler_ready() {
         return Ok(());
     }
+    flush_caches();
     scheduler::submit_sync_task(context::clear_server_list())
 }
 
@@ -168,7 +363,14 @@ where
     }
 
     scheduler::submit_async_task(
-        context::ldap_bind_and_group_rules(username, password),
+        metrics::track_auth(slowlog::trace_auth(
+            username.clone(),
+            authenticate(
+                username.clone(),
+                password.clone(),
+                context::ldap_bind_and_group_rules(username, password),
+            ),
+        )),
         callback,
         data,
     )
@@ -189,7 +391,14 @@ where
     }
 
     scheduler::submit_async_task(
-        context::ldap_search_bind_and_group_rules(username, password),
+        metrics::track_auth(slowlog::trace_auth(
+            username.clone(),
+            authenticate(
+                username.clone(),
+                password.clone(),
+                context::ldap_search_bind_and_group_rules(username, password),
+            ),
+        )),
         callback,
         data,
     )
@@ -0,0 +1,216 @@
+use std::sync::Mutex;
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::bloom::VkExpiringBloomFilter;
+use super::cache::{VkCacheStats, VkLruCache, VkPasswordHash};
+
+// False positive rate of the filter of unknown users. A false positive only
+// caches an unknown user the first time it is seen.
+const UNKNOWN_USERS_FILTER_FP_RATE: f64 = 0.0001;
+
+pub enum VkCachedRejection {
+    UserNotFound,
+    InvalidCredentials,
+}
+
+enum NegativeEntry {
+    UserNotFound,
+    InvalidCredentials(VkPasswordHash),
+}
+
+impl NegativeEntry {
+    fn matches(&self, password: &str) -> bool {
+        match self {
+            NegativeEntry::UserNotFound => true,
+            NegativeEntry::InvalidCredentials(hash) => hash.verify(password),
+        }
+    }
+
+    fn to_rejection(&self) -> VkCachedRejection {
+        match self {
+            NegativeEntry::UserNotFound => VkCachedRejection::UserNotFound,
+            NegativeEntry::InvalidCredentials(_) => VkCachedRejection::InvalidCredentials,
+        }
+    }
+}
+
+/// Remembers the users that LDAP reported as unknown, and the passwords it
+/// rejected, for a short period of time.
+///
+/// When the cache is full, a Bloom filter decides which unknown users are
+/// cached: a username is only remembered in the filter the first time it is
+/// seen, and cached the next time. This way, a large number of different
+/// usernames tried once does not evict the unknown users that keep being
+/// retried. The filter never rejects a user by itself, only the cache entries
+/// do.
+struct VkNegativeCache {
+    entries: VkLruCache<NegativeEntry>,
+    unknown_users: Option<VkExpiringBloomFilter>,
+    filter_hits: u64,
+    filter_misses: u64,
+}
+
+impl VkNegativeCache {
+    fn new() -> VkNegativeCache {
+        VkNegativeCache {
+            entries: VkLruCache::new(Duration::ZERO, 0),
+            unknown_users: None,
+            filter_hits: 0,
+            filter_misses: 0,
+        }
+    }
+
+    fn reconfigure(&mut self, ttl: Duration, max_entries: usize, filter_capacity: usize) {
+        self.entries.reconfigure(ttl, max_entries);
+
+        if !self.entries.is_enabled() || filter_capacity == 0 {
+            self.unknown_users = None;
+            return ();
+        }
+
+        let unchanged = match &self.unknown_users {
+            Some(filter) => filter.is_configured_as(filter_capacity, ttl),
+            None => false,
+        };
+
+        if !unchanged {
+            self.unknown_users = Some(VkExpiringBloomFilter::new(
+                filter_capacity,
+                UNKNOWN_USERS_FILTER_FP_RATE,
+                ttl,
+            ));
+        }
+    }
+
+    fn lookup(&mut self, username: &str, password: &str) -> Option<VkCachedRejection> {
+        self.entries
+            .get_if(username, |e| e.matches(password))
+            .map(|entry| entry.to_rejection())
+    }
+
+    fn store(&mut self, username: &str, entry: NegativeEntry) {
+        if let (NegativeEntry::UserNotFound, Some(filter)) = (&entry, self.unknown_users.as_mut()) {
+            if self.entries.is_full() && !self.entries.contains(username) {
+                if !filter.contains(username) {
+                    self.filter_misses += 1;
+                    filter.insert(username);
+                    return ();
+                }
+                self.filter_hits += 1;
+            }
+        }
+
+        self.entries.insert(username.to_string(), entry);
+    }
+
+    fn clear(&mut self) -> usize {
+        let mut count = self.entries.clear();
+        if let Some(filter) = self.unknown_users.as_mut() {
+            count += filter.len();
+            filter.reset();
+        }
+        count
+    }
+
+    fn filter_stats(&self) -> Option<VkCacheStats> {
+        self.unknown_users.as_ref().map(|filter| VkCacheStats {
+            entries: filter.len(),
+            hits: self.filter_hits,
+            misses: self.filter_misses,
+            evictions: filter.expired() as u64,
+        })
+    }
+}
+
+lazy_static! {
+    static ref NEGATIVE_CACHE: Mutex<VkNegativeCache> = Mutex::new(VkNegativeCache::new());
+}
+
+macro_rules! lock_cache {
+    () => {
+        match NEGATIVE_CACHE.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("negative cache mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+pub(super) fn refresh_settings(ttl: Duration, max_entries: usize, filter_capacity: usize) {
+    lock_cache!().reconfigure(ttl, max_entries, filter_capacity);
+}
+
+/// Returns the reason why LDAP recently rejected the pair (`username`,
+/// `password`), if it did.
+pub(super) fn lookup(username: &str, password: &str) -> Option<VkCachedRejection> {
+    lock_cache!().lookup(username, password)
+}
+
+pub(super) fn store_user_not_found(username: &str) {
+    lock_cache!().store(username, NegativeEntry::UserNotFound);
+}
+
+pub(super) fn store_invalid_credentials(username: &str, password: &str) {
+    if !lock_cache!().entries.is_enabled() {
+        return ();
+    }
+
+    // Hash the password before taking the lock to not stall concurrent lookups
+    let entry = NegativeEntry::InvalidCredentials(VkPasswordHash::new(password));
+    lock_cache!().store(username, entry);
+}
+
+pub(super) fn invalidate(username: &str) -> bool {
+    lock_cache!().entries.remove(username)
+}
+
+pub(super) fn clear() -> usize {
+    lock_cache!().clear()
+}
+
+pub(super) fn stats() -> VkCacheStats {
+    lock_cache!().entries.stats()
+}
+
+pub(super) fn filter_stats() -> Option<VkCacheStats> {
+    lock_cache!().filter_stats()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_unknown_users_are_cached_when_seen_again() {
+        let mut cache = VkNegativeCache::new();
+        cache.reconfigure(Duration::from_secs(60), 1, 100);
+
+        cache.store(
+            "user1",
+            NegativeEntry::InvalidCredentials(VkPasswordHash::new("pw")),
+        );
+
+        // The cache is full, the first rejection is only kept in the filter
+        cache.store("ghost", NegativeEntry::UserNotFound);
+        assert!(cache.lookup("ghost", "any").is_none());
+        assert!(matches!(
+            cache.lookup("user1", "pw"),
+            Some(VkCachedRejection::InvalidCredentials)
+        ));
+
+        cache.store("ghost", NegativeEntry::UserNotFound);
+        assert!(matches!(
+            cache.lookup("ghost", "any"),
+            Some(VkCachedRejection::UserNotFound)
+        ));
+        assert!(cache.lookup("user1", "pw").is_none());
+
+        let stats = cache.filter_stats().unwrap();
+        assert_eq!((stats.hits, stats.misses), (1, 1));
+    }
+}
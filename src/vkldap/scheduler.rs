@@ -1,12 +1,7 @@
-use std::{
-    any::Any,
-    sync::{Arc, Condvar, Mutex, RwLock, mpsc},
-    thread,
-};
+use std::sync::RwLock;
 
-use futures::future::BoxFuture;
 use lazy_static::lazy_static;
-use log::{debug, error};
+use log::debug;
 use tokio::runtime;
 
 use super::{Result, errors::VkLdapError};
@@ -21,169 +16,53 @@ impl<R, TT: Future<Output = R> + Send + 'static> TaskTrait<R> for TT {}
 pub trait CallbackTrait<T: Send, R>: Fn(Option<T>, R) -> () + 'static + Send {}
 impl<T: Send, R, CT: Fn(Option<T>, R) -> () + 'static + Send> CallbackTrait<T, R> for CT {}
 
-async fn coerce_future_output<F, R: 'static>(f: F) -> Box<dyn Any>
-where
-    F: TaskTrait<R>,
-{
-    Box::new(f.await)
-}
-
-fn downcast_callback_input<C, R, T>(
-    c: C,
-) -> Box<dyn CallbackTrait<Box<dyn Any + Send>, Box<dyn Any>>>
-where
-    C: CallbackTrait<T, R>,
-    R: 'static,
-    T: 'static + Send,
-{
-    Box::new(
-        move |data: Option<Box<dyn Any + Send>>, res: Box<dyn Any>| {
-            let r = res.downcast::<R>();
-            assert!(r.is_ok());
-            if let Ok(r) = r {
-                match data {
-                    Some(d) => {
-                        let d = d.downcast::<T>();
-                        assert!(d.is_ok());
-                        if let Ok(d) = d {
-                            c(Some(*d), *r)
-                        }
-                    }
-                    None => c(None, *r),
-                }
-            }
-        },
-    )
-}
-
-struct Task {
-    task: BoxFuture<'static, Box<dyn Any>>,
-    callback: Box<dyn CallbackTrait<Box<dyn Any + Send>, Box<dyn Any>>>,
-    data: Option<Box<dyn Any + Send>>,
-}
-
-impl Task {
-    fn new<F, C, R, T>(task: F, callback: C, data: Option<T>) -> Task
-    where
-        F: TaskTrait<R>,
-        C: CallbackTrait<T, R>,
-        R: 'static,
-        T: 'static + Send,
-    {
-        Task {
-            task: Box::pin(coerce_future_output(task)),
-            callback: downcast_callback_input(callback),
-            data: match data {
-                Some(data) => Some(Box::new(data)),
-                None => None,
-            },
-        }
-    }
-}
-
-unsafe impl Send for Task {}
-
-enum Job {
-    Shutdown,
-    Task(Task),
-}
-
-struct SchedulerState {
-    thread_handler: thread::JoinHandle<()>,
-    job_tx: mpsc::Sender<Job>,
-}
-
 struct Scheduler {
-    state: Option<SchedulerState>,
-}
-
-struct JobSender {
-    sender: mpsc::Sender<Job>,
-}
-
-impl JobSender {
-    fn new(sender: mpsc::Sender<Job>) -> JobSender {
-        JobSender { sender }
-    }
-
-    fn send(&self, job: Job) -> Result<()> {
-        match self.sender.send(job) {
-            Ok(_) => Ok(()),
-            Err(err) => Err(VkLdapError::FailedToSendJobToScheduler(err.to_string())),
-        }
-    }
+    runtime: Option<runtime::Runtime>,
 }
 
 impl Scheduler {
     fn new() -> Scheduler {
-        Scheduler { state: None }
+        Scheduler { runtime: None }
     }
 
     fn is_initialized(&self) -> bool {
-        self.state.is_some()
+        self.runtime.is_some()
     }
 
-    fn initialize(&mut self) {
-        let (job_tx, job_rx): (mpsc::Sender<Job>, mpsc::Receiver<Job>) = mpsc::channel();
-        let async_rt = runtime::Builder::new_multi_thread()
-            .enable_all()
-            .build()
-            .unwrap();
-
-        let handler = thread::spawn(move || {
-            debug!("job scheduler thread started");
-            async_rt.block_on(async move {
-                scheduler_loop(job_rx);
-            });
-            debug!("job scheduler thread ended");
-        });
-
-        self.state = Some(SchedulerState {
-            thread_handler: handler,
-            job_tx: job_tx,
-        });
-    }
+    /// Starts the async runtime with `worker_threads` threads. When
+    /// `worker_threads` is zero, tokio uses one thread per CPU core.
+    fn initialize(&mut self, worker_threads: usize) {
+        let mut builder = runtime::Builder::new_multi_thread();
+        builder.enable_all().thread_name("ldap-worker");
+        if worker_threads > 0 {
+            builder.worker_threads(worker_threads);
+        }
 
-    fn get_sender(&self) -> JobSender {
-        JobSender::new(self.state.as_ref().unwrap().job_tx.clone())
+        self.runtime = Some(builder.build().unwrap());
+        debug!("job scheduler started with {worker_threads} worker threads");
     }
 
-    fn shutdown(&mut self) -> Result<()> {
-        let sender = self.get_sender();
-        sender.send(Job::Shutdown)?;
-
-        let handler = self.state.take().unwrap().thread_handler;
-        match handler.join() {
-            Ok(_) => Ok(()),
-            Err(_) => {
-                error!("the scheduler thread returned an error");
-                Err(VkLdapError::FailedToShutdownJobScheduler)
-            }
+    fn get_handle(&self) -> Result<runtime::Handle> {
+        match self.runtime.as_ref() {
+            Some(runtime) => Ok(runtime.handle().clone()),
+            None => Err(VkLdapError::SchedulerNotReady),
         }
     }
-}
 
-fn scheduler_loop(job_rx: mpsc::Receiver<Job>) {
-    loop {
-        match job_rx.recv() {
-            Ok(job) => match job {
-                Job::Shutdown => return (),
-                Job::Task(task) => {
-                    tokio::spawn(async move {
-                        let res = task.task.await;
-                        (task.callback)(task.data, res);
-                    });
-                }
-            },
-            Err(err) => {
-                error!("scheduler got an error while waiting for new job: {err}");
+    fn shutdown(&mut self) -> Result<()> {
+        match self.runtime.take() {
+            Some(runtime) => {
+                runtime.shutdown_background();
+                debug!("job scheduler stopped");
+                Ok(())
             }
+            None => Err(VkLdapError::FailedToShutdownJobScheduler),
         }
     }
 }
 
-pub fn start_job_scheduler() {
-    SCHEDULER.write().unwrap().initialize();
+pub fn start_job_scheduler(worker_threads: usize) {
+    SCHEDULER.write().unwrap().initialize(worker_threads);
 }
 
 pub fn stop_job_scheduler() -> Result<()> {
@@ -194,59 +73,28 @@ pub fn is_scheduler_ready() -> bool {
     SCHEDULER.read().unwrap().is_initialized()
 }
 
-struct Notify<T: Send> {
-    lock: Mutex<Option<T>>,
-    cvar: Condvar,
-}
-
-impl<T: Send> Notify<T> {
-    fn new() -> Notify<T> {
-        Notify {
-            lock: Mutex::new(None),
-            cvar: Condvar::new(),
-        }
-    }
-
-    fn notify(&self, res: T) {
-        let mut cond = self.lock.lock().unwrap();
-        *cond = Some(res);
-        self.cvar.notify_one();
-    }
-
-    fn wait(&self) -> T {
-        let mut cond = self.lock.lock().unwrap();
-        while (*cond).is_none() {
-            cond = self.cvar.wait(cond).unwrap();
-        }
-        cond.take().unwrap()
-    }
+fn get_runtime_handle() -> Result<runtime::Handle> {
+    SCHEDULER.read().unwrap().get_handle()
 }
 
+/// Runs `task` in the runtime and blocks the calling thread until it
+/// completes. Must not be called from a runtime thread.
 pub fn submit_sync_task<F, R>(task: F) -> Result<R>
 where
     F: TaskTrait<R>,
     R: 'static + Send,
 {
-    let notify = Arc::new(Notify::<R>::new());
-    let notify2 = Arc::clone(&notify);
-
-    let payload = Task::new::<_, _, _, ()>(
-        task,
-        move |_, res| {
-            notify2.notify(res);
-        },
-        None,
-    );
+    let handle = get_runtime_handle()?;
+    let join_handle = handle.spawn(task);
 
-    SCHEDULER
-        .read()
-        .unwrap()
-        .get_sender()
-        .send(Job::Task(payload))?;
-
-    Ok(notify.wait())
+    match handle.block_on(join_handle) {
+        Ok(res) => Ok(res),
+        Err(err) => Err(VkLdapError::ScheduledTaskFailed(err.to_string())),
+    }
 }
 
+/// Spawns `task` in the runtime, and calls `callback` with `data` and the
+/// result of `task` once it completes.
 pub fn submit_async_task<F, C, R, T>(task: F, callback: C, data: T) -> Result<()>
 where
     F: TaskTrait<R>,
@@ -254,11 +102,49 @@ where
     R: 'static,
     T: 'static + Send,
 {
-    let payload = Task::new(task, callback, Some(data));
+    let handle = get_runtime_handle()?;
+
+    handle.spawn(async move {
+        let res = task.await;
+        callback(Some(data), res);
+    });
+
+    Ok(())
+}
+
+/// Spawns a long running `task` in the runtime.
+pub fn spawn_task<F>(task: F) -> Result<tokio::task::JoinHandle<()>>
+where
+    F: TaskTrait<()>,
+{
+    let handle = get_runtime_handle()?;
+    Ok(handle.spawn(task))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
 
-    SCHEDULER
-        .read()
-        .unwrap()
-        .get_sender()
-        .send(Job::Task(payload))
+    #[test]
+    fn test_tasks_run_in_runtime() {
+        start_job_scheduler(2);
+
+        let res = submit_sync_task(async { std::thread::current().name().map(String::from) });
+        assert_eq!(res.ok().flatten().as_deref(), Some("ldap-worker"));
+
+        let (tx, rx) = std::sync::mpsc::channel();
+        let res = submit_async_task(
+            async { 40 },
+            move |data: Option<i32>, res: i32| {
+                let _ = tx.send(data.unwrap_or(0) + res);
+            },
+            2,
+        );
+        assert!(res.is_ok());
+        assert_eq!(rx.recv().ok(), Some(42));
+
+        assert!(stop_job_scheduler().is_ok());
+        assert!(!is_scheduler_ready());
+        assert!(submit_sync_task(async {}).is_err());
+    }
 }
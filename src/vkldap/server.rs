@@ -1,7 +1,11 @@
+use std::sync::Arc;
 use std::time::Duration;
 
 use url::Url;
 
+use super::balancer::{VkServerLoad, VkServerLoadStats};
+use super::breaker::{VkCircuitBreaker, VkCircuitState};
+
 #[derive(Clone)]
 pub enum VkLdapServerStatus {
     HEALTHY,
@@ -29,6 +33,8 @@ pub struct VkLdapServer {
     id: usize,
     status: VkLdapServerStatus,
     ping_time: Option<Duration>,
+    load: Arc<VkServerLoad>,
+    breaker: Arc<VkCircuitBreaker>,
 }
 
 impl VkLdapServer {
@@ -38,6 +44,8 @@ impl VkLdapServer {
             id,
             status,
             ping_time: None,
+            load: Arc::new(VkServerLoad::default()),
+            breaker: Arc::new(VkCircuitBreaker::default()),
         }
     }
 
@@ -69,6 +77,26 @@ impl VkLdapServer {
         self.ping_time
     }
 
+    pub(super) fn get_load(&self) -> &VkServerLoad {
+        &self.load
+    }
+
+    pub fn get_load_stats(&self) -> VkServerLoadStats {
+        self.load.stats()
+    }
+
+    pub(super) fn get_breaker(&self) -> &VkCircuitBreaker {
+        &self.breaker
+    }
+
+    pub fn get_circuit_state(&self) -> VkCircuitState {
+        self.breaker.state()
+    }
+
+    pub fn get_circuit_trips(&self) -> u64 {
+        self.breaker.trips()
+    }
+
     pub fn get_host_string(&self) -> String {
         match self.url.host() {
             Some(host) => host.to_string(),
@@ -2,7 +2,7 @@ use std::time::Duration;
 
 use ldap3::Scope;
 
-use crate::configs::LdapSearchScope;
+use crate::configs::{LdapGroupNesting, LdapSearchScope};
 
 impl From<LdapSearchScope> for Scope {
     fn from(value: LdapSearchScope) -> Self {
@@ -33,6 +33,10 @@ pub struct VkLdapSettings {
     #[allow(dead_code)]
     pub groups_name_attribute: String,
     pub groups_rules_attribute: String,
+    pub groups_search_page_size: i32,
+    pub groups_search_size_limit: i32,
+    pub groups_nesting: LdapGroupNesting,
+    pub groups_member_of_attribute: Option<String>,
 }
 
 impl VkLdapSettings {
@@ -52,6 +56,10 @@ impl VkLdapSettings {
         groups_member_attribute: String,
         groups_name_attribute: String,
         groups_rules_attribute: String,
+        groups_search_page_size: i32,
+        groups_search_size_limit: i32,
+        groups_nesting: LdapGroupNesting,
+        groups_member_of_attribute: Option<String>,
     ) -> Self {
         Self {
             bind_db_prefix,
@@ -69,10 +77,22 @@ impl VkLdapSettings {
             groups_member_attribute,
             groups_name_attribute,
             groups_rules_attribute,
+            groups_search_page_size,
+            groups_search_size_limit,
+            groups_nesting,
+            groups_member_of_attribute,
         }
     }
 }
 
+impl VkLdapSettings {
+    /// Returns true if the searches bind as the search bind DN. Otherwise they
+    /// are anonymous, unless they run on a connection bound as the user.
+    pub fn has_search_bind(&self) -> bool {
+        self.search_bind_dn.is_some() && self.search_bind_passwd.is_some()
+    }
+}
+
 impl Default for VkLdapSettings {
     fn default() -> Self {
         Self {
@@ -91,6 +111,10 @@ impl Default for VkLdapSettings {
             groups_member_attribute: "member".to_string(),
             groups_name_attribute: "cn".to_string(),
             groups_rules_attribute: "valkeyACL".to_string(),
+            groups_search_page_size: 500,
+            groups_search_size_limit: 0,
+            groups_nesting: LdapGroupNesting::Direct,
+            groups_member_of_attribute: Default::default(),
         }
     }
 }
@@ -102,6 +126,14 @@ pub struct VkConnectionSettings {
     pub client_cert_path: Option<String>,
     pub client_key_path: Option<String>,
     pub connection_pool_size: usize,
+    pub connection_pool_max_size: usize,
+    pub search_connection_pool_size: usize,
+    pub search_connection_pool_max_size: usize,
+    pub search_connection_multiplexing: bool,
+    pub connection_pool_growth_threshold: Duration,
+    pub connection_pool_idle_timeout: Duration,
+    pub connection_pool_max_wait: Duration,
+    pub connection_pool_max_waiters: usize,
     pub timeout_connection: Duration,
 }
 
@@ -112,6 +144,14 @@ impl VkConnectionSettings {
         client_cert_path: Option<String>,
         client_key_path: Option<String>,
         connection_pool_size: usize,
+        connection_pool_max_size: usize,
+        search_connection_pool_size: usize,
+        search_connection_pool_max_size: usize,
+        search_connection_multiplexing: bool,
+        connection_pool_growth_threshold: Duration,
+        connection_pool_idle_timeout: Duration,
+        connection_pool_max_wait: Duration,
+        connection_pool_max_waiters: usize,
         timeout_connection: Duration,
     ) -> Self {
         Self {
@@ -120,6 +160,14 @@ impl VkConnectionSettings {
             client_cert_path,
             client_key_path,
             connection_pool_size,
+            connection_pool_max_size,
+            search_connection_pool_size,
+            search_connection_pool_max_size,
+            search_connection_multiplexing,
+            connection_pool_growth_threshold,
+            connection_pool_idle_timeout,
+            connection_pool_max_wait,
+            connection_pool_max_waiters,
             timeout_connection,
         }
     }
@@ -133,7 +181,125 @@ impl Default for VkConnectionSettings {
             client_cert_path: Default::default(),
             client_key_path: Default::default(),
             connection_pool_size: 0,
+            connection_pool_max_size: 0,
+            search_connection_pool_size: 0,
+            search_connection_pool_max_size: 0,
+            search_connection_multiplexing: false,
+            connection_pool_growth_threshold: Default::default(),
+            connection_pool_idle_timeout: Default::default(),
+            connection_pool_max_wait: Default::default(),
+            connection_pool_max_waiters: 0,
             timeout_connection: Default::default(),
         }
     }
 }
+
+#[derive(Clone)]
+pub struct VkCacheSettings {
+    pub credential_cache_ttl: Duration,
+    pub credential_cache_max_entries: usize,
+    pub negative_cache_ttl: Duration,
+    pub negative_cache_max_entries: usize,
+    pub negative_cache_filter_capacity: usize,
+    pub dn_cache_ttl: Duration,
+    pub dn_cache_max_entries: usize,
+    pub group_rules_cache_ttl: Duration,
+    pub group_rules_cache_max_stale: Duration,
+    pub group_rules_cache_max_entries: usize,
+    pub group_graph_cache_ttl: Duration,
+    pub group_graph_cache_max_entries: usize,
+}
+
+impl VkCacheSettings {
+    pub fn new(
+        credential_cache_ttl: Duration,
+        credential_cache_max_entries: usize,
+        negative_cache_ttl: Duration,
+        negative_cache_max_entries: usize,
+        negative_cache_filter_capacity: usize,
+        dn_cache_ttl: Duration,
+        dn_cache_max_entries: usize,
+        group_rules_cache_ttl: Duration,
+        group_rules_cache_max_stale: Duration,
+        group_rules_cache_max_entries: usize,
+        group_graph_cache_ttl: Duration,
+        group_graph_cache_max_entries: usize,
+    ) -> Self {
+        Self {
+            credential_cache_ttl,
+            credential_cache_max_entries,
+            negative_cache_ttl,
+            negative_cache_max_entries,
+            negative_cache_filter_capacity,
+            dn_cache_ttl,
+            dn_cache_max_entries,
+            group_rules_cache_ttl,
+            group_rules_cache_max_stale,
+            group_rules_cache_max_entries,
+            group_graph_cache_ttl,
+            group_graph_cache_max_entries,
+        }
+    }
+}
+
+impl Default for VkCacheSettings {
+    fn default() -> Self {
+        Self {
+            credential_cache_ttl: Default::default(),
+            credential_cache_max_entries: 0,
+            negative_cache_ttl: Default::default(),
+            negative_cache_max_entries: 0,
+            negative_cache_filter_capacity: 0,
+            dn_cache_ttl: Default::default(),
+            dn_cache_max_entries: 0,
+            group_rules_cache_ttl: Default::default(),
+            group_rules_cache_max_stale: Default::default(),
+            group_rules_cache_max_entries: 0,
+            group_graph_cache_ttl: Default::default(),
+            group_graph_cache_max_entries: 0,
+        }
+    }
+}
+
+#[derive(Clone)]
+pub struct VkCircuitBreakerSettings {
+    pub window: Duration,
+    pub min_requests: usize,
+    pub failure_rate: f64,
+    pub slow_call: Option<Duration>,
+    pub open_duration: Duration,
+    pub half_open_requests: usize,
+}
+
+impl VkCircuitBreakerSettings {
+    pub fn new(
+        window: Duration,
+        min_requests: usize,
+        failure_rate: f64,
+        slow_call: Option<Duration>,
+        open_duration: Duration,
+        half_open_requests: usize,
+    ) -> Self {
+        Self {
+            window,
+            min_requests,
+            failure_rate,
+            slow_call,
+            open_duration,
+            half_open_requests,
+        }
+    }
+}
+
+impl Default for VkCircuitBreakerSettings {
+    fn default() -> Self {
+        Self {
+            window: Default::default(),
+            min_requests: 0,
+            failure_rate: 1.0,
+            slow_call: None,
+            open_duration: Default::default(),
+            half_open_requests: 1,
+        }
+    }
+}
@@ -0,0 +1,131 @@
+use std::collections::HashMap;
+use std::sync::Mutex;
+use std::sync::atomic::{AtomicU64, Ordering};
+
+use futures::FutureExt;
+use futures::future::{BoxFuture, Shared};
+use lazy_static::lazy_static;
+use log::{debug, error};
+use sha2::{Digest, Sha256};
+
+use super::Result;
+use super::errors::{VkLdapError, VkLdapErrorSummary};
+
+type FlightKey = [u8; 32];
+type FlightResult = std::result::Result<Vec<String>, VkLdapErrorSummary>;
+type Flight = Shared<BoxFuture<'static, FlightResult>>;
+
+#[derive(Clone, Copy, Default)]
+pub struct VkCoalescingStats {
+    pub in_flight: usize,
+    pub coalesced: u64,
+}
+
+lazy_static! {
+    static ref IN_FLIGHT: Mutex<HashMap<FlightKey, Flight>> = Mutex::new(HashMap::new());
+    // The keys of the in-flight map are derived from the passwords, so they are
+    // salted to make them useless outside of this process.
+    static ref KEY_SALT: [u8; 16] = rand::random();
+}
+
+static COALESCED: AtomicU64 = AtomicU64::new(0);
+
+macro_rules! lock_in_flight {
+    () => {
+        match IN_FLIGHT.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("in-flight authentications mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+fn flight_key(username: &str, password: &str) -> FlightKey {
+    let mut hasher = Sha256::new();
+    hasher.update(&*KEY_SALT);
+    hasher.update((username.len() as u64).to_le_bytes());
+    hasher.update(username.as_bytes());
+    hasher.update(password.as_bytes());
+    hasher.finalize().into()
+}
+
+/// Runs `task` unless an authentication of the same (`username`, `password`)
+/// pair is already in flight, in which case the result of the running one is
+/// awaited instead.
+pub(super) fn coalesce<F>(
+    username: &str,
+    password: &str,
+    task: F,
+) -> impl Future<Output = Result<Vec<String>>> + Send + use<F>
+where
+    F: Future<Output = Result<Vec<String>>> + Send + 'static,
+{
+    let key = flight_key(username, password);
+
+    let flight = {
+        let mut in_flight = lock_in_flight!();
+        match in_flight.get(&key) {
+            Some(flight) => {
+                debug!("joining in-flight authentication of user {username}");
+                COALESCED.fetch_add(1, Ordering::Relaxed);
+                flight.clone()
+            }
+            None => {
+                let flight = async move {
+                    let res = task.await;
+                    // Remove the flight before any caller sees the result, so
+                    // that later authentications start a new one.
+                    lock_in_flight!().remove(&key);
+                    res.map_err(|err| VkLdapErrorSummary::from(&err))
+                }
+                .boxed()
+                .shared();
+                in_flight.insert(key, flight.clone());
+                flight
+            }
+        }
+    };
+
+    async move { flight.await.map_err(VkLdapError::Coalesced) }
+}
+
+pub(super) fn stats() -> VkCoalescingStats {
+    VkCoalescingStats {
+        in_flight: lock_in_flight!().len(),
+        coalesced: COALESCED.load(Ordering::Relaxed),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_concurrent_authentications_are_coalesced() {
+        let rt = tokio::runtime::Builder::new_current_thread()
+            .build()
+            .unwrap();
+        let (tx, rx) = futures::channel::oneshot::channel::<()>();
+
+        let first = coalesce("coalesce_user", "pw", async move {
+            let _ = rx.await;
+            Ok(vec!["+@all".to_string()])
+        });
+        // Would fail if it was not coalesced with the first one
+        let second = coalesce("coalesce_user", "pw", async {
+            Err(VkLdapError::NoHealthyServerAvailable)
+        });
+        let other = coalesce("coalesce_user", "other", async {
+            Err(VkLdapError::NoServerConfigured)
+        });
+
+        let _ = tx.send(());
+        let (first, second, other) = rt.block_on(async { futures::join!(first, second, other) });
+
+        assert_eq!(first.ok(), Some(vec!["+@all".to_string()]));
+        assert_eq!(second.ok(), Some(vec!["+@all".to_string()]));
+        assert!(other.is_err_and(|err| err.is_server_unavailable()));
+    }
+}
@@ -0,0 +1,266 @@
+use std::cell::RefCell;
+use std::collections::VecDeque;
+use std::sync::Mutex;
+use std::sync::atomic::{AtomicI64, AtomicU64, AtomicUsize, Ordering};
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+
+use lazy_static::lazy_static;
+use log::error;
+
+use super::Result;
+use super::metrics::VkAuthPhase;
+
+static THRESHOLD_MS: AtomicI64 = AtomicI64::new(100);
+static MAX_LEN: AtomicUsize = AtomicUsize::new(128);
+static SAMPLE_RATE: AtomicU64 = AtomicU64::new(0);
+
+static AUTHENTICATIONS: AtomicU64 = AtomicU64::new(0);
+static NEXT_ID: AtomicU64 = AtomicU64::new(0);
+
+/// An authentication that was slower than the slowlog threshold, or that was
+/// sampled.
+#[derive(Clone)]
+pub struct VkSlowlogEntry {
+    pub id: u64,
+    /// Seconds since the UNIX epoch when the authentication completed
+    pub timestamp: u64,
+    pub duration: Duration,
+    pub username: String,
+    /// The host of the last server that the authentication was sent to
+    pub server: Option<String>,
+    pub user_dn: Option<String>,
+    /// The time spent in each phase, in the order the phases first ran
+    pub phases: Vec<(VkAuthPhase, Duration)>,
+    /// `0` on success, the LDAP result code of the failed operation if the
+    /// server answered it, or `-1`
+    pub result_code: i64,
+    pub error: Option<String>,
+    /// The number of servers that the authentication was sent to
+    pub attempts: u32,
+    pub sampled: bool,
+}
+
+/// What an authentication did so far, collected while it runs.
+#[derive(Default)]
+struct VkAuthTrace {
+    phases: Vec<(VkAuthPhase, Duration)>,
+    server: Option<String>,
+    user_dn: Option<String>,
+    attempts: u32,
+}
+
+tokio::task_local! {
+    static TRACE: RefCell<VkAuthTrace>;
+}
+
+lazy_static! {
+    static ref SLOWLOG: Mutex<VecDeque<VkSlowlogEntry>> = Mutex::new(VecDeque::new());
+}
+
+macro_rules! lock_slowlog {
+    () => {
+        match SLOWLOG.lock() {
+            Ok(guard) => guard,
+            Err(poisoned) => {
+                error!("slowlog mutex is poisoned, recovering");
+                poisoned.into_inner()
+            }
+        }
+    };
+}
+
+/// `threshold` of `None` logs no authentication for being slow, and
+/// `sample_rate` of `0` samples none.
+pub(super) fn refresh_settings(threshold: Option<Duration>, max_len: usize, sample_rate: u64) {
+    let threshold_ms = threshold.map_or(-1, |threshold| threshold.as_millis() as i64);
+    THRESHOLD_MS.store(threshold_ms, Ordering::Relaxed);
+    MAX_LEN.store(max_len, Ordering::Relaxed);
+    SAMPLE_RATE.store(sample_rate, Ordering::Relaxed);
+
+    let mut slowlog = lock_slowlog!();
+    while slowlog.len() > max_len {
+        slowlog.pop_back();
+    }
+}
+
+fn threshold() -> Option<Duration> {
+    match THRESHOLD_MS.load(Ordering::Relaxed) {
+        ms if ms < 0 => None,
+        ms => Some(Duration::from_millis(ms as u64)),
+    }
+}
+
+/// Returns true for one in every `ldap.slowlog_sample_rate` authentications.
+fn is_sampled() -> bool {
+    match SAMPLE_RATE.load(Ordering::Relaxed) {
+        0 => false,
+        rate => AUTHENTICATIONS.fetch_add(1, Ordering::Relaxed) % rate == 0,
+    }
+}
+
+/// Adds `latency` to the time that the current authentication spent in
+/// `phase`. Does nothing outside of a traced authentication.
+pub(super) fn add_phase(phase: VkAuthPhase, latency: Duration) {
+    let _ = TRACE.try_with(|trace| {
+        let mut trace = trace.borrow_mut();
+        match trace.phases.iter_mut().find(|(p, _)| *p == phase) {
+            Some((_, total)) => *total += latency,
+            None => trace.phases.push((phase, latency)),
+        }
+    });
+}
+
+/// Records that the current authentication is sent to the server of `host`.
+pub(super) fn note_attempt<H: FnOnce() -> String>(host: H) {
+    let _ = TRACE.try_with(|trace| {
+        let mut trace = trace.borrow_mut();
+        trace.server = Some(host());
+        trace.attempts += 1;
+    });
+}
+
+pub(super) fn note_user_dn(user_dn: &str) {
+    let _ = TRACE.try_with(|trace| trace.borrow_mut().user_dn = Some(user_dn.to_string()));
+}
+
+/// Wraps the authentication `task` of `username`, to log it in the slowlog
+/// if it is slower than the threshold or sampled.
+pub(super) fn trace_auth<F>(
+    username: String,
+    task: F,
+) -> impl Future<Output = Result<Vec<String>>> + Send + 'static
+where
+    F: Future<Output = Result<Vec<String>>> + Send + 'static,
+{
+    let submitted = Instant::now();
+
+    async move {
+        let queue_wait = submitted.elapsed();
+        let sampled = is_sampled();
+        let threshold = threshold();
+        if threshold.is_none() && !sampled {
+            return task.await;
+        }
+
+        let trace = VkAuthTrace {
+            phases: vec![(VkAuthPhase::QueueWait, queue_wait)],
+            ..Default::default()
+        };
+        let (res, trace) = TRACE
+            .scope(RefCell::new(trace), async move {
+                let res = task.await;
+                (res, TRACE.with(|trace| trace.take()))
+            })
+            .await;
+
+        let duration = submitted.elapsed();
+        if sampled || threshold.is_some_and(|threshold| duration >= threshold) {
+            let (result_code, error) = match &res {
+                Ok(_) => (0, None),
+                Err(err) => (
+                    err.result_code().map_or(-1, |rc| rc as i64),
+                    Some(err.to_string()),
+                ),
+            };
+            push(VkSlowlogEntry {
+                id: 0,
+                timestamp: SystemTime::now()
+                    .duration_since(UNIX_EPOCH)
+                    .map_or(0, |now| now.as_secs()),
+                duration,
+                username,
+                server: trace.server,
+                user_dn: trace.user_dn,
+                phases: trace.phases,
+                result_code,
+                error,
+                attempts: trace.attempts,
+                sampled,
+            });
+        }
+
+        res
+    }
+}
+
+fn push(mut entry: VkSlowlogEntry) {
+    let max_len = MAX_LEN.load(Ordering::Relaxed);
+    if max_len == 0 {
+        return;
+    }
+
+    entry.id = NEXT_ID.fetch_add(1, Ordering::Relaxed);
+    let mut slowlog = lock_slowlog!();
+    slowlog.push_front(entry);
+    slowlog.truncate(max_len);
+}
+
+/// Returns the `count` most recent entries, newest first.
+pub fn entries(count: usize) -> Vec<VkSlowlogEntry> {
+    lock_slowlog!().iter().take(count).cloned().collect()
+}
+
+pub fn len() -> usize {
+    lock_slowlog!().len()
+}
+
+pub fn reset() {
+    lock_slowlog!().clear();
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use super::super::errors::VkLdapError;
+
+    #[test]
+    fn test_slow_authentications_are_logged() {
+        let rt = tokio::runtime::Builder::new_current_thread()
+            .enable_all()
+            .build()
+            .unwrap();
+
+        refresh_settings(Some(Duration::ZERO), 2, 0);
+        reset();
+
+        for username in ["user1", "u2", "u3"] {
+            let task = async move {
+                note_attempt(|| "ldap".to_string());
+                note_attempt(|| "ldap-2".to_string());
+                note_user_dn(&format!("cn={username},dc=valkey,dc=io"));
+                add_phase(VkAuthPhase::UserBind, Duration::from_millis(2));
+                add_phase(VkAuthPhase::UserBind, Duration::from_millis(3));
+                Err(VkLdapError::NoHealthyServerAvailable)
+            };
+            let res = rt.block_on(trace_auth(username.to_string(), task));
+            assert!(res.is_err());
+        }
+
+        // Only the newest entries are kept
+        assert_eq!(len(), 2);
+        let entries = entries(10);
+        assert_eq!(entries[0].username, "u3");
+        assert_eq!(entries[1].username, "u2");
+
+        let entry = &entries[0];
+        assert_eq!(entry.server.as_deref(), Some("ldap-2"));
+        assert_eq!(entry.user_dn.as_deref(), Some("cn=u3,dc=valkey,dc=io"));
+        assert_eq!(entry.attempts, 2);
+        assert_eq!(entry.result_code, -1);
+        assert!(entry.error.is_some());
+        assert!(!entry.sampled);
+        assert_eq!(entry.phases[0].0, VkAuthPhase::QueueWait);
+        assert_eq!(
+            entry.phases[1],
+            (VkAuthPhase::UserBind, Duration::from_millis(5))
+        );
+
+        // Logging can be disabled
+        refresh_settings(None, 2, 0);
+        reset();
+        let res = rt.block_on(trace_auth("user1".to_string(), async { Ok(Vec::new()) }));
+        assert!(res.is_ok());
+        assert_eq!(len(), 0);
+    }
+}
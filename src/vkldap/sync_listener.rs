@@ -0,0 +1,921 @@
+use std::collections::{HashMap, HashSet};
+use std::sync::Mutex;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::time::Duration;
+
+use lazy_static::lazy_static;
+use ldap3::controls::{ControlType, EntryState, SyncDone, SyncState};
+use ldap3::{ResultEntry, SearchEntry, SearchStream, SyncInfo, parse_syncinfo};
+use log::{debug, error, info};
+use tokio::sync::Notify;
+use tokio::task::JoinHandle;
+
+use super::connection::{
+    VkEntryChange, VkEntryChangeType, VkLdapConnection, entry_change, normalize_dn,
+    streaming_search_error,
+};
+use super::context;
+use super::errors::VkLdapError;
+use super::server::VkLdapServer;
+use super::settings::VkLdapSettings;
+use super::{
+    Result, credentials, dn_cache, group_graph, group_index, group_rules, negative_cache, scheduler,
+};
+
+/// How often a running synchronization checks that its server is still
+/// healthy, and that it must keep running.
+const CHECK_INTERVAL: Duration = Duration::from_secs(1);
+const MIN_RECONNECT_BACKOFF: Duration = Duration::from_secs(1);
+const MAX_RECONNECT_BACKOFF: Duration = Duration::from_secs(30);
+/// The e-syncRefreshRequired result code, sent by the server when it cannot
+/// resume the synchronization from the cookie.
+const SYNC_REFRESH_REQUIRED: u32 = 4096;
+/// The unavailableCriticalExtension result code, sent by the servers that do
+/// not support the content synchronization control.
+const UNAVAILABLE_CRITICAL_EXTENSION: u32 = 12;
+/// The attribute that identifies the entries of a persistent search.
+const ENTRY_UUID_ATTRIBUTE: &str = "entryUUID";
+
+/// An entry of the directory, as last received from the server.
+struct VkSyncedEntry {
+    dn: String,
+    usernames: Vec<String>,
+    // The members of the entry, if it is a group
+    members: Option<Vec<String>>,
+}
+
+impl VkSyncedEntry {
+    fn new(mut sentry: SearchEntry, settings: &VkLdapSettings) -> VkSyncedEntry {
+        let username_attr = settings.search_attribute.as_deref().unwrap_or("uid");
+
+        // In bind mode, the username is the value of the first RDN of the DN
+        let mut usernames: Vec<String> = sentry
+            .dn
+            .split(',')
+            .next()
+            .and_then(|rdn| rdn.split_once('='))
+            .map(|(_, value)| value.trim().to_string())
+            .into_iter()
+            .collect();
+        for username in sentry.attrs.remove(username_attr).unwrap_or_default() {
+            if !usernames.contains(&username) {
+                usernames.push(username);
+            }
+        }
+
+        VkSyncedEntry {
+            dn: sentry.dn,
+            usernames,
+            members: sentry.attrs.remove(&settings.groups_member_attribute),
+        }
+    }
+}
+
+/// The cache entries to drop after changes of the directory.
+#[derive(Default)]
+struct VkSyncInvalidations {
+    flush_all: bool,
+    usernames: HashSet<String>,
+    user_dns: HashSet<String>,
+    all_credentials: bool,
+    // A group that is a member of the changed group affects users through
+    // nested groups
+    all_group_rules: bool,
+    groups_changed: bool,
+}
+
+impl VkSyncInvalidations {
+    fn is_empty(&self) -> bool {
+        !self.flush_all
+            && self.usernames.is_empty()
+            && self.user_dns.is_empty()
+            && !self.all_credentials
+            && !self.all_group_rules
+            && !self.groups_changed
+    }
+
+    fn apply(self) {
+        if self.flush_all {
+            debug!("flushing the caches after a full directory synchronization");
+            super::flush_caches();
+            return ();
+        }
+
+        for username in self.usernames.iter() {
+            credentials::invalidate(username);
+            negative_cache::invalidate(username);
+            dn_cache::invalidate(username);
+        }
+        for user_dn in self.user_dns.iter() {
+            group_rules::invalidate(user_dn);
+        }
+        if self.all_credentials {
+            credentials::clear();
+        }
+        if self.all_group_rules {
+            group_rules::clear();
+        }
+        if self.groups_changed {
+            group_graph::clear();
+            group_index::clear();
+        }
+    }
+}
+
+/// A copy of the entries of the directory, kept up to date by the content
+/// synchronization, to find the users affected by each change.
+struct VkSyncState {
+    cookie: Option<Vec<u8>>,
+    entries: HashMap<Vec<u8>, VkSyncedEntry>,
+    // The UUIDs of the entries by normalized DN
+    uuids: HashMap<String, Vec<u8>>,
+    // The entries reported by the server during the present phase
+    present: HashSet<Vec<u8>>,
+    // The synchronization started without a cookie, and all the entries are
+    // sent by the server
+    full_refresh: bool,
+    // The server does not support the content synchronization, and the
+    // changes are received through a persistent search
+    persistent_search: bool,
+    generation: u64,
+}
+
+impl VkSyncState {
+    fn new(generation: u64) -> VkSyncState {
+        VkSyncState {
+            cookie: None,
+            entries: HashMap::new(),
+            uuids: HashMap::new(),
+            present: HashSet::new(),
+            full_refresh: false,
+            persistent_search: false,
+            generation,
+        }
+    }
+
+    fn begin_refresh(&mut self) {
+        self.present.clear();
+        self.full_refresh = self.cookie.is_none();
+        if self.full_refresh {
+            self.entries.clear();
+            self.uuids.clear();
+        }
+    }
+
+    fn set_cookie(&mut self, cookie: Option<Vec<u8>>) {
+        if cookie.is_some() {
+            self.cookie = cookie;
+        }
+    }
+
+    /// Adds the users affected by a change of `entry` to `inv`.
+    fn invalidate_entry(&self, entry: &VkSyncedEntry, inv: &mut VkSyncInvalidations) {
+        // During a full refresh, all the caches are flushed at the end
+        if self.full_refresh {
+            return ();
+        }
+
+        let Some(members) = &entry.members else {
+            inv.usernames.extend(entry.usernames.iter().cloned());
+            inv.user_dns.insert(entry.dn.clone());
+            return ();
+        };
+
+        inv.groups_changed = true;
+        for member in members {
+            inv.user_dns.insert(member.clone());
+            let member_entry = self
+                .uuids
+                .get(&normalize_dn(member))
+                .and_then(|uuid| self.entries.get(uuid));
+            match member_entry {
+                Some(member_entry) if member_entry.members.is_some() => {
+                    inv.all_credentials = true;
+                    inv.all_group_rules = true;
+                }
+                Some(member_entry) => inv.usernames.extend(member_entry.usernames.iter().cloned()),
+                // The cached credentials of the member cannot be found
+                None => inv.all_credentials = true,
+            }
+        }
+    }
+
+    fn insert(&mut self, uuid: Vec<u8>, entry: VkSyncedEntry) {
+        let dn = normalize_dn(&entry.dn);
+        if let Some(previous) = self.entries.insert(uuid.clone(), entry) {
+            // The entry was renamed
+            self.forget_dn(&previous.dn, &uuid);
+        }
+        self.uuids.insert(dn, uuid);
+    }
+
+    fn forget_dn(&mut self, dn: &str, uuid: &[u8]) {
+        let dn = normalize_dn(dn);
+        if self.uuids.get(&dn).is_some_and(|id| id == uuid) {
+            self.uuids.remove(&dn);
+        }
+    }
+
+    /// An entry that did not change since the cookie.
+    fn entry_present(&mut self, uuid: Vec<u8>, entry: Option<VkSyncedEntry>) {
+        if let Some(entry) = entry {
+            if !self.entries.contains_key(&uuid) {
+                self.insert(uuid.clone(), entry);
+            }
+        }
+        self.present.insert(uuid);
+    }
+
+    fn entry_changed(
+        &mut self,
+        uuid: Vec<u8>,
+        entry: VkSyncedEntry,
+        inv: &mut VkSyncInvalidations,
+    ) {
+        // The members removed from a group are affected as well
+        match self.entries.get(&uuid) {
+            Some(previous) => {
+                self.invalidate_entry(previous, inv);
+                self.invalidate_entry(&entry, inv);
+            }
+            None => self.invalidate_entry(&entry, inv),
+        }
+        self.present.insert(uuid.clone());
+        self.insert(uuid, entry);
+    }
+
+    fn entry_deleted(&mut self, uuid: &[u8], inv: &mut VkSyncInvalidations) {
+        if let Some(entry) = self.entries.remove(uuid) {
+            self.invalidate_entry(&entry, inv);
+            self.forget_dn(&entry.dn, uuid);
+        }
+    }
+
+    /// Ends the present phase: the entries that were not reported as
+    /// present were deleted.
+    fn end_present_phase(&mut self, inv: &mut VkSyncInvalidations) {
+        let deleted: Vec<Vec<u8>> = self
+            .entries
+            .keys()
+            .filter(|uuid| !self.present.contains(*uuid))
+            .cloned()
+            .collect();
+        for uuid in deleted {
+            self.entry_deleted(&uuid, inv);
+        }
+        self.present.clear();
+    }
+
+    fn end_refresh(&mut self, inv: &mut VkSyncInvalidations) {
+        if self.full_refresh {
+            info!(
+                "directory synchronization completed with {} entries",
+                self.entries.len()
+            );
+            self.full_refresh = false;
+            inv.flush_all = true;
+        }
+    }
+
+    /// Handles a message of the synchronization search.
+    fn process(
+        &mut self,
+        entry: ResultEntry,
+        settings: &VkLdapSettings,
+        inv: &mut VkSyncInvalidations,
+    ) {
+        if entry.is_intermediate() {
+            match parse_syncinfo(entry) {
+                SyncInfo::NewCookie(cookie) => self.set_cookie(Some(cookie)),
+                SyncInfo::RefreshDelete {
+                    cookie,
+                    refresh_done,
+                } => {
+                    self.set_cookie(cookie);
+                    if refresh_done {
+                        self.end_refresh(inv);
+                    }
+                }
+                SyncInfo::RefreshPresent {
+                    cookie,
+                    refresh_done,
+                } => {
+                    self.set_cookie(cookie);
+                    self.end_present_phase(inv);
+                    if refresh_done {
+                        self.end_refresh(inv);
+                    }
+                }
+                SyncInfo::SyncIdSet {
+                    cookie,
+                    refresh_deletes,
+                    sync_uuids,
+                } => {
+                    self.set_cookie(cookie);
+                    for uuid in sync_uuids {
+                        if refresh_deletes {
+                            self.entry_deleted(&uuid, inv);
+                        } else {
+                            self.entry_present(uuid, None);
+                        }
+                    }
+                }
+            }
+            return ();
+        }
+
+        let sync_state = entry
+            .1
+            .iter()
+            .find(|ctrl| matches!(ctrl.0, Some(ControlType::SyncState)))
+            .map(|ctrl| ctrl.1.parse::<SyncState>());
+        let Some(sync_state) = sync_state else {
+            // Referrals, and entries without a state, carry no change
+            return ();
+        };
+
+        self.set_cookie(sync_state.cookie);
+        let uuid = sync_state.entry_uuid;
+        let sentry = SearchEntry::construct(entry);
+
+        match sync_state.state {
+            EntryState::Present if sentry.attrs.is_empty() => self.entry_present(uuid, None),
+            EntryState::Present => {
+                let entry = VkSyncedEntry::new(sentry, settings);
+                self.entry_present(uuid, Some(entry));
+            }
+            EntryState::Add | EntryState::Modify => {
+                debug!("directory entry '{}' changed", sentry.dn);
+                let entry = VkSyncedEntry::new(sentry, settings);
+                self.entry_changed(uuid, entry, inv);
+            }
+            EntryState::Delete => {
+                debug!("directory entry '{}' deleted", sentry.dn);
+                self.entry_deleted(&uuid, inv);
+            }
+        }
+    }
+
+    /// Handles an entry of the persistent search. The entries are identified
+    /// by their `entryUUID`, or by their DN if the server does not have it.
+    fn process_persistent(
+        &mut self,
+        entry: ResultEntry,
+        settings: &VkLdapSettings,
+        inv: &mut VkSyncInvalidations,
+    ) {
+        if entry.is_intermediate() || entry.is_ref() {
+            return ();
+        }
+
+        let change = entry_change(&entry.1);
+        let mut sentry = SearchEntry::construct(entry);
+        let uuid = match sentry.attrs.remove(ENTRY_UUID_ATTRIBUTE) {
+            Some(mut uuids) if !uuids.is_empty() => uuids.swap_remove(0).into_bytes(),
+            _ => normalize_dn(&sentry.dn).into_bytes(),
+        };
+
+        let entry = VkSyncedEntry::new(sentry, settings);
+        self.entry_notified(uuid, entry, change, inv);
+    }
+
+    /// An entry of the persistent search, with the change that the server
+    /// notified, if any.
+    fn entry_notified(
+        &mut self,
+        uuid: Vec<u8>,
+        entry: VkSyncedEntry,
+        change: Option<VkEntryChange>,
+        inv: &mut VkSyncInvalidations,
+    ) {
+        let Some(change) = change else {
+            // An entry sent when the search started
+            self.insert(uuid, entry);
+            return ();
+        };
+
+        if change.change_type == VkEntryChangeType::Delete {
+            debug!("directory entry '{}' deleted", entry.dn);
+            self.entry_deleted(&uuid, inv);
+            return ();
+        }
+
+        // An entry identified by its DN gets a new identity when renamed
+        let previous_uuid = change
+            .previous_dn
+            .and_then(|dn| self.uuids.get(&normalize_dn(&dn)).cloned());
+        if let Some(previous_uuid) = previous_uuid.filter(|previous| *previous != uuid) {
+            self.entry_deleted(&previous_uuid, inv);
+        }
+
+        debug!("directory entry '{}' changed", entry.dn);
+        self.entry_changed(uuid, entry, inv);
+    }
+
+    /// Handles the result of the synchronization search, when the server
+    /// ends it.
+    fn finish(&mut self, res: ldap3::LdapResult, inv: &mut VkSyncInvalidations) -> Result<()> {
+        if res.rc == SYNC_REFRESH_REQUIRED {
+            info!("the LDAP server requires a full directory synchronization");
+            self.cookie = None;
+            return Ok(());
+        }
+
+        let sync_done = res
+            .ctrls
+            .iter()
+            .find(|ctrl| matches!(ctrl.0, Some(ControlType::SyncDone)))
+            .map(|ctrl| ctrl.1.parse::<SyncDone>());
+
+        if let Err(err) = res.success() {
+            return Err(VkLdapError::LdapSearchError(err));
+        }
+
+        if let Some(sync_done) = sync_done {
+            self.set_cookie(sync_done.cookie);
+            if !sync_done.refresh_deletes {
+                self.end_present_phase(inv);
+            }
+            self.end_refresh(inv);
+        }
+
+        Ok(())
+    }
+}
+
+#[derive(Clone, Copy, Default)]
+pub struct VkSyncListenerStats {
+    pub enabled: bool,
+    pub connected: bool,
+    pub entries: usize,
+    pub changes: u64,
+    pub full_syncs: u64,
+    pub reconnects: u64,
+    pub persistent_search: bool,
+}
+
+struct SyncListener {
+    task: Mutex<Option<JoinHandle<()>>>,
+    stop: AtomicBool,
+    wakeup: Notify,
+    enabled: AtomicBool,
+    // Incremented when the LDAP settings change, to synchronize again from
+    // scratch
+    generation: AtomicU64,
+    connected: AtomicBool,
+    entries: AtomicU64,
+    changes: AtomicU64,
+    full_syncs: AtomicU64,
+    reconnects: AtomicU64,
+    persistent_search: AtomicBool,
+}
+
+impl SyncListener {
+    fn new() -> SyncListener {
+        SyncListener {
+            task: Mutex::new(None),
+            stop: AtomicBool::new(false),
+            wakeup: Notify::new(),
+            enabled: AtomicBool::new(false),
+            generation: AtomicU64::new(0),
+            connected: AtomicBool::new(false),
+            entries: AtomicU64::new(0),
+            changes: AtomicU64::new(0),
+            full_syncs: AtomicU64::new(0),
+            reconnects: AtomicU64::new(0),
+            persistent_search: AtomicBool::new(false),
+        }
+    }
+
+    fn start(&self) {
+        self.stop.store(false, Ordering::Release);
+
+        match scheduler::spawn_task(sync_listener_loop()) {
+            Ok(handle) => *self.task.lock().unwrap() = Some(handle),
+            Err(err) => error!("failed to start the sync listener: {err}"),
+        }
+    }
+
+    fn shutdown(&self) {
+        self.stop.store(true, Ordering::Release);
+
+        // The synchronization search never completes by itself
+        if let Some(handle) = self.task.lock().unwrap().take() {
+            handle.abort();
+        }
+        self.connected.store(false, Ordering::Relaxed);
+    }
+
+    fn is_enabled(&self) -> bool {
+        self.enabled.load(Ordering::Relaxed)
+    }
+
+    fn should_stop(&self) -> bool {
+        self.stop.load(Ordering::Acquire)
+    }
+
+    /// Returns true if the synchronization with `server` must end.
+    fn should_end_sync(&self, server: &VkLdapServer, generation: u64) -> bool {
+        self.should_stop()
+            || !self.is_enabled()
+            || self.generation.load(Ordering::Relaxed) != generation
+            || !context::get_available_servers()
+                .iter()
+                .any(|s| s.get_id() == server.get_id() && s.get_url_ref() == server.get_url_ref())
+    }
+}
+
+lazy_static! {
+    static ref SYNC_LISTENER: SyncListener = SyncListener::new();
+}
+
+/// Returns the base of the synchronized entries: the closest common ancestor
+/// of the bases of the users and of the groups. Returns `None` if no base is
+/// configured, or if the bases have no common ancestor.
+fn sync_base(settings: &VkLdapSettings) -> Option<String> {
+    // In bind mode, the users are found under the bind DN suffix
+    let bind_suffix = settings
+        .bind_db_suffix
+        .trim_start_matches(|c: char| c == ',' || c.is_whitespace());
+    let bases: Vec<&str> = [
+        settings.search_base.as_deref(),
+        settings.groups_search_base.as_deref(),
+        Some(bind_suffix).filter(|suffix| suffix.contains('=')),
+    ]
+    .into_iter()
+    .flatten()
+    .filter(|base| !base.trim().is_empty())
+    .collect();
+
+    let (first, others) = bases.split_first()?;
+    let mut rdns: Vec<&str> = first.split(',').map(str::trim).collect();
+    for base in others {
+        let common = rdns
+            .iter()
+            .rev()
+            .zip(base.split(',').rev())
+            .take_while(|(rdn, other)| normalize_dn(rdn) == normalize_dn(other))
+            .count();
+        rdns.drain(..rdns.len() - common);
+    }
+
+    match rdns.is_empty() {
+        true => None,
+        false => Some(rdns.join(",")),
+    }
+}
+
+/// Synchronizes with `server` until the server ends the synchronization, or
+/// it must end.
+async fn sync_with_server(
+    state: &mut VkSyncState,
+    server: &VkLdapServer,
+    conn: &mut VkLdapConnection,
+    settings: &VkLdapSettings,
+    base: &str,
+) -> Result<()> {
+    let mut attrs = vec![
+        settings
+            .search_attribute
+            .clone()
+            .unwrap_or_else(|| "uid".to_string()),
+        settings.groups_member_attribute.clone(),
+    ];
+
+    state.begin_refresh();
+    if state.full_refresh {
+        SYNC_LISTENER.full_syncs.fetch_add(1, Ordering::Relaxed);
+    }
+
+    let mut stream: SearchStream<'static, String, Vec<String>> = match state.persistent_search {
+        false => {
+            conn.content_sync(settings, base, attrs, state.cookie.clone())
+                .await?
+        }
+        true => {
+            attrs.push(ENTRY_UUID_ATTRIBUTE.to_string());
+            let stream = conn.persistent_search(settings, base, attrs).await?;
+            // A persistent search cannot be resumed, and does not tell when
+            // all the entries were sent. The changes made while it was not
+            // running are unknown, so the caches are flushed as it starts.
+            state.full_refresh = false;
+            VkSyncInvalidations {
+                flush_all: true,
+                ..Default::default()
+            }
+            .apply();
+            stream
+        }
+    };
+
+    let url = server.get_url_ref();
+    info!("listening to the directory changes on {url}");
+    SYNC_LISTENER.connected.store(true, Ordering::Relaxed);
+
+    let res = loop {
+        tokio::select! {
+            res = stream.next() => match res {
+                Ok(Some(entry)) => {
+                    let mut inv = VkSyncInvalidations::default();
+                    match state.persistent_search {
+                        false => state.process(entry, settings, &mut inv),
+                        true => state.process_persistent(entry, settings, &mut inv),
+                    }
+                    SYNC_LISTENER.entries.store(state.entries.len() as u64, Ordering::Relaxed);
+                    if !inv.is_empty() {
+                        SYNC_LISTENER.changes.fetch_add(1, Ordering::Relaxed);
+                        inv.apply();
+                    }
+                }
+                Ok(None) => {
+                    let mut inv = VkSyncInvalidations::default();
+                    let res = state.finish(stream.finish().await, &mut inv);
+                    inv.apply();
+                    break res;
+                }
+                Err(err) => break Err(streaming_search_error(err)),
+            },
+            _ = SYNC_LISTENER.wakeup.notified() => (),
+            _ = tokio::time::sleep(CHECK_INTERVAL) => (),
+        }
+
+        if SYNC_LISTENER.should_end_sync(server, state.generation) {
+            debug!("ending the directory synchronization with {url}");
+            break Ok(());
+        }
+    };
+
+    SYNC_LISTENER.connected.store(false, Ordering::Relaxed);
+    match res {
+        Err(err)
+            if !state.persistent_search
+                && err.result_code() == Some(UNAVAILABLE_CRITICAL_EXTENSION) =>
+        {
+            info!(
+                "{url} does not support the content synchronization, falling back to a persistent search"
+            );
+            state.persistent_search = true;
+            SYNC_LISTENER
+                .persistent_search
+                .store(true, Ordering::Relaxed);
+            Ok(())
+        }
+        res => res,
+    }
+}
+
+/// Synchronizes with the first available server that accepts a connection.
+async fn run_sync(state: &mut VkSyncState, base: &str) -> Result<()> {
+    let settings = context::get_ldap_settings();
+
+    let mut res = Err(VkLdapError::NoHealthyServerAvailable);
+    for server in context::get_available_servers() {
+        let mut conn = match context::get_connection(&server).await {
+            Ok(conn) => conn,
+            Err(err) => {
+                res = Err(err);
+                continue;
+            }
+        };
+
+        // The search ends with the connection
+        res = sync_with_server(state, &server, &mut conn, &settings, base).await;
+        conn.close().await;
+        break;
+    }
+
+    res
+}
+
+async fn sync_listener_loop() {
+    debug!("initiating sync listener");
+
+    let mut state = VkSyncState::new(SYNC_LISTENER.generation.load(Ordering::Relaxed));
+    let mut backoff = Duration::ZERO;
+
+    loop {
+        if SYNC_LISTENER.should_stop() {
+            debug!("exiting sync listener loop");
+            return ();
+        }
+
+        let generation = SYNC_LISTENER.generation.load(Ordering::Relaxed);
+        if !SYNC_LISTENER.is_enabled() || state.generation != generation {
+            // Changes are not received from now on, the copy of the
+            // directory can no longer be resumed
+            state = VkSyncState::new(generation);
+            SYNC_LISTENER.entries.store(0, Ordering::Relaxed);
+            SYNC_LISTENER
+                .persistent_search
+                .store(false, Ordering::Relaxed);
+        }
+
+        if !SYNC_LISTENER.is_enabled() {
+            SYNC_LISTENER.wakeup.notified().await;
+            continue;
+        }
+
+        let Some(base) = sync_base(&context::get_ldap_settings()) else {
+            error!(
+                "the sync listener is enabled, but the ldap.search_base and ldap.groups_search_base configs have no common base to synchronize"
+            );
+            // Waits for the LDAP settings to change
+            SYNC_LISTENER.wakeup.notified().await;
+            continue;
+        };
+
+        SYNC_LISTENER.reconnects.fetch_add(1, Ordering::Relaxed);
+        match run_sync(&mut state, &base).await {
+            Ok(_) => backoff = Duration::ZERO,
+            Err(err) => {
+                error!("directory synchronization failed: {err}");
+                backoff = (backoff * 2).clamp(MIN_RECONNECT_BACKOFF, MAX_RECONNECT_BACKOFF);
+                let delay = backoff.mul_f64(rand::random_range(0.5..=1.0));
+                let _ = tokio::time::timeout(delay, SYNC_LISTENER.wakeup.notified()).await;
+            }
+        }
+    }
+}
+
+pub fn start_sync_listener() {
+    SYNC_LISTENER.start();
+}
+
+pub fn shutdown_sync_listener() {
+    SYNC_LISTENER.shutdown();
+}
+
+pub fn refresh_sync_listener_settings(enabled: bool) {
+    if SYNC_LISTENER.enabled.swap(enabled, Ordering::Relaxed) != enabled {
+        SYNC_LISTENER.wakeup.notify_one();
+    }
+}
+
+/// Synchronizes the directory again from scratch, when the LDAP settings
+/// changed.
+pub(super) fn restart() {
+    SYNC_LISTENER.generation.fetch_add(1, Ordering::Relaxed);
+    SYNC_LISTENER.wakeup.notify_one();
+}
+
+pub(super) fn stats() -> VkSyncListenerStats {
+    let listener = &*SYNC_LISTENER;
+    VkSyncListenerStats {
+        enabled: listener.is_enabled(),
+        connected: listener.connected.load(Ordering::Relaxed),
+        entries: listener.entries.load(Ordering::Relaxed) as usize,
+        changes: listener.changes.load(Ordering::Relaxed),
+        full_syncs: listener.full_syncs.load(Ordering::Relaxed),
+        reconnects: listener.reconnects.load(Ordering::Relaxed),
+        persistent_search: listener.persistent_search.load(Ordering::Relaxed),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn user(dn: &str) -> VkSyncedEntry {
+        VkSyncedEntry {
+            dn: dn.to_string(),
+            usernames: vec![dn[3..dn.find(',').unwrap()].to_string()],
+            members: None,
+        }
+    }
+
+    fn group(dn: &str, members: &[&str]) -> VkSyncedEntry {
+        VkSyncedEntry {
+            dn: dn.to_string(),
+            usernames: Vec::new(),
+            members: Some(members.iter().map(|m| m.to_string()).collect()),
+        }
+    }
+
+    #[test]
+    fn test_sync_base_is_common_ancestor() {
+        let mut settings = VkLdapSettings::default();
+        assert_eq!(sync_base(&settings), None);
+
+        settings.search_base = Some("ou=users,dc=valkey,dc=io".to_string());
+        assert_eq!(
+            sync_base(&settings).as_deref(),
+            Some("ou=users,dc=valkey,dc=io")
+        );
+
+        settings.groups_search_base = Some("OU=groups, DC=valkey, DC=io".to_string());
+        assert_eq!(sync_base(&settings).as_deref(), Some("dc=valkey,dc=io"));
+
+        settings.search_base = None;
+        settings.bind_db_suffix = ",ou=devops,dc=valkey,dc=io".to_string();
+        assert_eq!(sync_base(&settings).as_deref(), Some("DC=valkey,DC=io"));
+
+        settings.groups_search_base = Some("dc=example,dc=com".to_string());
+        assert_eq!(sync_base(&settings), None);
+    }
+
+    #[test]
+    fn test_persistent_search_changes() {
+        let user1 = "cn=user1,ou=devops,dc=valkey,dc=io";
+        let group_dn = "cn=devops,dc=valkey,dc=io";
+        let change = |change_type, previous_dn: Option<&str>| {
+            Some(VkEntryChange {
+                change_type,
+                previous_dn: previous_dn.map(str::to_string),
+            })
+        };
+        let by_dn = |dn: &str| normalize_dn(dn).into_bytes();
+
+        // The entries sent when the search starts are not changes
+        let mut state = VkSyncState::new(0);
+        state.persistent_search = true;
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_notified(by_dn(user1), user(user1), None, &mut inv);
+        state.entry_notified(b"g1".to_vec(), group(group_dn, &[user1]), None, &mut inv);
+        assert!(inv.is_empty());
+        assert_eq!(state.entries.len(), 2);
+
+        // A user identified by its DN is renamed
+        let renamed = "cn=user2,ou=devops,dc=valkey,dc=io";
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_notified(
+            by_dn(renamed),
+            user(renamed),
+            change(VkEntryChangeType::ModDn, Some(user1)),
+            &mut inv,
+        );
+        assert_eq!(
+            inv.usernames,
+            HashSet::from(["user1".to_string(), "user2".to_string()])
+        );
+        assert!(!state.entries.contains_key(&by_dn(user1)));
+
+        // The members of a deleted group are affected
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_notified(
+            b"g1".to_vec(),
+            group(group_dn, &[user1]),
+            change(VkEntryChangeType::Delete, None),
+            &mut inv,
+        );
+        assert!(inv.groups_changed);
+        assert!(inv.user_dns.contains(user1));
+        assert_eq!(state.entries.len(), 1);
+    }
+
+    #[test]
+    fn test_sync_state_invalidations() {
+        let user1 = "cn=user1,ou=devops,dc=valkey,dc=io";
+        let user2 = "cn=user2,ou=devops,dc=valkey,dc=io";
+
+        let mut state = VkSyncState::new(0);
+        state.begin_refresh();
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_changed(b"u1".to_vec(), user(user1), &mut inv);
+        state.entry_changed(b"u2".to_vec(), user(user2), &mut inv);
+        state.entry_changed(
+            b"g1".to_vec(),
+            group("cn=devops,dc=valkey,dc=io", &[user1]),
+            &mut inv,
+        );
+        state.set_cookie(Some(b"cookie".to_vec()));
+        state.end_refresh(&mut inv);
+        // The initial refresh replaces all the cached entries
+        assert!(inv.flush_all);
+        assert!(inv.usernames.is_empty());
+
+        // Both the removed and the added members of a group are affected
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_changed(
+            b"g1".to_vec(),
+            group("cn=devops,dc=valkey,dc=io", &[user2]),
+            &mut inv,
+        );
+        assert!(!inv.flush_all);
+        assert!(inv.groups_changed);
+        assert!(!inv.all_credentials);
+        assert_eq!(
+            inv.usernames,
+            HashSet::from(["user1".to_string(), "user2".to_string()])
+        );
+        assert!(inv.user_dns.contains(user1) && inv.user_dns.contains(user2));
+
+        // A resumed refresh only drops the entries that are no longer present
+        state.begin_refresh();
+        assert!(!state.full_refresh);
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_present(b"u2".to_vec(), None);
+        state.entry_present(b"g1".to_vec(), None);
+        state.end_present_phase(&mut inv);
+        state.end_refresh(&mut inv);
+        assert!(!inv.flush_all);
+        assert_eq!(inv.usernames, HashSet::from(["user1".to_string()]));
+        assert!(!state.entries.contains_key(b"u1".as_slice()));
+        assert!(!state.uuids.contains_key(&normalize_dn(user1)));
+
+        // The cached entries of new users are dropped, such as the negative
+        // cache entry that tells that the user does not exist
+        let mut inv = VkSyncInvalidations::default();
+        state.entry_changed(b"u3".to_vec(), user("cn=user3,dc=valkey,dc=io"), &mut inv);
+        assert_eq!(inv.usernames, HashSet::from(["user3".to_string()]));
+    }
+}
@@ -0,0 +1,199 @@
+use std::fs;
+use std::io::{self, BufReader};
+use std::sync::{Arc, Mutex};
+use std::time::SystemTime;
+
+use lazy_static::lazy_static;
+use log::{debug, error, warn};
+use rustls::{Certificate, ClientConfig, PrivateKey, RootCertStore};
+
+use crate::{handle_io_error, handle_tls_error};
+
+use super::Result;
+use super::errors::VkLdapError;
+use super::settings::VkConnectionSettings;
+
+/// Identifies the contents of a TLS file without reading it.
+#[derive(PartialEq)]
+struct TlsFileStamp {
+    path: String,
+    modified: Option<SystemTime>,
+    len: u64,
+}
+
+impl TlsFileStamp {
+    fn new(path: &str) -> std::io::Result<TlsFileStamp> {
+        let metadata = fs::metadata(path)?;
+        Ok(TlsFileStamp {
+            path: path.to_string(),
+            modified: metadata.modified().ok(),
+            len: metadata.len(),
+        })
+    }
+}
+
+#[derive(PartialEq)]
+struct TlsMaterialKey {
+    ca_cert: Option<TlsFileStamp>,
+    client_identity: Option<(TlsFileStamp, TlsFileStamp)>,
+}
+
+impl TlsMaterialKey {
+    fn new(settings: &VkConnectionSettings) -> Result<TlsMaterialKey> {
+        let ca_cert = match &settings.ca_cert_path {
+            Some(path) => Some(handle_io_error!(
+                TlsFileStamp::new(path),
+                "failed to read CA cert file".to_string()
+            )),
+            None => None,
+        };
+
+        let client_identity = match &settings.client_cert_path {
+            Some(cert_path) => match &settings.client_key_path {
+                None => return Err(VkLdapError::NoTLSKeyPathSet),
+                Some(key_path) => Some((
+                    handle_io_error!(
+                        TlsFileStamp::new(cert_path),
+                        "failed to read client certificate file".to_string()
+                    ),
+                    handle_io_error!(
+                        TlsFileStamp::new(key_path),
+                        "failed to read client key file".to_string()
+                    ),
+                )),
+            },
+            None => None,
+        };
+
+        Ok(TlsMaterialKey {
+            ca_cert,
+            client_identity,
+        })
+    }
+}
+
+lazy_static! {
+    static ref TLS_CONFIG: Mutex<Option<(TlsMaterialKey, Arc<ClientConfig>)>> = Mutex::new(None);
+}
+
+/// Returns the DER encoded certificates of the PEM file `path`.
+fn read_pem_certs(path: &str, errmsg: &str) -> Result<Vec<Certificate>> {
+    let pem = handle_io_error!(fs::read(path), format!("failed to read {errmsg} file"));
+    let certs = handle_io_error!(
+        rustls_pemfile::certs(&mut BufReader::new(pem.as_slice())),
+        format!("failed to parse {errmsg} file")
+    );
+    Ok(certs.into_iter().map(Certificate).collect())
+}
+
+/// Returns the PKCS#8 private key of the PEM file `path`.
+fn read_pem_key(path: &str) -> Result<PrivateKey> {
+    let pem = handle_io_error!(fs::read(path), "failed to read client key file".to_string());
+    let keys = handle_io_error!(
+        rustls_pemfile::pkcs8_private_keys(&mut BufReader::new(pem.as_slice())),
+        "failed to parse client key file".to_string()
+    );
+    match keys.into_iter().next() {
+        Some(key) => Ok(PrivateKey(key)),
+        None => Err(VkLdapError::IOError(
+            "failed to parse client key file".to_string(),
+            io::Error::new(io::ErrorKind::InvalidData, "no PKCS#8 private key found"),
+        )),
+    }
+}
+
+fn build_tls_config(key: &TlsMaterialKey) -> Result<Arc<ClientConfig>> {
+    let mut roots = RootCertStore::empty();
+
+    match &key.ca_cert {
+        Some(ca_cert) => {
+            for cert in read_pem_certs(&ca_cert.path, "CA cert")? {
+                handle_tls_error!(
+                    roots.add(&cert),
+                    "failed to load CA certificate".to_string()
+                );
+            }
+        }
+        None => {
+            let certs = handle_io_error!(
+                rustls_native_certs::load_native_certs(),
+                "failed to load the system CA certificates".to_string()
+            );
+            let certs: Vec<Vec<u8>> = certs.into_iter().map(|cert| cert.0).collect();
+            let (_, invalid) = roots.add_parsable_certificates(&certs);
+            if invalid > 0 {
+                warn!("ignored {invalid} invalid system CA certificates");
+            }
+        }
+    }
+
+    let builder = ClientConfig::builder()
+        .with_safe_defaults()
+        .with_root_certificates(roots);
+
+    let config = match &key.client_identity {
+        Some((cert, key)) => handle_tls_error!(
+            builder.with_client_auth_cert(
+                read_pem_certs(&cert.path, "client certificate")?,
+                read_pem_key(&key.path)?,
+            ),
+            "failed to load client certificate".to_string()
+        ),
+        None => builder.with_no_client_auth(),
+    };
+
+    // The default resumption settings of the config keep the TLS sessions of
+    // the last 256 servers in memory, so that the connections made with the
+    // same config resume them with an abbreviated handshake.
+    Ok(Arc::new(config))
+}
+
+/// Returns the TLS config for the TLS files of `settings`.
+///
+/// The config is built once and shared by all connections, so that they
+/// share its TLS session cache, and resume the sessions of the servers
+/// instead of running a full handshake. It is only rebuilt when the file
+/// paths change, or when the files are modified.
+pub(super) fn get_tls_config(settings: &VkConnectionSettings) -> Result<Arc<ClientConfig>> {
+    let key = TlsMaterialKey::new(settings)?;
+
+    let mut cached = match TLS_CONFIG.lock() {
+        Ok(guard) => guard,
+        Err(poisoned) => {
+            error!("TLS config mutex is poisoned, recovering");
+            poisoned.into_inner()
+        }
+    };
+
+    if let Some((cached_key, config)) = &*cached {
+        if *cached_key == key {
+            return Ok(Arc::clone(config));
+        }
+    }
+
+    debug!("loading TLS certificates");
+    let config = build_tls_config(&key)?;
+    *cached = Some((key, Arc::clone(&config)));
+    Ok(config)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_file_stamp_changes_with_file() {
+        let path = std::env::temp_dir().join(format!("vkldap-tls-{}", std::process::id()));
+        let path = path.to_str().unwrap();
+
+        fs::write(path, "first").unwrap();
+        let first = TlsFileStamp::new(path).unwrap();
+        assert!(first == TlsFileStamp::new(path).unwrap());
+
+        fs::write(path, "second file").unwrap();
+        assert!(first != TlsFileStamp::new(path).unwrap());
+
+        fs::remove_file(path).unwrap();
+        assert!(TlsFileStamp::new(path).is_err());
+    }
+}
@@ -0,0 +1,195 @@
+import time
+
+import valkey
+from valkey.exceptions import AuthenticationError, ResponseError
+
+from util import LdapTestCase, parse_valkey_info_section
+
+
+def get_cache_stats(vk, cache_name):
+    result = vk.execute_command("INFO", "LDAP")
+    info = parse_valkey_info_section(result.decode("utf-8"))
+    return {key: int(value) for key, value in info[cache_name].items()}
+
+
+class CacheTestCase(LdapTestCase):
+    """Authenticates in bind mode with the settings of `CONFIG`, and restores
+    the settings of `RESET_CONFIG` after each test."""
+
+    CONFIG = {}
+    RESET_CONFIG = {}
+
+    def setUp(self):
+        super(CacheTestCase, self).setUp()
+
+        self.vk.execute_command("CONFIG", "SET", "ldap.auth_mode", "bind")
+        self.vk.execute_command("CONFIG", "SET", "ldap.bind_dn_prefix", "cn=")
+        self.vk.execute_command(
+            "CONFIG", "SET", "ldap.bind_dn_suffix", ",OU=devops,DC=valkey,DC=io"
+        )
+        for name, value in self.CONFIG.items():
+            self.vk.execute_command("CONFIG", "SET", name, value)
+        self.vk.execute_command("LDAP.FLUSHCACHE")
+
+    def tearDown(self):
+        for name, value in self.RESET_CONFIG.items():
+            self.vk.execute_command("CONFIG", "SET", name, value)
+        super(CacheTestCase, self).tearDown()
+
+    def _auth(self, username="user1", password="user1@123"):
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", username, password)
+            resp = client.execute_command("ACL", "WHOAMI")
+            self.assertEqual(resp.decode(), username)
+        finally:
+            client.close()
+
+
+class CredentialCacheTest(CacheTestCase):
+    CONFIG = {"ldap.credential_cache_ttl": "60"}
+    RESET_CONFIG = {"ldap.credential_cache_ttl": "0"}
+
+    def test_cache_disabled_with_zero_ttl(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.credential_cache_ttl", "0")
+        self._auth()
+        self.assertEqual(get_cache_stats(self.vk, "credential_cache")["entries"], 0)
+
+    def test_repeated_auth_hits_cache(self):
+        self._auth()
+        before = get_cache_stats(self.vk, "credential_cache")
+        self.assertEqual(before["entries"], 1)
+
+        self._auth()
+        after = get_cache_stats(self.vk, "credential_cache")
+        self.assertEqual(after["hits"], before["hits"] + 1)
+
+    def test_wrong_password_not_served_from_cache(self):
+        self._auth()
+
+        with self.assertRaises((AuthenticationError, ResponseError)):
+            self._auth("user1", "wrongpass")
+
+        self.assertEqual(get_cache_stats(self.vk, "credential_cache")["entries"], 0)
+
+    def test_flush_single_user(self):
+        self._auth()
+
+        self.assertEqual(self.vk.execute_command("LDAP.FLUSHCACHE", "user1"), 1)
+        self.assertEqual(self.vk.execute_command("LDAP.FLUSHCACHE", "user1"), 0)
+        self.assertEqual(get_cache_stats(self.vk, "credential_cache")["entries"], 0)
+
+
+class NegativeCacheTest(CacheTestCase):
+    CONFIG = {"ldap.negative_cache_ttl": "60"}
+    RESET_CONFIG = {"ldap.negative_cache_ttl": "0"}
+
+    def test_repeated_wrong_password_hits_cache(self):
+        with self.assertRaises((AuthenticationError, ResponseError)):
+            self._auth("user1", "wrongpass")
+        before = get_cache_stats(self.vk, "negative_cache")
+        self.assertEqual(before["entries"], 1)
+
+        with self.assertRaises((AuthenticationError, ResponseError)):
+            self._auth("user1", "wrongpass")
+        after = get_cache_stats(self.vk, "negative_cache")
+        self.assertEqual(after["hits"], before["hits"] + 1)
+
+    def test_correct_password_not_rejected_from_cache(self):
+        with self.assertRaises((AuthenticationError, ResponseError)):
+            self._auth("user1", "wrongpass")
+
+        self._auth("user1", "user1@123")
+        self.assertEqual(get_cache_stats(self.vk, "negative_cache")["entries"], 0)
+
+
+class GroupRulesCacheTest(CacheTestCase):
+    USER1_DN = "cn=user1,OU=devops,DC=valkey,DC=io"
+
+    CONFIG = {"ldap.group_rules_cache_ttl": "60"}
+    RESET_CONFIG = {"ldap.group_rules_cache_ttl": "0"}
+
+    def test_repeated_auth_hits_cache(self):
+        self._auth()
+        before = get_cache_stats(self.vk, "group_rules_cache")
+        self.assertEqual(before["entries"], 1)
+
+        self._auth()
+        after = get_cache_stats(self.vk, "group_rules_cache")
+        self.assertEqual(after["hits"], before["hits"] + 1)
+
+    def test_flush_group_rules(self):
+        self._auth()
+
+        self.assertEqual(
+            self.vk.execute_command("LDAP.FLUSHGROUPRULES", self.USER1_DN), 1
+        )
+        self.assertEqual(self.vk.execute_command("LDAP.FLUSHGROUPRULES"), 0)
+        self.assertEqual(get_cache_stats(self.vk, "group_rules_cache")["entries"], 0)
+
+
+class DnCacheTest(CacheTestCase):
+    # The search settings are set by LdapTestCase
+    CONFIG = {"ldap.auth_mode": "search+bind", "ldap.dn_cache_ttl": "60"}
+    RESET_CONFIG = {"ldap.dn_cache_ttl": "0"}
+
+    def test_repeated_auth_hits_cache(self):
+        self._auth("u2", "user2@123")
+        before = get_cache_stats(self.vk, "dn_cache")
+        self.assertEqual(before["entries"], 1)
+
+        self._auth("u2", "user2@123")
+        after = get_cache_stats(self.vk, "dn_cache")
+        self.assertEqual(after["hits"], before["hits"] + 1)
+
+    def test_flush_single_user(self):
+        self._auth("u2", "user2@123")
+
+        self.assertEqual(self.vk.execute_command("LDAP.FLUSHCACHE", "u2"), 1)
+        self.assertEqual(get_cache_stats(self.vk, "dn_cache")["entries"], 0)
+
+
+class GroupIndexTest(CacheTestCase):
+    CONFIG = {"ldap.group_index_refresh_interval": "60"}
+    RESET_CONFIG = {"ldap.group_index_refresh_interval": "0"}
+
+    def _wait_for_index(self):
+        for _ in range(50):
+            stats = get_cache_stats(self.vk, "group_index")
+            if stats["members"] > 0:
+                return stats
+            time.sleep(0.1)
+        self.fail("the group index was not built")
+
+    def test_auth_uses_index(self):
+        stats = self._wait_for_index()
+        self.assertGreaterEqual(stats["groups"], 2)
+        self.assertIn("age_s", stats)
+        self.assertIn("last_refresh_ms", stats)
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user1", "user1@123")
+            self.assertTrue(client.execute_command("SET", "group_index_key", "1"))
+        finally:
+            client.close()
+
+    def test_flush_rebuilds_index(self):
+        self._wait_for_index()
+
+        self.assertGreater(self.vk.execute_command("LDAP.FLUSHGROUPRULES"), 0)
+        self._wait_for_index()
+
+
+class SyncListenerTest(CacheTestCase):
+    RESET_CONFIG = {"ldap.sync_listener_enabled": "no"}
+
+    def test_enable_sync_listener(self):
+        self.assertEqual(get_cache_stats(self.vk, "sync_listener")["enabled"], 0)
+
+        self.vk.execute_command("CONFIG", "SET", "ldap.sync_listener_enabled", "yes")
+        self.assertEqual(get_cache_stats(self.vk, "sync_listener")["enabled"], 1)
+
+        # Authentication works whether the server supports the content
+        # synchronization or not
+        self._auth()
@@ -72,6 +72,326 @@ class LdapModuleBindTest(LdapTestCase):
         with self.assertRaises((AuthenticationError, ResponseError)) as ctx:
             self.vk.execute_command("AUTH", "user1", "wrongpass")
 
+    def _get_server_requests(self):
+        result = self.vk.execute_command("INFO", "ldap_status")
+        status = parse_valkey_info_section(result.decode("utf-8"))
+        return {
+            server["host"]: int(server["requests"])
+            for key, server in status.items()
+            if key.startswith("server_")
+        }
+
+    def _get_bind_pool_sizes(self):
+        result = self.vk.execute_command("INFO", "ldap_status")
+        status = parse_valkey_info_section(result.decode("utf-8"))
+        return [
+            int(server["bind_pool_size"])
+            for key, server in status.items()
+            if key.startswith("server_")
+        ]
+
+    def test_elastic_connection_pool(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.connection_pool_size", "1")
+        self.vk.execute_command("CONFIG", "SET", "ldap.connection_pool_max_size", "4")
+        self.vk.execute_command(
+            "CONFIG", "SET", "ldap.connection_pool_growth_threshold_ms", "0"
+        )
+        self.vk.execute_command("CONFIG", "SET", "ldap.connection_pool_idle_timeout", "1")
+
+        errors = []
+
+        def auth_worker():
+            client = valkey.Valkey(host="localhost", port=6379, db=0)
+            try:
+                for _ in range(20):
+                    client.execute_command("AUTH", "user1", "user1@123")
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                client.close()
+
+        try:
+            workers = [Thread(target=auth_worker) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            self.assertEqual(errors, [])
+            for size in self._get_bind_pool_sizes():
+                self.assertLessEqual(size, 4)
+
+            # The connections above the minimum size are closed once idle
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                if self._get_bind_pool_sizes() == [1, 1]:
+                    break
+                time.sleep(1)
+            self.assertEqual(self._get_bind_pool_sizes(), [1, 1])
+        finally:
+            self.vk.execute_command("CONFIG", "SET", "ldap.connection_pool_size", "2")
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.connection_pool_max_size", "0"
+            )
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.connection_pool_growth_threshold_ms", "10"
+            )
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.connection_pool_idle_timeout", "60"
+            )
+
+    def test_ldap_round_robin_load_balancing(self):
+        self.vk.execute_command(
+            "CONFIG", "SET", "ldap.load_balancing_policy", "round_robin"
+        )
+        before = self._get_server_requests()
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            for _ in range(4):
+                client.execute_command("AUTH", "user1", "user1@123")
+        finally:
+            client.close()
+
+        after = self._get_server_requests()
+        for host in ["ldap", "ldap-2"]:
+            self.assertGreater(after[host], before[host])
+
+    def test_ldap_circuit_breaker_ignores_rejections(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.circuit_breaker_min_requests", "2")
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            for _ in range(10):
+                with self.assertRaises(AuthenticationError):
+                    client.execute_command("AUTH", "user1", "wrong-password")
+
+            result = self.vk.execute_command("INFO", "ldap_status")
+            status = parse_valkey_info_section(result.decode("utf-8"))
+            for key, server in status.items():
+                if key.startswith("server_"):
+                    self.assertEqual(server["circuit_breaker"], "closed")
+                    self.assertEqual(server["circuit_breaker_trips"], "0")
+        finally:
+            client.close()
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.circuit_breaker_min_requests", "20"
+            )
+
+    def test_ldap_auth_manual_acl_change_reset(self):
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            # The LDAP groups of u2 grant no channel
+            client.execute_command("AUTH", "u2", "user2@123")
+            with self.assertRaises(ResponseError):
+                client.execute_command("PUBLISH", "manual_grant", "msg")
+
+            self.vk.execute_command("ACL", "SETUSER", "u2", "&*")
+            self.assertEqual(client.execute_command("PUBLISH", "manual_grant", "msg"), 0)
+
+            # A grant made outside of the module is reset on the next login
+            # after flushing the cached entries of the user
+            self.vk.execute_command("LDAP.FLUSHCACHE", "u2")
+            client.execute_command("AUTH", "u2", "user2@123")
+            with self.assertRaises(ResponseError):
+                client.execute_command("PUBLISH", "manual_grant", "msg")
+
+            # The ACL user is created again if it was deleted
+            self.vk.execute_command("ACL", "DELUSER", "u2")
+            client.execute_command("AUTH", "u2", "user2@123")
+            resp = client.execute_command("ACL", "WHOAMI")
+            self.assertEqual(resp.decode(), "u2")
+        finally:
+            client.close()
+
+    def test_ldap_auth_without_search_bind_dn(self):
+        # The groups are searched while bound as the user
+        self.vk.execute_command("CONFIG", "SET", "ldap.search_bind_dn", "")
+        self.vk.execute_command("CONFIG", "SET", "ldap.search_bind_passwd", "")
+        self.vk.execute_command("LDAP.FLUSHGROUPRULES")
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user1", "user1@123")
+            self.assertTrue(client.execute_command("SET", "user_bound_key", "1"))
+        finally:
+            client.close()
+
+    def test_ldap_auth_paged_group_search(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.groups_search_page_size", "1")
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user1", "user1@123")
+            self.assertTrue(client.execute_command("SET", "paged_key", "1"))
+        finally:
+            client.close()
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.groups_search_page_size", "500"
+            )
+
+    def test_ldap_auth_nested_group_graph(self):
+        # user3 is a member of sre-team, which is a member of
+        # platform-department, the group that holds the rules
+        self.vk.execute_command("LDAP.FLUSHGROUPRULES")
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user3", "user3@123")
+            with self.assertRaises(ResponseError):
+                client.execute_command("SET", "nested_key", "1")
+
+            self.vk.execute_command("CONFIG", "SET", "ldap.groups_nesting", "graph")
+            self.vk.execute_command("LDAP.FLUSHCACHE", "user3")
+            self.vk.execute_command("LDAP.FLUSHGROUPRULES")
+            client.execute_command("AUTH", "user3", "user3@123")
+            self.assertTrue(client.execute_command("SET", "nested_key", "1"))
+        finally:
+            client.close()
+            self.vk.execute_command("CONFIG", "SET", "ldap.groups_nesting", "direct")
+            self.vk.execute_command("ACL", "DELUSER", "user3")
+
+    def _get_group_batch_stats(self):
+        result = self.vk.execute_command("INFO", "ldap_status")
+        status = parse_valkey_info_section(result.decode("utf-8"))
+        return {
+            key: int(value) for key, value in status["group_search_batching"].items()
+        }
+
+    def test_ldap_auth_batched_group_search(self):
+        self.vk.execute_command(
+            "CONFIG", "SET", "ldap.groups_search_batch_window_ms", "50"
+        )
+        before = self._get_group_batch_stats()
+
+        errors = []
+
+        def login(username, password, key):
+            client = valkey.Valkey(host="localhost", port=6379, db=0)
+            try:
+                client.execute_command("AUTH", username, password)
+                client.execute_command("SET", key, "1")
+            except Exception as err:
+                errors.append(err)
+            finally:
+                client.close()
+
+        threads = [
+            Thread(target=login, args=("user1", "user1@123", "batch_key1")),
+            Thread(target=login, args=("u2", "user2@123", "batch_key2")),
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            after = self._get_group_batch_stats()
+            self.assertGreater(after["batches"], before["batches"])
+            self.assertGreaterEqual(after["lookups"] - before["lookups"], 2)
+        finally:
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.groups_search_batch_window_ms", "0"
+            )
+
+    def test_ldap_auth_metrics(self):
+        self.vk.execute_command("LDAP.RESETSTATS")
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user1", "user1@123")
+            with self.assertRaises(AuthenticationError):
+                client.execute_command("AUTH", "user1", "wrong-password")
+        finally:
+            client.close()
+
+        result = self.vk.execute_command("INFO", "ldap_latency")
+        latency = parse_valkey_info_section(result.decode("utf-8"))
+        for phase in ["queue_wait", "user_bind", "group_rules_search", "acl_apply"]:
+            self.assertGreater(int(latency[phase]["count"]), 0)
+            self.assertIn("p99_ms", latency[phase])
+
+        result = self.vk.execute_command("INFO", "ldap_auth")
+        auth = parse_valkey_info_section(result.decode("utf-8"))
+        self.assertEqual(auth["outcomes"]["success"], "1")
+        self.assertEqual(auth["outcomes"]["rejected"], "1")
+        self.assertEqual(auth["in_flight"]["running"], "0")
+
+        self.vk.execute_command("LDAP.RESETSTATS")
+        result = self.vk.execute_command("INFO", "ldap_auth")
+        auth = parse_valkey_info_section(result.decode("utf-8"))
+        self.assertEqual(auth["outcomes"]["success"], "0")
+
+    def _get_slowlog(self):
+        entries = self.vk.execute_command("LDAP.SLOWLOG", "GET")
+        return [
+            {
+                entry[idx].decode(): entry[idx + 1]
+                for idx in range(0, len(entry), 2)
+            }
+            for entry in entries
+        ]
+
+    def test_ldap_slowlog(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.slowlog_threshold_ms", "0")
+        self.vk.execute_command("LDAP.SLOWLOG", "RESET")
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user1", "user1@123")
+            with self.assertRaises(AuthenticationError):
+                client.execute_command("AUTH", "user1", "wrong-password")
+
+            self.assertEqual(self.vk.execute_command("LDAP.SLOWLOG", "LEN"), 2)
+            rejected, success = self._get_slowlog()
+
+            self.assertEqual(success["username"].decode(), "user1")
+            self.assertEqual(success["result_code"], 0)
+            self.assertEqual(success["attempts"], 1)
+            self.assertIn(success["server"].decode(), ["ldap", "ldap-2"])
+            self.assertTrue(success["user_dn"].decode().lower().startswith("cn=user1"))
+            phases = [phase.decode() for phase in success["phases_us"][::2]]
+            self.assertIn("user_bind", phases)
+            self.assertEqual(success["sampled"], 0)
+
+            self.assertEqual(rejected["result_code"], 49)
+            self.assertGreater(rejected["id"], success["id"])
+
+            # Sampled authentications are logged whatever their duration
+            self.vk.execute_command("CONFIG", "SET", "ldap.slowlog_threshold_ms", "-1")
+            self.vk.execute_command("CONFIG", "SET", "ldap.slowlog_sample_rate", "1")
+            self.vk.execute_command("LDAP.SLOWLOG", "RESET")
+            client.execute_command("AUTH", "user1", "user1@123")
+            (sampled,) = self._get_slowlog()
+            self.assertEqual(sampled["sampled"], 1)
+        finally:
+            client.close()
+            self.vk.execute_command("CONFIG", "SET", "ldap.slowlog_threshold_ms", "100")
+            self.vk.execute_command("CONFIG", "SET", "ldap.slowlog_sample_rate", "0")
+            self.vk.execute_command("LDAP.SLOWLOG", "RESET")
+
+    def test_ldap_auth_member_of_attribute(self):
+        # The entry of user4 lists the oncall-readers group in seeAlso, but the
+        # group does not list user4 as a member
+        self.vk.execute_command("LDAP.FLUSHGROUPRULES")
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            client.execute_command("AUTH", "user4", "user4@123")
+            with self.assertRaises(ResponseError):
+                client.execute_command("SET", "member_of_key", "1")
+
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.groups_member_of_attribute", "seeAlso"
+            )
+            self.vk.execute_command("LDAP.FLUSHCACHE", "user4")
+            self.vk.execute_command("LDAP.FLUSHGROUPRULES")
+            client.execute_command("AUTH", "user4", "user4@123")
+            self.assertTrue(client.execute_command("SET", "member_of_key", "1"))
+        finally:
+            client.close()
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.groups_member_of_attribute", ""
+            )
+            self.vk.execute_command("ACL", "DELUSER", "user4")
+
     def test_ldap_ssl_auth(self):
         self.vk.execute_command("CONFIG", "SET", "ldap.servers", "ldaps://ldap")
         self.vk.execute_command("AUTH", "user1", "user1@123")
@@ -118,6 +438,91 @@ class LdapModuleBindAndSearchTest(LdapTestCase):
         resp = self.vk.execute_command("ACL", "WHOAMI")
         self.assertTrue(resp.decode() == "u2")
 
+    def test_ldap_auth_multiplexed_searches(self):
+        self.vk.execute_command(
+            "CONFIG", "SET", "ldap.search_connection_multiplexing", "yes"
+        )
+
+        errors = []
+
+        def auth_worker():
+            client = valkey.Valkey(host="localhost", port=6379, db=0)
+            try:
+                for _ in range(10):
+                    client.execute_command("AUTH", "u2", "user2@123")
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                client.close()
+
+        try:
+            workers = [Thread(target=auth_worker) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            self.assertEqual(errors, [])
+
+            result = self.vk.execute_command("INFO", "ldap_status")
+            status = parse_valkey_info_section(result.decode("utf-8"))
+            for key, server in status.items():
+                if key.startswith("server_"):
+                    self.assertEqual(server["search_pool_size"], "2")
+        finally:
+            self.vk.execute_command(
+                "CONFIG", "SET", "ldap.search_connection_multiplexing", "no"
+            )
+
+    def _hedging_stats(self):
+        result = self.vk.execute_command("INFO", "ldap_status")
+        status = parse_valkey_info_section(result.decode("utf-8"))
+        return status["search_hedging"]
+
+    def test_ldap_auth_hedged_searches(self):
+        self.vk.execute_command("CONFIG", "SET", "ldap.hedged_searches", "yes")
+        self.vk.execute_command("CONFIG", "SET", "ldap.hedge_min_delay_ms", "0")
+
+        client = valkey.Valkey(host="localhost", port=6379, db=0)
+        try:
+            # collect the search latency samples of the servers
+            for _ in range(50):
+                client.execute_command("AUTH", "u2", "user2@123")
+                resp = client.execute_command("ACL", "WHOAMI")
+                self.assertEqual(resp.decode(), "u2")
+
+            self.assertGreater(int(self._hedging_stats()["searches"]), 0)
+
+            # A paused server only answers the search when it is unpaused, so
+            # the search is hedged to the other server
+            errors = []
+
+            def auth_worker():
+                try:
+                    client.execute_command("AUTH", "u2", "user2@123")
+                except Exception as ex:
+                    errors.append(ex)
+
+            for attempt in range(10):
+                name = "ldap" if attempt % 2 == 0 else "ldap-2"
+                service = DOCKER_SERVICES.pause_service(name)
+                worker = Thread(target=auth_worker)
+                worker.start()
+                time.sleep(0.5)
+                DOCKER_SERVICES.unpause_service(service)
+                worker.join()
+                if int(self._hedging_stats()["hedged"]) > 0:
+                    break
+
+            self.assertEqual(errors, [])
+            hedging = self._hedging_stats()
+            self.assertGreater(int(hedging["hedged"]), 0)
+            self.assertLessEqual(int(hedging["hedge_wins"]), int(hedging["hedged"]))
+        finally:
+            client.close()
+            self.vk.execute_command("CONFIG", "SET", "ldap.hedged_searches", "no")
+            self.vk.execute_command("CONFIG", "SET", "ldap.hedge_min_delay_ms", "10")
+
     def test_ldap_ssl_auth(self):
         self.vk.execute_command("CONFIG", "SET", "ldap.servers", "ldaps://ldap")
         self.vk.execute_command("AUTH", "u2", "user2@123")
@@ -160,7 +565,9 @@ class LdapModuleFailoverTest(LdapTestCase):
             result = self.vk.execute_command("INFO LDAP")
             status = parse_valkey_info_section(result.decode("utf-8"))
 
-            for server in status.values():
+            for key, server in status.items():
+                if not key.startswith("server_"):
+                    continue
                 if server["host"] == server_name:
                     if server["status"] == status_desc:
                         return
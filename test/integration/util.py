@@ -28,6 +28,16 @@ class DockerServices:
     def restart_service(self, serv):
         serv.restart()
 
+    def pause_service(self, name: str):
+        ct = self._find_container(name)
+        if ct is None:
+            return None
+        ct.pause()
+        return ct
+
+    def unpause_service(self, serv):
+        serv.unpause()
+
 
 DOCKER_SERVICES = DockerServices()
 